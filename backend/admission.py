@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import NamedTuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+import metrics
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Budgets for the extractions running at once; a document starts once its estimated cost fits
+# Estimated seconds of single-worker extraction work
+ADMISSION_CPU_BUDGET = float(os.getenv("ADMISSION_CPU_BUDGET", "120"))
+# Estimated peak bytes of memory, about half of the 2 GB container
+ADMISSION_MEMORY_BUDGET = int(os.getenv("ADMISSION_MEMORY_BUDGET", 1024 * 1024 * 1024))
+# Pages needing OCR
+ADMISSION_OCR_BUDGET = int(os.getenv("ADMISSION_OCR_BUDGET", "500"))
+# Documents estimated below this many seconds of work skip the budgets, so small requests never queue
+ADMISSION_SMALL_SECONDS = float(os.getenv("ADMISSION_SMALL_SECONDS", "1"))
+# Requests allowed to wait for budget before new ones are rejected with 429
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "20"))
+# Seconds a request waits for budget before it is rejected with 429
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+# Seconds the oldest waiter may be passed by documents that fit before it before admissions stop for it
+ADMISSION_MAX_BYPASS = float(os.getenv("ADMISSION_MAX_BYPASS", "10"))
+
+# Cost model, calibrated with benchmarks/extraction.py
+# Seconds to extract a page from its text layer / to render and OCR a page
+TEXT_PAGE_SECONDS = float(os.getenv("ADMISSION_TEXT_PAGE_SECONDS", "0.01"))
+OCR_PAGE_SECONDS = float(os.getenv("ADMISSION_OCR_PAGE_SECONDS", "0.2"))
+# Bytes held per extracted page (result, cache entry, response) and per rendered image waiting for OCR
+PAGE_BYTES = int(os.getenv("ADMISSION_PAGE_BYTES", 64 * 1024))
+OCR_IMAGE_BYTES = int(os.getenv("ADMISSION_OCR_IMAGE_BYTES", 512 * 1024))
+
+
+class Cost(NamedTuple):
+    """
+    Estimated resources of one extraction
+    """
+    seconds: float
+    memory: int
+    ocr_pages: int
+
+    def clamp(self) -> "Cost":
+        # A document larger than a budget still gets to run, alone
+        return Cost(
+            min(self.seconds, ADMISSION_CPU_BUDGET),
+            min(self.memory, ADMISSION_MEMORY_BUDGET),
+            min(self.ocr_pages, ADMISSION_OCR_BUDGET)
+        )
+
+
+def estimate(size: int, pages: int, ocr_pages: int, images_in_flight: int) -> Cost:
+    """
+    Estimate the cost of extracting a document
+
+    Args:
+        size: PDF size in bytes, each process opening it parses its structure
+        pages: Pages to extract
+        ocr_pages: How many of them need OCR
+        images_in_flight: Most rendered images held at once, see pdfextractor.OCR_LOOKAHEAD
+    """
+    return Cost(
+        seconds=(pages - ocr_pages) * TEXT_PAGE_SECONDS + ocr_pages * OCR_PAGE_SECONDS,
+        memory=size + pages * PAGE_BYTES + min(ocr_pages, images_in_flight) * OCR_IMAGE_BYTES,
+        ocr_pages=ocr_pages
+    )
+
+
+class Ticket:
+    """
+    Budget held by an admitted extraction; release() it once the work is done, from any thread
+    """
+
+    def __init__(self, controller: "AdmissionController", cost: Cost):
+        self.controller = controller
+        self.cost = cost
+        self._released = False
+
+    def release(self) -> None:
+        with self.controller._lock:
+            if self._released:
+                return
+            self._released = True
+        self.controller._release(self.cost)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class _Waiter:
+    __slots__ = ("cost", "future", "loop", "since")
+
+    def __init__(self, cost: Cost, loop: asyncio.AbstractEventLoop):
+        self.cost = cost
+        self.future = loop.create_future()
+        self.loop = loop
+        self.since = time.monotonic()
+
+
+class AdmissionController:
+    """
+    Admits extractions against CPU, memory and OCR budgets so a few huge
+    documents cannot exhaust the container
+
+    Documents below ADMISSION_SMALL_SECONDS of estimated work are admitted
+    straight away. Larger ones start when their cost fits in what is left of
+    every budget; otherwise they wait in line. A waiting document that fits
+    may start ahead of older ones that do not, until the oldest has waited
+    ADMISSION_MAX_BYPASS seconds. Requests are rejected with 429 and a
+    Retry-After estimate when the line is full or they wait too long.
+    """
+
+    def __init__(self, cpu_budget: float = ADMISSION_CPU_BUDGET, memory_budget: int = ADMISSION_MEMORY_BUDGET,
+                 ocr_budget: int = ADMISSION_OCR_BUDGET, queue_size: int = ADMISSION_QUEUE_SIZE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT, workers: int = os.cpu_count() or 1):
+        self.budget = Cost(cpu_budget, memory_budget, ocr_budget)
+        self.workers = workers
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_use = Cost(0.0, 0, 0)
+        self.running = 0
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+
+    def _fits(self, cost: Cost) -> bool:
+        return all(used + needed <= limit for used, needed, limit in zip(self.in_use, cost, self.budget))
+
+    def _take(self, cost: Cost) -> None:
+        self.in_use = Cost(*(used + needed for used, needed in zip(self.in_use, cost)))
+        self.running += 1
+
+    def _release(self, cost: Cost) -> None:
+        with self._lock:
+            self.in_use = Cost(*(max(0, used - freed) for used, freed in zip(self.in_use, cost)))
+            self.running -= 1
+            self._wake()
+
+    def _wake(self) -> None:
+        """
+        Admit waiters that fit now, oldest first; called with the lock held
+        """
+        now = time.monotonic()
+        for waiter in list(self._waiters):
+            if waiter.future.done():
+                self._waiters.remove(waiter)
+                continue
+            if self._fits(waiter.cost):
+                self._waiters.remove(waiter)
+                self._take(waiter.cost)
+                waiter.loop.call_soon_threadsafe(_admit_waiter, waiter)
+            elif now - waiter.since > ADMISSION_MAX_BYPASS:
+                # Hold the budget for the oldest waiter until it fits
+                return
+
+    def retry_after(self) -> int:
+        """
+        Seconds until the queued and running work is expected to be done, at least 1
+        """
+        queued = sum(waiter.cost.seconds for waiter in self._waiters)
+        return max(1, math.ceil((self.in_use.seconds + queued) / self.workers))
+
+    def _reject(self, reason: str) -> HTTPException:
+        metrics.registry.inc("admission_requests_total", result="rejected")
+        retry_after = self.retry_after()
+        logger.info("Rejecting extraction, %s; retry after %ds", reason, retry_after)
+        return HTTPException(
+            status_code=429,
+            detail=f"Server is busy with large documents ({reason}), try again later",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+    async def admit(self, cost: Cost, queue: bool = True) -> Ticket:
+        """
+        Wait until cost fits in the budgets and take it
+
+        Args:
+            queue: False waits as long as it takes and ignores the queue size,
+                for background jobs that have already been accepted
+
+        Raises:
+            HTTPException: 429 with Retry-After when the queue is full or the wait times out
+        """
+        cost = cost.clamp()
+        ticket = Ticket(self, cost)
+        if cost.seconds <= ADMISSION_SMALL_SECONDS:
+            with self._lock:
+                self._take(cost)
+            metrics.registry.inc("admission_requests_total", result="small")
+            return ticket
+
+        with self._lock:
+            if not self._waiters and self._fits(cost):
+                self._take(cost)
+                metrics.registry.inc("admission_requests_total", result="admitted")
+                return ticket
+            if queue and len(self._waiters) >= self.queue_size:
+                raise self._reject("queue full")
+            waiter = _Waiter(cost, asyncio.get_running_loop())
+            self._waiters.append(waiter)
+            # It may fit ahead of older waiters
+            self._wake()
+
+        timeout = self.queue_timeout if queue else None
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                return ticket
+            raise self._reject("waited too long")
+        except asyncio.CancelledError:
+            if not self._abandon(waiter):
+                ticket.release()
+            raise
+        finally:
+            metrics.registry.observe("admission_wait_seconds", time.monotonic() - start)
+        metrics.registry.inc("admission_requests_total", result="queued")
+        return ticket
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """
+        Take a waiter out of the line; False if it was admitted in the meantime and now holds budget
+        """
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                waiter.future.cancel()
+                self._wake()
+                return True
+            return False
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": self.running,
+                "queued": len(self._waiters),
+                "cpu_seconds": self.in_use.seconds,
+                "memory_bytes": self.in_use.memory,
+                "ocr_pages": self.in_use.ocr_pages
+            }
+
+
+def _admit_waiter(waiter: _Waiter) -> None:
+    if not waiter.future.done():
+        waiter.future.set_result(None)
+
+
+metrics.registry.describe("admission_requests_total", "Extractions by how they were admitted: small, admitted, queued or rejected")
+metrics.registry.describe("admission_wait_seconds", "Time extractions waited for budget")
+
+admission = AdmissionController()
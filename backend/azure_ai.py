@@ -1,119 +1,231 @@
+import asyncio
+import logging
 import os
+import threading
+import time
 from io import BytesIO
-from typing import Optional
+from typing import Dict, List, Optional
 
+import httpx
+import numpy as np
 from azure.ai.documentintelligence import DocumentIntelligenceClient
 from azure.ai.documentintelligence.models import (AnalyzeDocumentRequest,
                                                   AnalyzeResult)
 from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import (HttpResponseError, ServiceRequestError,
+                                   ServiceResponseError)
 from dotenv import load_dotenv
 
+import http_client
+from cache import MemoryLRU
+
 load_dotenv()
 
-client = DocumentIntelligenceClient(
-    endpoint=os.getenv("AZURE_ENDPOINT"),
-    credential=AzureKeyCredential(os.getenv("AZURE_KEY"))
-)
+logger = logging.getLogger(__name__)
 
-class AzurePDFExtractor:
-    def __init__(self, file_url):
-        self.file_url = file_url
-        self.file = None
-        self.has_init = False
+# REST API version used for document analyses
+AZURE_API_VERSION = os.getenv("AZURE_API_VERSION", "2024-11-30")
+# Seconds an analysis of a URL is reused before the document is analyzed again
+AZURE_ANALYSIS_TTL = int(os.getenv("AZURE_ANALYSIS_TTL", "3600"))
+# Memory for cached analyses, measured by the size of their JSON
+AZURE_ANALYSIS_CACHE_BYTES = int(os.getenv("AZURE_ANALYSIS_CACHE_BYTES", 64 * 1024 * 1024))
+# Seconds to wait for an analysis to finish
+AZURE_ANALYSIS_TIMEOUT = float(os.getenv("AZURE_ANALYSIS_TIMEOUT", "300"))
+# Seconds between status polls when the service does not send Retry-After
+AZURE_POLL_INTERVAL = float(os.getenv("AZURE_POLL_INTERVAL", "1"))
+
+_client: Optional[DocumentIntelligenceClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> DocumentIntelligenceClient:
+    """
+    Return the Document Intelligence client, creating it on first use
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = DocumentIntelligenceClient(
+                endpoint=os.getenv("AZURE_ENDPOINT"),
+                credential=AzureKeyCredential(os.getenv("AZURE_KEY"))
+            )
+        return _client
+
+
+# HTTP statuses worth retrying with backoff
+TRANSIENT_STATUSES = (429, 500, 502, 503, 504)
+
+
+class AzureTransientError(Exception):
+    """
+    An analysis that failed with a status in TRANSIENT_STATUSES
+    """
+
+
+class AzureAnalysisError(Exception):
+    """
+    An analysis the service rejected or could not complete
+    """
+
+
+# Errors that are worth retrying with backoff
+TRANSIENT_ERRORS = (AzureTransientError, ServiceRequestError, ServiceResponseError)
+
+
+def read_image(image: bytes) -> tuple:
+    """
+    OCR one image with the prebuilt-read model
 
-    def set_file(self) -> None:
-        poller = client.begin_analyze_document(
-            "prebuilt-read",
-            AnalyzeDocumentRequest(url_source=self.file_url)
-        )
+    Returns:
+        (text, words, boxes) with the full text, the word texts and an (n, 4)
+        array of [x0, y0, x1, y1] word boxes in image pixels
+
+    Raises:
+        AzureTransientError: For throttling and server errors
+    """
+    try:
+        poller = get_client().begin_analyze_document("prebuilt-read", AnalyzeDocumentRequest(bytes_source=image))
         result: AnalyzeResult = poller.result()
+    except HttpResponseError as e:
+        if e.status_code in TRANSIENT_STATUSES:
+            raise AzureTransientError(str(e)) from e
+        raise
+
+    words, boxes = [], []
+    for page in result.pages or []:
+        for word in page.words or []:
+            if word.polygon and len(word.polygon) >= 8:
+                xs, ys = word.polygon[0::2], word.polygon[1::2]
+                words.append(word.content)
+                boxes.append([min(xs), min(ys), max(xs), max(ys)])
+    return result.content or "", words, np.array(boxes, dtype=float).reshape(-1, 4)
+
+
+def read_images(images: List[bytes]) -> list:
+    """
+    OCR several images, one analysis each
 
-        self.file = result
-        self.has_init = True
+    Returns:
+        For each image, the read_image result or the exception it failed with
+    """
+    results = []
+    for image in images:
+        try:
+            results.append(read_image(image))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+class AzureAnalysis:
+    """
+    One prebuilt-read analysis of a document, indexed by page
+
+    Pages are looked up by their 0-based number, and the paragraphs and
+    blocks of a page are built the first time it is asked for.
+    """
 
-    def get_text_with_bboxes(self, page_num: Optional[int] = None) -> dict:
+    def __init__(self, result: AnalyzeResult):
+        self.result = result
+        self.pages = {page.page_number - 1: page for page in result.pages or []}
+        self._blocks: Dict[int, dict] = {}
+
+    @property
+    def page_count(self) -> int:
+        return len(self.pages)
+
+    def page_text(self, page_num: int) -> str:
         """
-        Extract text and bounding boxes from a PDF using Azure Document Intelligence API.
+        The lines of a page in reading order, joined by spaces; empty for pages the analysis does not have
+        """
+        page = self.pages.get(page_num)
+        if page is None:
+            return ""
+        return " ".join(line.content for line in page.lines or []).strip()
 
-        Args:
-            pdf_buffer: BytesIO buffer containing the PDF
-            page_num: Optional page number (0-based) to extract from. If None, processes entire document.
+    def page_blocks(self, page_num: int) -> dict:
+        """
+        Paragraph text and line blocks of a page
 
         Returns:
             Dictionary containing text content and bounding box information
         """
+        result = self._blocks.get(page_num)
+        if result is None:
+            result = self._blocks[page_num] = self._build_page(page_num)
+        return result
 
-        print(len(self.file.pages))
+    def _build_page(self, page_num: int) -> dict:
+        page = self.pages.get(page_num)
+        if page is None:
+            return {"text": "", "blocks": []}
 
         blocks = []
         text = ""
-
-        if page_num is not None:
-            page = self.file.pages[page_num]
-            current_paragraph = []
-            last_y = None
-            last_x = None
-
-            for line in page.lines:
-                current_y = line.polygon[1]  # Get y-coordinate of current line
-                current_x = line.polygon[0]  # Get x-coordinate of current line
-                
-                # Check if this is potentially a new paragraph by looking at:
-                # 1. Significant vertical gap
-                # 2. Indentation at the start of a line
-                # 3. Previous line ends with sentence-ending punctuation
-                is_new_paragraph = False
-                
-                if last_y is not None:
-                    vertical_gap = current_y - last_y
-                    # Check for larger vertical gap indicating paragraph break
-                    if vertical_gap > 0.3:  # Adjusted threshold for paragraph separation
+        current_paragraph = []
+        last_y = None
+        last_x = None
+
+        for line in page.lines or []:
+            current_y = line.polygon[1]  # Get y-coordinate of current line
+            current_x = line.polygon[0]  # Get x-coordinate of current line
+
+            # Check if this is potentially a new paragraph by looking at:
+            # 1. Significant vertical gap
+            # 2. Indentation at the start of a line
+            # 3. Previous line ends with sentence-ending punctuation
+            is_new_paragraph = False
+
+            if last_y is not None:
+                vertical_gap = current_y - last_y
+                # Check for larger vertical gap indicating paragraph break
+                if vertical_gap > 0.3:  # Adjusted threshold for paragraph separation
+                    is_new_paragraph = True
+                # Check for indentation
+                elif last_x is not None and current_x - last_x > 0.3:
+                    is_new_paragraph = True
+                # Check if last line ended with sentence-ending punctuation
+                elif current_paragraph and any(current_paragraph[-1].content.strip().endswith(p)
+                                               for p in ['.', '!', '?']):
+                    # Only consider it a paragraph break if we're not in the middle of a sentence
+                    next_word = line.content.strip()
+                    if next_word and next_word[0].isupper():
                         is_new_paragraph = True
-                    # Check for indentation
-                    elif last_x is not None and current_x - last_x > 0.3:
-                        is_new_paragraph = True
-                    # Check if last line ended with sentence-ending punctuation
-                    elif current_paragraph and any(current_paragraph[-1].content.strip().endswith(p) 
-                                                for p in ['.', '!', '?']):
-                        # Only consider it a paragraph break if we're not in the middle of a sentence
-                        next_word = line.content.strip()
-                        if next_word and next_word[0].isupper():
-                            is_new_paragraph = True
-
-                if is_new_paragraph and current_paragraph:
-                    # Join current paragraph with single spaces and add double newline
-                    text += " ".join(l.content.strip() for l in current_paragraph) + "\n\n"
-                    current_paragraph = []
-
-                current_paragraph.append(line)
-                last_y = current_y
-                last_x = current_x
-
-                # Add bounding box information
-                polygon = line.polygon
-                if polygon and len(polygon) >= 8:
-                    x_coords = [polygon[i] for i in range(0, len(polygon), 2)]
-                    y_coords = [polygon[i] for i in range(1, len(polygon), 2)]
-
-                    bbox = [
-                        min(x_coords),  # x0
-                        min(y_coords),  # y0
-                        max(x_coords),  # x1
-                        max(y_coords)   # y1
-                    ]
-
-                    blocks.append({
-                        "text": line.content,
-                        "page": page_num,
-                        "bbox": bbox,
-                        "width": page.width,
-                        "height": page.height,
-                        "method": "azure"
-                    })
-
-            # Add the last paragraph if it exists
-            if current_paragraph:
-                text += " ".join(l.content.strip() for l in current_paragraph)
+
+            if is_new_paragraph and current_paragraph:
+                # Join current paragraph with single spaces and add double newline
+                text += " ".join(l.content.strip() for l in current_paragraph) + "\n\n"
+                current_paragraph = []
+
+            current_paragraph.append(line)
+            last_y = current_y
+            last_x = current_x
+
+            # Add bounding box information
+            polygon = line.polygon
+            if polygon and len(polygon) >= 8:
+                x_coords = [polygon[i] for i in range(0, len(polygon), 2)]
+                y_coords = [polygon[i] for i in range(1, len(polygon), 2)]
+
+                bbox = [
+                    min(x_coords),  # x0
+                    min(y_coords),  # y0
+                    max(x_coords),  # x1
+                    max(y_coords)   # y1
+                ]
+
+                blocks.append({
+                    "text": line.content,
+                    "page": page_num,
+                    "bbox": bbox,
+                    "width": page.width,
+                    "height": page.height,
+                    "method": "azure"
+                })
+
+        # Add the last paragraph if it exists
+        if current_paragraph:
+            text += " ".join(l.content.strip() for l in current_paragraph)
 
         return {
             "text": text.strip(),
@@ -121,11 +233,117 @@ class AzurePDFExtractor:
         }
 
 
+# url -> (expiry, AzureAnalysis)
+_analyses = MemoryLRU(AZURE_ANALYSIS_CACHE_BYTES)
+_inflight: Dict[str, asyncio.Future] = {}
+
 
+def _check_response(response: httpx.Response) -> None:
+    if response.status_code in TRANSIENT_STATUSES:
+        raise AzureTransientError(f"Document Intelligence returned {response.status_code}")
+    if response.is_error:
+        raise AzureAnalysisError(f"Document Intelligence returned {response.status_code}: {response.text[:200]}")
 
 
+def _retry_after(response: httpx.Response) -> float:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return AZURE_POLL_INTERVAL
 
-def get_text_from_pdf(url: str, page_num: Optional[int] = None) -> str:
+
+async def _analyze(url: str) -> AzureAnalysis:
+    """
+    Run prebuilt-read on a document URL, awaiting the long-running operation without blocking the event loop
+    """
+    client = http_client.get_client()
+    headers = {"Ocp-Apim-Subscription-Key": os.getenv("AZURE_KEY") or ""}
+    response = await client.post(
+        f"{os.getenv('AZURE_ENDPOINT', '').rstrip('/')}/documentintelligence/documentModels/prebuilt-read:analyze",
+        params={"api-version": AZURE_API_VERSION},
+        json={"urlSource": url},
+        headers=headers
+    )
+    _check_response(response)
+    operation = response.headers["Operation-Location"]
+
+    deadline = time.monotonic() + AZURE_ANALYSIS_TIMEOUT
+    while True:
+        await asyncio.sleep(_retry_after(response))
+        response = await client.get(operation, headers=headers)
+        _check_response(response)
+        body = response.json()
+        status = body.get("status")
+        if status == "succeeded":
+            break
+        if status == "failed":
+            raise AzureAnalysisError(body.get("error", {}).get("message", "Analysis failed"))
+        if time.monotonic() > deadline:
+            raise AzureTransientError(f"Analysis still {status} after {AZURE_ANALYSIS_TIMEOUT:g}s")
+
+    analysis = AzureAnalysis(AnalyzeResult(body["analyzeResult"]))
+    _analyses.put(url, (time.monotonic() + AZURE_ANALYSIS_TTL, analysis), len(response.content))
+    logger.info("Azure analysis of %s has %d pages", url, analysis.page_count)
+    return analysis
+
+
+async def analyze_document(url: str) -> AzureAnalysis:
+    """
+    The prebuilt-read analysis of a document, shared by every caller
+
+    An analysis is reused for AZURE_ANALYSIS_TTL seconds, and callers asking
+    for a URL that is being analyzed wait for that analysis instead of starting another.
+
+    Raises:
+        AzureTransientError: For throttling, server errors and timeouts
+        AzureAnalysisError: When the service rejects the document
+    """
+    cached = _analyses.get(url)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+
+    task = _inflight.get(url)
+    if task is None:
+        task = _inflight[url] = asyncio.ensure_future(_analyze(url))
+        task.add_done_callback(lambda _: _inflight.pop(url, None))
+    # One caller going away must not cancel the analysis the others wait for
+    return await asyncio.shield(task)
+
+
+class AzurePDFExtractor:
+    def __init__(self, file_url):
+        self.file_url = file_url
+        self.file: Optional[AzureAnalysis] = None
+        self.has_init = False
+
+    async def set_file(self) -> None:
+        self.file = await analyze_document(self.file_url)
+        self.has_init = True
+
+    async def get_text_with_bboxes(self, page_num: Optional[int] = None) -> dict:
+        """
+        Extract text and bounding boxes from a PDF using Azure Document Intelligence API.
+
+        Args:
+            page_num: Optional page number (0-based) to extract from. If None, processes entire document.
+
+        Returns:
+            Dictionary containing text content and bounding box information
+        """
+        if self.file is None:
+            await self.set_file()
+
+        if page_num is not None:
+            return self.file.page_blocks(page_num)
+
+        pages = [self.file.page_blocks(number) for number in sorted(self.file.pages)]
+        return {
+            "text": "\n\n".join(page["text"] for page in pages if page["text"]),
+            "blocks": [block for page in pages for block in page["blocks"]]
+        }
+
+
+async def get_text_from_pdf(url: str, page_num: Optional[int] = None) -> str:
     """
     Extract text from a PDF using Azure Document Intelligence API.
     Can extract from a specific page or the entire document.
@@ -137,33 +355,14 @@ def get_text_from_pdf(url: str, page_num: Optional[int] = None) -> str:
     Returns:
         Extracted text as string
     """
-    poller = client.begin_analyze_document(
-        "prebuilt-read",
-        AnalyzeDocumentRequest(url_source=url)
-    )
-    result: AnalyzeResult = poller.result()
-
+    analysis = await analyze_document(url)
     if page_num is None:
         # Return text from entire document
-        return result.content
-
-    # Extract text from specific page
-    page_text = ""
-
-    # Azure's pages are 1-based, but we receive 0-based page numbers
-    target_page = page_num + 1
-
-    for page in result.pages:
-        if page.pageNumber == target_page:
-            # Process lines in reading order
-            for line in page.lines:
-                page_text += line.content + " "
-            break
-
-    return page_text.strip()
+        return analysis.result.content
+    return analysis.page_text(page_num)
 
 
-def get_page_count(url: str) -> int:
+async def get_page_count(url: str) -> int:
     """
     Get the total number of pages in a PDF document
 
@@ -173,11 +372,4 @@ def get_page_count(url: str) -> int:
     Returns:
         Total number of pages
     """
-    poller = client.begin_analyze_document(
-        "prebuilt-read",
-        AnalyzeDocumentRequest(url_source=url)
-    )
-    result: AnalyzeResult = poller.result()
-    return len(result.pages)
-
-
+    return (await analyze_document(url)).page_count
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import os
+import time
+from typing import AsyncIterator, List, NamedTuple, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+import metrics
+from pdfextractor import PageSelection, PDFExtractor
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Most documents accepted in one batch request
+BATCH_MAX_DOCUMENTS = int(os.getenv("BATCH_MAX_DOCUMENTS", "200"))
+# Documents of one batch extracted at the same time
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+
+class BatchDocument(NamedTuple):
+    """
+    One document of a batch, with the same page selection parameters as /extract
+    """
+    url: str
+    pages: Optional[str] = None
+    cursor: Optional[int] = None
+    count: Optional[int] = None
+
+
+async def _extract_one(extractor: PDFExtractor, index: int, document: BatchDocument) -> dict:
+    """
+    Extract one document into its result record; failures become an error record instead of raising
+    """
+    start = time.perf_counter()
+    try:
+        selection = PageSelection.parse(document.pages, document.cursor, document.count)
+        result = await extractor.extract(document.url, selection)
+    except HTTPException as e:
+        metrics.registry.inc("batch_documents_total", result="failed")
+        return {
+            "type": "error",
+            "index": index,
+            "url": document.url,
+            "status_code": e.status_code,
+            "detail": e.detail
+        }
+    except Exception as e:
+        logger.exception("Batch extraction of %s failed", document.url)
+        metrics.registry.inc("batch_documents_total", result="failed")
+        return {
+            "type": "error",
+            "index": index,
+            "url": document.url,
+            "status_code": 500,
+            "detail": f"Internal server error while processing PDF: {str(e)}"
+        }
+
+    metrics.registry.inc("batch_documents_total", result="done")
+    return {
+        "type": "document",
+        "index": index,
+        "url": document.url,
+        "seconds": round(time.perf_counter() - start, 3),
+        "text": result["text"],
+        "blocks": result["blocks"]
+    }
+
+
+async def extract_batch(documents: List[BatchDocument], concurrency: int = BATCH_CONCURRENCY
+                        ) -> AsyncIterator[dict]:
+    """
+    Extract several documents together, yielding each one's record as soon as it is done
+
+    Up to concurrency documents are in flight at once, started in request
+    order. They go through PDFExtractor.extract, so they share the pooled
+    download client, the extraction cache, the worker pool and the OCR
+    dispatcher with every other request. Each document keeps only a window
+    of page ranges queued on the pool and its OCR jobs are batched with
+    everyone else's, so a long document does not hold up the short ones.
+    Documents wait for admission instead of being rejected, like background jobs.
+
+    Yields:
+        {"type": "document", "index", "url", "seconds", "text", "blocks"}
+        or, for a document that failed, {"type": "error", "index", "url",
+        "status_code", "detail"}; index is the document's position in the request
+    """
+    extractor = PDFExtractor(background=True)
+    queue = iter(enumerate(documents))
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def worker() -> None:
+        # Workers take the next document from the shared iterator, so documents start in order
+        for index, document in queue:
+            results.put_nowait(await _extract_one(extractor, index, document))
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, min(concurrency, len(documents))))]
+    try:
+        for _ in documents:
+            yield await results.get()
+    finally:
+        # The client went away or the batch is done; stop whatever is still running
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+metrics.registry.describe("batch_documents_total", "Documents extracted through /extract-batch, done or failed")
@@ -0,0 +1,103 @@
+"""
+Batch extraction benchmark: one /extract-batch request against one /extract
+call per document, the way an ingestion job walks a course folder.
+
+The folder (benchmarks/corpus.py FOLDER, a dozen short lectures, a third of
+them with scanned pages) is served from a local HTTP server and OCR goes to
+the fake Vision server from benchmarks/fake_vision.py with a configurable
+latency. Each mode runs against a freshly started uvicorn with the caches
+disabled, and reports:
+
+- total seconds and pages/sec for the whole folder
+- seconds until the first document's result arrived
+- the speedup of the batch over the sequential calls
+
+The extracted text of every document is compared between the two modes.
+Run from the backend directory:
+
+    python -m benchmarks.batch --latency 0.3
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import urllib.request
+
+import fitz
+
+from benchmarks import corpus, fake_vision, startup
+
+
+def run_sequential(base: str, urls: list) -> dict:
+    start = time.perf_counter()
+    texts, first = [], None
+    for url in urls:
+        # A new connection per call, as a client looping over /extract would open
+        with urllib.request.urlopen(f"{base}/extract/{url}", timeout=600) as response:
+            texts.append(json.loads(response.read())["text"])
+        first = first or time.perf_counter() - start
+    return {"seconds": time.perf_counter() - start, "first_seconds": first, "texts": texts, "failed": 0}
+
+
+def run_batch(base: str, urls: list) -> dict:
+    start = time.perf_counter()
+    texts, first, failed = [None] * len(urls), None, 0
+    request = urllib.request.Request(
+        f"{base}/extract-batch", data=json.dumps({"documents": [{"url": url} for url in urls]}).encode(),
+        headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request, timeout=600) as response:
+        for line in response:
+            record = json.loads(line)
+            if record["type"] == "document":
+                texts[record["index"]] = record["text"]
+                first = first or time.perf_counter() - start
+            elif record["type"] == "error":
+                failed += 1
+    return {"seconds": time.perf_counter() - start, "first_seconds": first, "texts": texts, "failed": failed}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus-dir", default=os.path.join(tempfile.gettempdir(), "pdf-benchmark-corpus"))
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds the fake Vision API takes per request")
+    parser.add_argument("--workers", type=int, default=2, help="EXTRACT_WORKERS of the server")
+    parser.add_argument("--concurrency", type=int, default=4, help="BATCH_CONCURRENCY of the server")
+    args = parser.parse_args()
+
+    paths = corpus.build(args.corpus_dir, list(corpus.FOLDER))
+    pages = 0
+    for path in paths.values():
+        with fitz.open(path) as doc:
+            pages += len(doc)
+
+    server = corpus.serve_directory(args.corpus_dir)
+    vision = fake_vision.serve(latency=args.latency)
+    env = dict(
+        os.environ, CACHE_DIR="", CACHE_MEMORY_BYTES="0", OCR_CACHE_DIR="", OCR_CACHE_MEMORY_BYTES="0",
+        GOOGLE_API_KEY=os.environ.get("GOOGLE_API_KEY") or "benchmark",
+        GOOGLE_VISION_ENDPOINT=f"http://127.0.0.1:{vision.server_port}", GOOGLE_VISION_TRANSPORT="rest",
+        EXTRACT_WORKERS=str(args.workers), BATCH_CONCURRENCY=str(args.concurrency)
+    )
+    urls = [f"http://127.0.0.1:{server.server_port}/{os.path.basename(path)}" for path in paths.values()]
+    results = {}
+    try:
+        for mode, run in (("sequential", run_sequential), ("batch", run_batch)):
+            with startup.app_server(env) as process:
+                results[mode] = run(process.base_url, urls)
+    finally:
+        server.shutdown()
+        vision.shutdown()
+
+    print(f"{len(urls)} documents, {pages} pages, OCR latency {args.latency}s")
+    for mode, result in results.items():
+        print(f"{mode:<11} {result['seconds']:7.2f}s  {pages / result['seconds']:7.1f} pages/s  "
+              f"first result {result['first_seconds']:.2f}s  failed {result['failed']}")
+    speedup = results["sequential"]["seconds"] / results["batch"]["seconds"]
+    identical = results["sequential"]["texts"] == results["batch"]["texts"]
+    print(f"batch speedup {speedup:.2f}x, identical text: {identical}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Deterministic fixture PDFs for the extraction benchmarks, plus a quiet local
+HTTP server to fetch them from.
+
+Documents are written once into a corpus directory and reused while their
+file is present; the same name always produces the same document.
+"""
+import functools
+import os
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List
+
+import fitz
+
+_SENTENCES = [
+    "Extraction speed depends on how many pages need OCR.",
+    "Text pages are read straight from the PDF text layer.",
+    "Scanned pages are rendered and sent to the OCR service.",
+    "Mixed documents interleave both kinds of page with figures.",
+    "Every fixture is generated from a fixed seed so runs compare.",
+]
+
+
+def _write_text(page: fitz.Page, seed: int, lines: int = 40) -> None:
+    text = "\n".join(f"{seed}.{i} {_SENTENCES[(seed + i) % len(_SENTENCES)]}" for i in range(lines))
+    page.insert_textbox(fitz.Rect(54, 54, page.rect.width - 54, page.rect.height - 54), text, fontsize=10)
+
+
+def _page_scans(count: int, dpi: int = 150) -> List[fitz.Pixmap]:
+    """
+    Grayscale images of distinct text pages, as a scanner would produce them
+    """
+    source = fitz.open()
+    scans = []
+    for seed in range(count):
+        page = source.new_page()
+        _write_text(page, seed)
+        scans.append(page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY))
+    return scans
+
+
+def _insert_scan(page: fitz.Page, scan: fitz.Pixmap, xrefs: dict, rect=None) -> None:
+    # Reuse each distinct image so the file stays small while every page still has to be rendered
+    key = id(scan)
+    if key in xrefs:
+        page.insert_image(rect or page.rect, xref=xrefs[key])
+    else:
+        xrefs[key] = page.insert_image(rect or page.rect, pixmap=scan)
+
+
+def make_text(path: str, pages: int) -> None:
+    doc = fitz.open()
+    for n in range(pages):
+        _write_text(doc.new_page(), n)
+    doc.save(path, garbage=3, deflate=True)
+
+
+def make_scanned(path: str, pages: int) -> None:
+    scans = _page_scans(8)
+    doc = fitz.open()
+    xrefs = {}
+    for n in range(pages):
+        _insert_scan(doc.new_page(), scans[n % len(scans)], xrefs)
+    doc.save(path, garbage=3, deflate=True)
+
+
+def make_mixed(path: str, pages: int) -> None:
+    """
+    Text pages, scanned pages and text pages carrying a figure, in rotation
+    """
+    scans = _page_scans(8)
+    doc = fitz.open()
+    xrefs = {}
+    for n in range(pages):
+        page = doc.new_page()
+        kind = n % 3
+        if kind == 1:
+            _insert_scan(page, scans[n % len(scans)], xrefs)
+            continue
+        _write_text(page, n, lines=20 if kind == 2 else 40)
+        if kind == 2:
+            _insert_scan(page, scans[n % len(scans)], xrefs, fitz.Rect(126, 400, 486, 740))
+    doc.save(path, garbage=3, deflate=True)
+
+
+# name -> (generator, pages)
+DOCUMENTS: Dict[str, tuple] = {
+    "text": (make_text, 200),
+    "scanned": (make_scanned, 40),
+    "mixed": (make_mixed, 90),
+    "large": (make_text, 2000),
+}
+
+# Single-page documents for the startup benchmark, not part of the extraction runs
+PAGES: Dict[str, tuple] = {
+    "text-page": (make_text, 1),
+    "scanned-page": (make_scanned, 1),
+}
+
+
+# A course folder of short lectures, some with scanned pages, for the batch benchmark
+FOLDER: Dict[str, tuple] = {
+    f"lecture-{n:02d}": (make_mixed if n % 3 == 0 else make_text, 6 + 3 * n) for n in range(1, 13)
+}
+
+
+def build(directory: str, names: List[str]) -> Dict[str, str]:
+    """
+    Make sure the named documents exist in directory and return name -> path
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for name in names:
+        generate, pages = DOCUMENTS.get(name) or PAGES.get(name) or FOLDER[name]
+        path = os.path.join(directory, f"{name}-{pages}.pdf")
+        if not os.path.exists(path):
+            tmp_path = path + ".tmp"
+            generate(tmp_path, pages)
+            os.replace(tmp_path, path)
+        paths[name] = path
+    return paths
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_directory(directory: str) -> ThreadingHTTPServer:
+    """
+    Serve a directory over HTTP on a background thread; server.server_port holds the port
+    """
+    handler: Callable = functools.partial(QuietHandler, directory=directory)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
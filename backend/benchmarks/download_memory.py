@@ -0,0 +1,135 @@
+"""
+Peak RSS of the old buffered download path (response.content wrapped in a
+BytesIO) against the spooled path (body streamed to a temporary file that
+fitz opens directly).
+
+Each mode runs in a fresh process so the peaks do not contaminate each other.
+Run from the backend directory:
+
+    python -m benchmarks.download_memory --size-mb 200
+"""
+import argparse
+import asyncio
+import functools
+import json
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import fitz
+
+
+def make_image_pdf(path: str, size_mb: int, seed: int = 0) -> None:
+    """
+    Write a deterministic PDF of roughly size_mb made of incompressible noise images,
+    similar in weight to a scanned textbook
+    """
+    rng = random.Random(seed)
+    side = 1000
+    doc = fitz.open()
+    pages = max(1, size_mb * 1024 * 1024 // (side * side * 3))
+    for _ in range(pages):
+        pix = fitz.Pixmap(fitz.csRGB, side, side, rng.randbytes(side * side * 3), 0)
+        page = doc.new_page()
+        page.insert_image(page.rect, pixmap=pix)
+    doc.save(path)
+    doc.close()
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _walk(doc) -> int:
+    blocks = 0
+    for page in doc:
+        blocks += len(page.get_text("blocks"))
+    return blocks
+
+
+def _run_buffered(url: str) -> None:
+    import httpx
+    response = httpx.get(url)
+    response.raise_for_status()
+    pdf_buffer = BytesIO(response.content)
+    doc = fitz.open(stream=pdf_buffer, filetype="pdf")
+    _walk(doc)
+    doc.close()
+
+
+def _run_spooled(url: str) -> None:
+    from pdfextractor import PDFExtractor
+
+    async def download():
+        extractor = PDFExtractor(serial=True)
+        async with extractor._check_url(url) as response:
+            return await extractor._spool(response)
+
+    with asyncio.run(download()) as download:
+        doc = fitz.open(download.path, filetype="pdf")
+        _walk(doc)
+        doc.close()
+
+
+def _child(mode: str, url: str, queue) -> None:
+    import httpx  # noqa: F401 -- count library imports in the baseline for both modes
+    import pdfextractor  # noqa: F401
+    baseline = _peak_rss_mb()
+    start = time.perf_counter()
+    {"buffered": _run_buffered, "spooled": _run_spooled}[mode](url)
+    queue.put({
+        "mode": mode,
+        "seconds": round(time.perf_counter() - start, 3),
+        "baseline_rss_mb": round(baseline, 1),
+        "peak_rss_mb": round(_peak_rss_mb(), 1)
+    })
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=100, help="approximate fixture size")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as fixture_dir:
+        make_image_pdf(os.path.join(fixture_dir, "scanned.pdf"), args.size_mb)
+        handler = functools.partial(QuietHandler, directory=fixture_dir)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/scanned.pdf"
+
+        ctx = multiprocessing.get_context("spawn")
+        results = []
+        for mode in ("buffered", "spooled"):
+            queue = ctx.Queue()
+            process = ctx.Process(target=_child, args=(mode, url, queue))
+            process.start()
+            results.append(queue.get())
+            process.join()
+        server.shutdown()
+
+    if args.json:
+        print(json.dumps({"size_mb": args.size_mb, "results": results}, indent=2))
+        return
+
+    print(f"fixture: ~{args.size_mb} MB scanned PDF")
+    for result in results:
+        print(f"{result['mode']:>9}: peak RSS {result['peak_rss_mb']:8.1f} MB "
+              f"(+{result['peak_rss_mb'] - result['baseline_rss_mb']:.1f} MB over baseline) "
+              f"in {result['seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
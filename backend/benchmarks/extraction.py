@@ -0,0 +1,266 @@
+"""
+End-to-end extraction benchmark on a synthetic corpus, fully offline.
+
+Fixture PDFs (text-only, scanned, mixed and a 2000-page text document, see
+benchmarks/corpus.py) are served from a local HTTP server, and Google Vision
+is replaced by the fake in benchmarks/fake_vision.py with a configurable
+latency. Each document is extracted through PDFExtractor.extract_with_pymu
+(the uncached path) in a fresh process, which reports:
+
+- wall time and pages/sec
+- peak RSS of the extracting process and of its worker processes
+- cumulative time per stage: _check_url (until response headers), the body
+  download (_spool), fitz.open, per-page extraction (_extract_page, serial
+  runs only since parallel runs do it inside the workers), OCR requests and
+  time spent waiting on OCR results
+
+followed by the cold start timings of benchmarks/startup.py (time to the
+first /extract response of a freshly started server).
+
+Results are written as JSON so runs on different commits can be compared:
+
+    python -m benchmarks.extraction --output before.json
+    git checkout my-branch
+    python -m benchmarks.extraction --output after.json --compare before.json
+
+Run from the backend directory.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from benchmarks import corpus, fake_vision, startup
+
+
+class StageTimer:
+    """
+    Thread-safe cumulative timings per stage
+    """
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.calls = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.totals[stage] += seconds
+            self.calls[stage] += 1
+
+    def wrap(self, stage: str, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        return timed
+
+    def wrap_async(self, stage: str, fn):
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        return timed
+
+    def report(self) -> dict:
+        return {
+            stage: {"seconds": round(self.totals[stage], 4), "calls": self.calls[stage]}
+            for stage in sorted(self.totals)
+        }
+
+
+def _instrument(timer: StageTimer) -> None:
+    """
+    Wrap the extraction stages of this process in timers
+    """
+    import pdfextractor
+    from google_ai import GoogleAIPDFExtractor
+    from pdfextractor import PDFExtractor
+
+    check_url = PDFExtractor._check_url
+
+    @asynccontextmanager
+    async def timed_check_url(self, pdf_url):
+        start = time.perf_counter()
+        async with check_url(self, pdf_url) as response:
+            timer.add("check_url", time.perf_counter() - start)
+            yield response
+
+    PDFExtractor._check_url = timed_check_url
+    PDFExtractor._spool = timer.wrap_async("download", PDFExtractor._spool)
+    PDFExtractor._extract_page = timer.wrap("extract_page", PDFExtractor._extract_page)
+    PDFExtractor._ocr_result = staticmethod(timer.wrap("ocr_wait", PDFExtractor._ocr_result))
+    GoogleAIPDFExtractor.read_batch = timer.wrap("ocr_request", GoogleAIPDFExtractor.read_batch)
+    pdfextractor.fitz.open = timer.wrap("fitz_open", pdfextractor.fitz.open)
+
+
+def _peak_rss_mb(who: int) -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return round(resource.getrusage(who).ru_maxrss / 1024, 1)
+
+
+def _child(url: str, workers: int, queue) -> None:
+    """
+    Extract one document in this (fresh) process and report its measurements
+    """
+    timer = StageTimer()
+    _instrument(timer)
+    import ocr_backends
+    import pdfextractor
+    from pdfextractor import PDFExtractor
+
+    extractor = PDFExtractor(workers=workers, serial=workers <= 1)
+    start = time.perf_counter()
+    result = asyncio.run(extractor.extract_with_pymu(url))
+    wall = time.perf_counter() - start
+
+    # Worker processes only count towards RUSAGE_CHILDREN once they have exited
+    workers_peak_rss_mb = None
+    if pdfextractor._pool is not None:
+        pdfextractor._pool.shutdown(wait=True)
+        workers_peak_rss_mb = _peak_rss_mb(resource.RUSAGE_CHILDREN)
+    dispatcher = pdfextractor._ocr_dispatcher
+    queue.put({
+        "wall_seconds": round(wall, 3),
+        "blocks": len(result["blocks"]),
+        "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF),
+        "workers_peak_rss_mb": workers_peak_rss_mb,
+        "stages": timer.report(),
+        "ocr": dict(dispatcher.stats) if dispatcher is not None else None,
+        "ocr_cache": dict(ocr_backends._ocr.stats) if ocr_backends._ocr is not None else None
+    })
+
+
+def _page_count(path: str) -> int:
+    import fitz
+    with fitz.open(path) as doc:
+        return len(doc)
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names: list, corpus_dir: str, workers: int, latency: float, repeat: int, startup_repeat: int = 3) -> dict:
+    paths = corpus.build(corpus_dir, names)
+    server = corpus.serve_directory(corpus_dir)
+    vision = fake_vision.serve(latency=latency)
+
+    # Read by the spawned processes (and their worker pools) when they import the backend
+    os.environ.update({
+        "GOOGLE_API_KEY": os.environ.get("GOOGLE_API_KEY") or "benchmark",
+        "GOOGLE_VISION_ENDPOINT": f"http://127.0.0.1:{vision.server_port}",
+        "GOOGLE_VISION_TRANSPORT": "rest",
+        "CACHE_DIR": "",
+        "OCR_CACHE_DIR": "",
+    })
+
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    try:
+        for name in names:
+            path = paths[name]
+            url = f"http://127.0.0.1:{server.server_port}/{os.path.basename(path)}"
+            pages = _page_count(path)
+            runs = []
+            for _ in range(repeat):
+                queue = ctx.Queue()
+                process = ctx.Process(target=_child, args=(url, workers, queue))
+                process.start()
+                runs.append(queue.get())
+                process.join()
+
+            # Report the run with the median wall time
+            runs.sort(key=lambda r: r["wall_seconds"])
+            median = runs[len(runs) // 2]
+            results.append(dict(
+                median,
+                document=name,
+                pages=pages,
+                size_bytes=os.path.getsize(path),
+                pages_per_second=round(pages / median["wall_seconds"], 2),
+                wall_seconds_all=[r["wall_seconds"] for r in runs]
+            ))
+        startup_results = None
+        if startup_repeat:
+            startup_results = startup.measure(f"http://127.0.0.1:{server.server_port}", corpus_dir, startup_repeat)
+    finally:
+        server.shutdown()
+        vision.shutdown()
+
+    return {
+        "commit": _commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "config": {"workers": workers, "ocr_latency": latency, "repeat": repeat},
+        "results": results,
+        "startup": startup_results
+    }
+
+
+def print_report(report: dict, baseline: Optional[dict] = None) -> None:
+    before = {r["document"]: r for r in (baseline or {}).get("results", [])}
+    print(f"commit {report['commit']}, workers={report['config']['workers']}, "
+          f"OCR latency {report['config']['ocr_latency']}s")
+    print(f"{'document':<9} {'pages':>5} {'wall s':>8} {'pages/s':>8} {'RSS MB':>7} {'workers MB':>10}  stages")
+    for result in report["results"]:
+        stages = ", ".join(f"{stage} {info['seconds']:.2f}s" for stage, info in result["stages"].items())
+        line = (f"{result['document']:<9} {result['pages']:>5} {result['wall_seconds']:>8.2f} "
+                f"{result['pages_per_second']:>8.1f} {result['peak_rss_mb']:>7.0f} "
+                f"{result['workers_peak_rss_mb'] or '-':>10}  {stages}")
+        previous = before.get(result["document"])
+        if previous:
+            change = result["wall_seconds"] / previous["wall_seconds"] - 1
+            line += f"  [{change:+.0%} wall vs {baseline.get('commit')}]"
+        print(line)
+    if report.get("startup"):
+        print(startup.format_report(report["startup"], (baseline or {}).get("startup")))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", nargs="+", default=list(corpus.DOCUMENTS), choices=list(corpus.DOCUMENTS))
+    parser.add_argument("--corpus-dir", default=os.path.join(tempfile.gettempdir(), "pdf-benchmark-corpus"))
+    parser.add_argument("--workers", type=int, default=1, help="1 runs the serial path with a full stage breakdown")
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds the fake Vision API takes per request")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per document, the median is reported")
+    parser.add_argument("--startup-repeat", type=int, default=3,
+                        help="cold starts per mode for the startup timings, 0 skips them")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare wall times with")
+    args = parser.parse_args()
+
+    report = run(args.documents, args.corpus_dir, args.workers, args.latency, args.repeat, args.startup_repeat)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+A local stand-in for the Azure Document Intelligence REST API (prebuilt-read),
+for exercising azure_ai offline. Analyses are long-running operations like
+the real service: the analyze request answers 202 with an Operation-Location
+to poll, which reports "running" until the configured latency has passed.
+
+PDFs (urlSource) are read from their text layer, one line per PyMuPDF line
+with coordinates in inches; images (base64Source) get the same deterministic
+grid of words as benchmarks/fake_vision.py, in pixels.
+
+Start it and point the backend at it:
+
+    python -m benchmarks.fake_azure --port 9292 --latency 0.5
+    AZURE_ENDPOINT=http://127.0.0.1:9292 AZURE_KEY=fake OCR_BACKEND=azure uvicorn main:app
+"""
+import argparse
+import base64
+import itertools
+import json
+import random
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import fitz
+
+from benchmarks.fake_vision import fake_annotations
+
+ANALYZE_PATH = "/documentintelligence/documentModels/prebuilt-read:analyze"
+RESULTS_PATH = "/documentintelligence/documentModels/prebuilt-read/analyzeResults/"
+
+
+def _quad(x0: float, y0: float, x1: float, y1: float) -> list:
+    return [x0, y0, x1, y0, x1, y1, x0, y1]
+
+
+def _page(number: int, width: float, height: float, unit: str, lines: list, offset: int) -> tuple:
+    """
+    An analyzeResult page from lines of (text, quad, [(word, quad), ...]), and its content
+    """
+    page_words, page_lines, texts = [], [], []
+    for text, quad, words in lines:
+        page_lines.append({"content": text, "polygon": quad, "spans": [{"offset": offset, "length": len(text)}]})
+        for word, word_quad in words:
+            page_words.append({
+                "content": word, "polygon": word_quad, "confidence": 0.99,
+                "span": {"offset": offset, "length": len(word)}
+            })
+            offset += len(word) + 1
+        texts.append(text)
+    content = "\n".join(texts)
+    return {
+        "pageNumber": number, "width": width, "height": height, "unit": unit,
+        "words": page_words, "lines": page_lines,
+        "spans": [{"offset": offset - len(content), "length": len(content)}]
+    }, content
+
+
+def analyze_pdf(data: bytes) -> dict:
+    pages, contents, offset = [], [], 0
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        for page in doc:
+            lines = []
+            key = lambda word: (word[5], word[6])
+            for _, words in itertools.groupby(page.get_text("words"), key=key):
+                words = [(word[4], _quad(*(value / 72 for value in word[:4]))) for word in words]
+                xs = [value for _, quad in words for value in quad[0::2]]
+                ys = [value for _, quad in words for value in quad[1::2]]
+                lines.append((" ".join(word for word, _ in words), _quad(min(xs), min(ys), max(xs), max(ys)), words))
+            result, content = _page(page.number + 1, page.rect.width / 72, page.rect.height / 72, "inch", lines, offset)
+            pages.append(result)
+            contents.append(content)
+            offset += len(content) + 1
+    return {"content": "\n".join(contents), "pages": pages}
+
+
+def analyze_image(data: bytes) -> dict:
+    pix = fitz.Pixmap(data)
+    lines = []
+    annotations = fake_annotations(data)[1:]
+    key = lambda annotation: annotation["boundingPoly"]["vertices"][0]["y"]
+    for _, row in itertools.groupby(annotations, key=key):
+        words = []
+        for annotation in row:
+            vertices = annotation["boundingPoly"]["vertices"]
+            words.append((annotation["description"], _quad(vertices[0]["x"], vertices[0]["y"],
+                                                           vertices[2]["x"], vertices[2]["y"])))
+        first, last = words[0][1], words[-1][1]
+        lines.append((" ".join(word for word, _ in words), _quad(first[0], first[1], last[2], last[5]), words))
+    result, content = _page(1, pix.width, pix.height, "pixel", lines, 0)
+    return {"content": content, "pages": [result]}
+
+
+class FakeAzureHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    error_rate = 0.0
+    rng = random.Random(0)
+    stats = {"analyses": 0, "polls": 0, "errors": 0}
+    operations = {}
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: dict = None) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if urlsplit(self.path).path != ANALYZE_PATH:
+            self._send_json(404, {"error": {"code": "NotFound", "message": "not found"}})
+            return
+
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        with self.lock:
+            fail = self.rng.random() < self.error_rate
+            self.stats["errors" if fail else "analyses"] += 1
+        if fail:
+            self._send_json(503, {"error": {"code": "ServiceUnavailable", "message": "fake outage"}})
+            return
+
+        try:
+            if "urlSource" in body:
+                with urllib.request.urlopen(body["urlSource"], timeout=30) as response:
+                    result = analyze_pdf(response.read())
+            else:
+                result = analyze_image(base64.b64decode(body["base64Source"]))
+        except Exception as e:
+            self._send_json(400, {"error": {"code": "InvalidRequest", "message": str(e)}})
+            return
+
+        operation_id = uuid.uuid4().hex
+        with self.lock:
+            self.operations[operation_id] = (time.monotonic() + self.latency, result)
+        # No Retry-After, so clients poll at their own interval
+        self._send_json(202, {}, {
+            "Operation-Location": f"http://{self.headers['Host']}{RESULTS_PATH}{operation_id}?api-version=2024-11-30"
+        })
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        operation = self.operations.get(path[len(RESULTS_PATH):]) if path.startswith(RESULTS_PATH) else None
+        if operation is None:
+            self._send_json(404, {"error": {"code": "NotFound", "message": "unknown operation"}})
+            return
+
+        with self.lock:
+            self.stats["polls"] += 1
+        ready_at, result = operation
+        if time.monotonic() < ready_at:
+            self._send_json(200, {"status": "running"})
+            return
+        self._send_json(200, {
+            "status": "succeeded",
+            "analyzeResult": dict(result, apiVersion="2024-11-30", modelId="prebuilt-read")
+        })
+
+
+def serve(port: int = 0, latency: float = 0.0, error_rate: float = 0.0) -> ThreadingHTTPServer:
+    """
+    Start the fake Document Intelligence server on a background thread and
+    return it; server.server_port holds the bound port and
+    server.RequestHandlerClass.stats the counts of analyses and polls
+    """
+    handler = type("Handler", (FakeAzureHandler,), {
+        "latency": latency,
+        "error_rate": error_rate,
+        "rng": random.Random(0),
+        "stats": {"analyses": 0, "polls": 0, "errors": 0},
+        "operations": {},
+        "lock": threading.Lock()
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9292)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds an analysis stays running")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of analyses answered with 503")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, args.error_rate)
+    print(f"Fake Document Intelligence listening on http://127.0.0.1:{server.server_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
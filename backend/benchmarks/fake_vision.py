@@ -0,0 +1,150 @@
+"""
+A local stand-in for the Google Cloud Vision REST API, for exercising the OCR
+path offline. It answers images:annotate requests with a deterministic grid of
+words sized to each image, after a configurable latency, and can inject
+request-level (HTTP 503) and per-image (UNAVAILABLE) errors.
+
+Start it and point the backend at it:
+
+    python -m benchmarks.fake_vision --port 9090 --latency 0.3
+    GOOGLE_VISION_ENDPOINT=http://127.0.0.1:9090 GOOGLE_VISION_TRANSPORT=rest \\
+        GOOGLE_API_KEY=fake uvicorn main:app
+"""
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import fitz
+
+LINE_HEIGHT = 60
+WORD_WIDTH = 150
+WORD_GAP = 30
+MARGIN = 100
+
+
+def fake_annotations(image: bytes) -> list:
+    """
+    Vision-style textAnnotations for a grid of words covering the image:
+    the full text first, then one entry per word
+    """
+    pix = fitz.Pixmap(image)
+    width, height = pix.width, pix.height
+    words = []
+    lines = []
+    y = MARGIN
+    while y + LINE_HEIGHT <= height - MARGIN:
+        line = []
+        x = MARGIN
+        while x + WORD_WIDTH <= width - MARGIN:
+            text = f"word{len(words)}"
+            words.append({
+                "description": text,
+                "boundingPoly": {"vertices": [
+                    {"x": x, "y": y},
+                    {"x": x + WORD_WIDTH, "y": y},
+                    {"x": x + WORD_WIDTH, "y": y + LINE_HEIGHT // 2},
+                    {"x": x, "y": y + LINE_HEIGHT // 2}
+                ]}
+            })
+            line.append(text)
+            x += WORD_WIDTH + WORD_GAP
+        lines.append(" ".join(line))
+        y += LINE_HEIGHT
+    if not words:
+        return []
+    return [{"description": "\n".join(lines) + "\n"}] + words
+
+
+class FakeVisionHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    error_rate = 0.0
+    image_error_rate = 0.0
+    rng = random.Random(0)
+    stats = {"requests": 0, "images": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if not self.path.startswith("/v1/images:annotate"):
+            self._send_json(404, {"error": {"code": 404, "message": "not found"}})
+            return
+
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        requests = body.get("requests", [])
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["images"] += len(requests)
+            fail_request = self.rng.random() < self.error_rate
+            fail_images = [self.rng.random() < self.image_error_rate for _ in requests]
+            self.stats["errors"] += len(requests) if fail_request else sum(fail_images)
+
+        if fail_request:
+            self._send_json(503, {"error": {"code": 503, "message": "fake outage", "status": "UNAVAILABLE"}})
+            return
+
+        responses = []
+        for request, fail in zip(requests, fail_images):
+            if fail:
+                responses.append({"error": {"code": 14, "message": "fake image error"}})
+            else:
+                image = base64.b64decode(request["image"]["content"])
+                responses.append({"textAnnotations": fake_annotations(image)})
+        self._send_json(200, {"responses": responses})
+
+
+def serve(port: int = 0, latency: float = 0.0, error_rate: float = 0.0,
+          image_error_rate: float = 0.0) -> ThreadingHTTPServer:
+    """
+    Start the fake Vision server on a background thread and return it;
+    server.server_port holds the bound port
+    """
+    handler = type("Handler", (FakeVisionHandler,), {
+        "latency": latency,
+        "error_rate": error_rate,
+        "image_error_rate": image_error_rate,
+        "rng": random.Random(0),
+        "stats": {"requests": 0, "images": 0, "errors": 0},
+        "lock": threading.Lock()
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9090)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--image-error-rate", type=float, default=0.0,
+                        help="fraction of images answered with an UNAVAILABLE error")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, args.error_rate, args.image_error_rate)
+    print(f"Fake Vision API listening on http://127.0.0.1:{server.server_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
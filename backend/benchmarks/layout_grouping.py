@@ -0,0 +1,241 @@
+"""
+Times the array-backed layout engine (layout.py) against the original
+per-word Python grouping on dense pages.
+
+The original grouping and the golden set of synthetic OCR pages defined here
+are also what tests/test_layout.py checks layout.py against. The golden set
+covers word grids with jittered baselines, tied coordinates, sentence ends
+followed by capitals, list and numbered items, large and small line gaps,
+hyphenation and punctuation spacing, plus the fake Vision server's word grid.
+Run from the backend directory:
+
+    python -m benchmarks.layout_grouping --words 4000 --repeat 20
+"""
+import argparse
+import random
+import time
+from types import SimpleNamespace
+
+import fitz
+from google.cloud.vision_v1 import types
+
+import layout
+from benchmarks.fake_vision import fake_annotations
+
+
+def should_continue_paragraph(prev_line, curr_line):
+    """
+    The original line continuation rule, kept verbatim as the reference
+    """
+    if not prev_line or not curr_line:
+        return False
+
+    prev_text = ' '.join(block['text'] for block in prev_line)
+    curr_text = ' '.join(block['text'] for block in curr_line)
+
+    prev_bottom = max(block['bbox'][3] for block in prev_line)
+    curr_top = min(block['bbox'][1] for block in curr_line)
+    y_gap = curr_top - prev_bottom
+
+    if y_gap > 30:
+        return False
+
+    prev_ends_sentence = prev_text.strip().endswith(('.', '!', '?', ':'))
+    curr_starts_capital = curr_text.strip() and curr_text.strip()[0].isupper()
+    curr_starts_list = curr_text.strip().startswith(('•', '-', '*')) or \
+        any(curr_text.strip().startswith(f"{n}.") for n in range(1, 10))
+
+    return (y_gap <= 20 and
+            (not prev_ends_sentence or not curr_starts_capital) and
+            not curr_starts_list)
+
+
+def reference_blocks(annotations, page_num, page_width, page_height):
+    """
+    The original dict-per-word grouping from google_ai, kept verbatim as the reference
+    """
+    word_blocks = []
+    for text_block in annotations:
+        vertices = [(vertex.x, vertex.y) for vertex in text_block.bounding_poly.vertices]
+        x_coords = [vertex[0] for vertex in vertices]
+        y_coords = [vertex[1] for vertex in vertices]
+        word_blocks.append({
+            "text": text_block.description,
+            "bbox": [min(x_coords), min(y_coords), max(x_coords), max(y_coords)],
+            "page": page_num,
+            "width": page_width,
+            "height": page_height,
+            "method": "google"
+        })
+
+    sorted_blocks = sorted(word_blocks, key=lambda x: (x['bbox'][1], x['bbox'][0]))
+
+    lines = []
+    current_line = []
+    y_threshold = 12
+    for block in sorted_blocks:
+        if not current_line:
+            current_line.append(block)
+            continue
+        y_diff = abs(block['bbox'][1] - current_line[0]['bbox'][1])
+        if y_diff <= y_threshold:
+            current_line.append(block)
+        else:
+            current_line.sort(key=lambda x: x['bbox'][0])
+            lines.append(current_line)
+            current_line = [block]
+    if current_line:
+        current_line.sort(key=lambda x: x['bbox'][0])
+        lines.append(current_line)
+
+    def finish(current_paragraph):
+        x0 = min(block['bbox'][0] for block in current_paragraph)
+        y0 = min(block['bbox'][1] for block in current_paragraph)
+        x1 = max(block['bbox'][2] for block in current_paragraph)
+        y1 = max(block['bbox'][3] for block in current_paragraph)
+        text = ' '.join(block['text'] for block in current_paragraph)
+        text = text.replace(' ,', ',').replace(' .', '.').replace(' !', '!').replace(' ?', '?')
+        text = text.replace('- ', '-').replace(' -', '-')
+        return {
+            'text': text,
+            'page': page_num,
+            'bbox': [x0, y0, x1, y1],
+            'width': page_width,
+            'height': page_height,
+            'method': 'google'
+        }
+
+    paragraphs = []
+    current_paragraph = []
+    for i, line in enumerate(lines):
+        if not current_paragraph:
+            current_paragraph.extend(line)
+            continue
+        if should_continue_paragraph(lines[i - 1], line):
+            current_paragraph.extend(line)
+        else:
+            paragraphs.append(finish(current_paragraph))
+            current_paragraph = list(line)
+    if current_paragraph:
+        paragraphs.append(finish(current_paragraph))
+    return paragraphs
+
+
+def reference_in_points(annotations, page_num, page_width, page_height):
+    """
+    The reference grouping of a 300 DPI render with its pixel boxes mapped to
+    page points, as layout.paragraph_blocks returns them
+    """
+    blocks = reference_blocks(annotations, page_num, page_width, page_height)
+    for block in blocks:
+        block['bbox'] = [coord * (72 / 300) for coord in block['bbox']]
+    return blocks
+
+
+def _annotation(text, x0, y0, x1, y1):
+    vertices = [SimpleNamespace(x=x, y=y) for x, y in ((x0, y0), (x1, y0), (x1, y1), (x0, y1))]
+    return SimpleNamespace(description=text, bounding_poly=SimpleNamespace(vertices=vertices))
+
+
+_VOCABULARY = [
+    "the", "The", "of", "and", "Paragraph", "data", "model,", "end.", "Why?", "yes!", "note:",
+    "-", "•", "*", "1.", "2.", "9.", "10.", "co-", "operate", ",", ".", "?", "x", "Alpha", " ", ""
+]
+
+
+def synthetic_page(rng: random.Random, words: int, width: int = 2550, height: int = 3300,
+                   jitter: int = 8, shuffle: bool = True) -> list:
+    """
+    Word annotations laid out in lines with random gaps, jittered baselines and mixed vocabulary
+    """
+    annotations = []
+    y = 50
+    while len(annotations) < words:
+        x = rng.randint(50, 150)
+        line_height = rng.randint(20, 40)
+        while x < width - 200 and len(annotations) < words:
+            word_width = rng.randint(20, 180)
+            top = y + rng.randint(-jitter, jitter)
+            text = rng.choice(_VOCABULARY)
+            annotations.append(_annotation(text, x, top, x + word_width, top + line_height))
+            # Occasionally reuse the same x so sort ties are exercised
+            x += 0 if rng.random() < 0.03 else word_width + rng.randint(5, 30)
+        y += line_height + rng.choice([0, 2, 5, 10, 18, 20, 21, 25, 31, 45])
+        if y > height - 100:
+            y = rng.randint(50, 200)
+    if shuffle:
+        rng.shuffle(annotations)
+    return annotations
+
+
+def _fake_vision_page() -> list:
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 2550, 3300), False)
+    pix.clear_with(255)
+    data = fake_annotations(pix.tobytes("png"))[1:]
+    return [
+        SimpleNamespace(
+            description=word["description"],
+            bounding_poly=SimpleNamespace(vertices=[
+                SimpleNamespace(x=v["x"], y=v["y"]) for v in word["boundingPoly"]["vertices"]
+            ])
+        )
+        for word in data
+    ]
+
+
+def to_protobuf(annotations: list):
+    """
+    The same annotations as raw Vision protobuf messages, which is what google_ai hands to layout
+    """
+    response = types.AnnotateImageResponse.pb()()
+    for annotation in annotations:
+        entity = response.text_annotations.add(description=annotation.description)
+        for vertex in annotation.bounding_poly.vertices:
+            entity.bounding_poly.vertices.add(x=vertex.x, y=vertex.y)
+    return response.text_annotations
+
+
+def golden_pages() -> list:
+    rng = random.Random(1234)
+    pages = [[], [_annotation("Single", 10, 10, 60, 30)], _fake_vision_page()]
+    for words in (2, 5, 30, 200, 1000):
+        for jitter in (0, 4, 8, 15):
+            pages.append(synthetic_page(rng, words, jitter=jitter))
+    pages.append(synthetic_page(rng, 300, shuffle=False))
+    return pages
+
+
+def _time(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, nargs="+", default=[1000, 3000, 5000])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    # Timings use protobuf annotations, so both sides pay the real cost of reading the message fields;
+    # "grouping" is the layout engine alone on boxes already read into arrays
+    rng = random.Random(0)
+    print(f"{'words':>6} {'reference ms':>13} {'layout ms':>10} {'grouping ms':>12} {'speedup':>8}")
+    for words in args.words:
+        annotations = to_protobuf(synthetic_page(rng, words))
+        assert reference_in_points(annotations, 0, 612.0, 792.0) == \
+            layout.paragraph_blocks(annotations, 0, 612.0, 792.0, "google")
+        word_texts, boxes = layout.word_boxes(annotations)
+
+        reference = _time(lambda: reference_blocks(annotations, 0, 612.0, 792.0), args.repeat)
+        vectorized = _time(lambda: layout.paragraph_blocks(annotations, 0, 612.0, 792.0, "google"), args.repeat)
+        grouping = _time(lambda: layout.group_paragraphs(word_texts, boxes), args.repeat)
+        print(f"{words:>6} {reference * 1000:>13.2f} {vectorized * 1000:>10.2f} {grouping * 1000:>12.2f} "
+              f"{reference / vectorized:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
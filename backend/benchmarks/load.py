@@ -0,0 +1,329 @@
+"""
+HTTP load test of the whole app: many clients calling /extract and
+/proxy-pdf at once, at rising concurrency, to find where a machine saturates.
+
+main:app runs in a real uvicorn process. The PDFs come from a local origin
+serving the lecture folder of benchmarks/corpus.py (a third of the lectures
+have scanned pages), and OCR goes to the fake Vision server of
+benchmarks/fake_vision.py with a configurable latency and error rates. At
+each concurrency level that many clients send requests back to back for
+--duration seconds, each picking an operation from --mix:
+
+- extract: GET /extract of a lecture
+- proxy: GET /proxy-pdf of a lecture, reading the whole body
+
+Each level reports throughput, p50/p95/p99 latency, the share of errors
+(429s from admission control are counted on their own) and the peak memory
+of the server and its worker processes. Memory is the sum of their PSS, so
+pages shared between processes are counted once, as the container's memory
+limit counts them.
+
+By default every request uses a new URL and the extraction and OCR caches
+are off, so each request does the full work; --warm reuses the same URLs
+with the caches on, like users opening the same course.
+
+To size a 2 vCPU / 2 GB machine, run the harness under those limits, e.g.
+in the backend image with `docker run --cpus=2 --memory=2g`. Throughput
+stops growing past the saturation point and the latency only climbs; compare
+runs across commits to catch scaling regressions:
+
+    python -m benchmarks.load --concurrency 1 2 4 8 16 32 --output before.json
+    python -m benchmarks.load --concurrency 1 2 4 8 16 32 --compare before.json
+
+Run from the backend directory. The clients run in this process, so on a
+small machine they take some CPU from the server.
+"""
+import argparse
+import asyncio
+import glob
+import itertools
+import json
+import os
+import platform
+import random
+import tempfile
+import threading
+import time
+from typing import Optional
+
+import fitz
+import httpx
+
+from benchmarks import corpus, fake_vision, startup
+from benchmarks.extraction import _commit
+
+OPERATIONS = ("extract", "proxy")
+# Seconds between memory samples of the server
+MEMORY_INTERVAL = 0.05
+# A level reaching this share of the best throughput is saturated
+SATURATION = 0.9
+
+
+def _process_tree(pid: int) -> list:
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        for children in glob.glob(f"/proc/{current}/task/*/children"):
+            try:
+                with open(children) as f:
+                    pending.extend(int(child) for child in f.read().split())
+            except OSError:
+                pass
+    return pids
+
+
+def _memory_bytes(pid: int) -> int:
+    """
+    PSS of a process, falling back to its RSS on kernels without smaps_rollup; 0 once it has exited
+    """
+    for path, field in ((f"/proc/{pid}/smaps_rollup", "Pss:"), (f"/proc/{pid}/status", "VmRSS:")):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith(field):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return 0
+
+
+class MemorySampler:
+    """
+    Samples the memory of a process and its descendants on a background thread and keeps the peak
+    """
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, sum(_memory_bytes(pid) for pid in _process_tree(self.pid)))
+            self._stop.wait(MEMORY_INTERVAL)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def _percentile(values: list, fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def parse_mix(mix: str) -> dict:
+    """
+    "extract=1,proxy=2" -> {"extract": 1.0, "proxy": 2.0}
+    """
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}, expected one of {', '.join(OPERATIONS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+async def _request(client: httpx.AsyncClient, base: str, operation: str, url: str) -> int:
+    route = "extract" if operation == "extract" else "proxy-pdf"
+    async with client.stream("GET", f"{base}/{route}/{url}") as response:
+        async for _ in response.aiter_raw():
+            pass
+        return response.status_code
+
+
+async def run_level(base: str, urls: list, mix: dict, concurrency: int, duration: float,
+                    warm: bool, seed: int) -> dict:
+    """
+    Keep concurrency clients busy for duration seconds and summarize their requests
+    """
+    rng = random.Random(seed)
+    operations, weights = list(mix), list(mix.values())
+    serial = itertools.count()
+    latencies = {operation: [] for operation in operations}
+    statuses = {}
+    deadline = time.perf_counter() + duration
+
+    async def client_loop(client: httpx.AsyncClient) -> None:
+        while time.perf_counter() < deadline:
+            operation = rng.choices(operations, weights)[0]
+            url = rng.choice(urls)
+            if not warm:
+                # The origin ignores the query, the backend's caches do not
+                url += f"?load={seed}-{next(serial)}"
+            start = time.perf_counter()
+            try:
+                status = await _request(client, base, operation, url)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies[operation].append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    start = time.perf_counter()
+    async with httpx.AsyncClient(limits=limits, timeout=startup.TIMEOUT * 5) as client:
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+    # In-flight requests finish after the deadline and count towards the level
+    seconds = time.perf_counter() - start
+
+    every = [latency for values in latencies.values() for latency in values]
+    requests = len(every)
+    rejected = statuses.get(429, 0)
+    failed = sum(count for status, count in statuses.items()
+                 if status != 429 and not (isinstance(status, int) and status < 400))
+
+    def summary(values: list) -> dict:
+        return {
+            "requests": len(values),
+            **{f"p{q}_ms": round(_percentile(values, q / 100) * 1000, 1) if values else None for q in (50, 95, 99)}
+        }
+
+    return {
+        "concurrency": concurrency,
+        "seconds": round(seconds, 2),
+        "requests_per_second": round(requests / seconds, 2),
+        **summary(every),
+        "error_rate": round(failed / requests, 4) if requests else 0.0,
+        "rejected_rate": round(rejected / requests, 4) if requests else 0.0,
+        "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+        "operations": {operation: summary(values) for operation, values in latencies.items()}
+    }
+
+
+def saturation(levels: list) -> Optional[int]:
+    """
+    Lowest concurrency whose throughput is within SATURATION of the best one
+    """
+    if not levels:
+        return None
+    best = max(level["requests_per_second"] for level in levels)
+    return next(level["concurrency"] for level in levels if level["requests_per_second"] >= SATURATION * best)
+
+
+def run(args: argparse.Namespace) -> dict:
+    paths = corpus.build(args.corpus_dir, list(corpus.FOLDER))
+    pages = {}
+    for name, path in paths.items():
+        with fitz.open(path) as doc:
+            pages[name] = len(doc)
+
+    origin = corpus.serve_directory(args.corpus_dir)
+    vision = fake_vision.serve(latency=args.latency, error_rate=args.error_rate,
+                               image_error_rate=args.image_error_rate)
+    urls = [f"http://127.0.0.1:{origin.server_port}/{os.path.basename(path)}" for path in paths.values()]
+    levels = []
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(
+            os.environ,
+            GOOGLE_API_KEY=os.environ.get("GOOGLE_API_KEY") or "benchmark",
+            GOOGLE_VISION_ENDPOINT=f"http://127.0.0.1:{vision.server_port}", GOOGLE_VISION_TRANSPORT="rest",
+            OCR_BACKEND="google", EXTRACT_WORKERS=str(args.workers),
+            PROXY_CACHE_DIR=os.path.join(cache_dir, "proxy"), RENDER_CACHE_DIR="",
+            CACHE_DIR=os.path.join(cache_dir, "extraction") if args.warm else "",
+            OCR_CACHE_DIR=os.path.join(cache_dir, "ocr") if args.warm else ""
+        )
+        if not args.warm:
+            env.update(CACHE_MEMORY_BYTES="0", OCR_CACHE_MEMORY_BYTES="0")
+        try:
+            with startup.app_server(env) as process:
+                for seed, concurrency in enumerate(args.concurrency):
+                    with MemorySampler(process.pid) as memory:
+                        level = asyncio.run(run_level(
+                            process.base_url, urls, args.mix, concurrency, args.duration, args.warm, seed
+                        ))
+                    level["peak_memory_mb"] = round(memory.peak / 1024 / 1024, 1)
+                    levels.append(level)
+                    print(format_level(level), flush=True)
+        finally:
+            origin.shutdown()
+            vision.shutdown()
+
+    return {
+        "commit": _commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "config": {
+            "workers": args.workers, "mix": args.mix, "duration": args.duration, "warm": args.warm,
+            "ocr_latency": args.latency, "ocr_error_rate": args.error_rate,
+            "ocr_image_error_rate": args.image_error_rate, "documents": len(urls), "pages": sum(pages.values())
+        },
+        "levels": levels,
+        "saturation_concurrency": saturation(levels)
+    }
+
+
+HEADER = (f"{'clients':>7} {'requests':>8} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>7} {'429s':>6} {'peak MB':>8}")
+
+
+def format_level(level: dict, previous: Optional[dict] = None) -> str:
+    line = (f"{level['concurrency']:>7} {level['requests']:>8} {level['requests_per_second']:>7.2f} "
+            f"{level['p50_ms'] or 0:>8.0f} {level['p95_ms'] or 0:>8.0f} {level['p99_ms'] or 0:>8.0f} "
+            f"{level['error_rate']:>7.1%} {level['rejected_rate']:>6.1%} {level['peak_memory_mb']:>8.0f}  "
+            + ", ".join(f"{operation} p95 {stats['p95_ms'] or 0:.0f}" for operation, stats in level["operations"].items()))
+    if previous:
+        throughput = level["requests_per_second"] / previous["requests_per_second"] - 1
+        line += f"  [{throughput:+.0%} req/s"
+        if level["p95_ms"] and previous["p95_ms"]:
+            line += f", {level['p95_ms'] / previous['p95_ms'] - 1:+.0%} p95"
+        line += "]"
+    return line
+
+
+def print_report(report: dict, baseline: Optional[dict] = None) -> None:
+    before = {level["concurrency"]: level for level in (baseline or {}).get("levels", [])}
+    config = report["config"]
+    print(f"\ncommit {report['commit']}, {report['cpus']} CPUs, workers={config['workers']}, "
+          f"mix {config['mix']}, {'warm' if config['warm'] else 'cold'} caches, OCR latency {config['ocr_latency']}s"
+          + (f" vs {baseline.get('commit')}" if baseline else ""))
+    print(HEADER)
+    for level in report["levels"]:
+        print(format_level(level, before.get(level["concurrency"])))
+    if report["saturation_concurrency"] is not None:
+        print(f"throughput saturates at {report['saturation_concurrency']} concurrent clients")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus-dir", default=os.path.join(tempfile.gettempdir(), "pdf-benchmark-corpus"))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16],
+                        help="concurrent clients of each level, in order")
+    parser.add_argument("--duration", type=float, default=20, help="seconds each level sends requests")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("extract=1,proxy=1"),
+                        help="operations and their weights, e.g. extract=3,proxy=1")
+    parser.add_argument("--warm", action="store_true", help="reuse URLs with the caches on")
+    parser.add_argument("--workers", type=int, default=2, help="EXTRACT_WORKERS of the server")
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds the fake Vision API takes per request")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of Vision requests answered with 503")
+    parser.add_argument("--image-error-rate", type=float, default=0.0,
+                        help="fraction of Vision images answered with an UNAVAILABLE error")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare throughput and p95 with")
+    args = parser.parse_args()
+
+    print(HEADER)
+    report = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
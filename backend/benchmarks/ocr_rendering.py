@@ -0,0 +1,188 @@
+"""
+Render time, upload size and (optionally) OCR accuracy of the adaptive OCR
+rendering in ocr_render.py against the old fixed pipeline, which rendered
+every non-searchable page at 300 DPI in RGB and PNG-encoded it.
+
+Fixtures are generated: scans at several resolutions and page sizes, in gray
+and colour, and a text page carrying a figure whose text only OCR can read.
+Accuracy needs real Vision credentials (GOOGLE_API_KEY) and is only measured
+with --ocr; it is the word-level similarity between the OCR text and the text
+that was drawn into the fixture. Run from the backend directory:
+
+    python -m benchmarks.ocr_rendering --formats png jpeg webp
+    python -m benchmarks.ocr_rendering --ocr
+"""
+import argparse
+import difflib
+import json
+import time
+from typing import List, NamedTuple
+
+import fitz
+import numpy as np
+
+import ocr_render
+from ocr_dispatcher import OCRJob
+
+_SENTENCES = [
+    "The quick brown fox jumps over the lazy dog near the riverbank.",
+    "Adaptive rendering picks a resolution from the page and its images.",
+    "Scanned textbooks are often stored at two hundred dots per inch.",
+    "Grayscale images compress far better than their colour originals.",
+    "Only the figures of a page with a text layer need to be read by OCR.",
+]
+
+
+class Fixture(NamedTuple):
+    name: str
+    doc: fitz.Document
+    truth: str  # text only OCR can recover
+
+
+def _text_page(width: float, height: float, lines: int, fontsize: float = 11) -> fitz.Document:
+    doc = fitz.open()
+    page = doc.new_page(width=width, height=height)
+    text = "\n".join(_SENTENCES[i % len(_SENTENCES)] for i in range(lines))
+    page.insert_textbox(fitz.Rect(54, 54, width - 54, height - 54), text, fontsize=fontsize)
+    return doc
+
+
+def _scan(width: float, height: float, lines: int, dpi: int, colour: bool, fontsize: float = 11) -> Fixture:
+    """
+    A page holding nothing but an image of rendered text on grainy off-white
+    paper, like a scanner produces
+    """
+    source = _text_page(width, height, lines, fontsize)
+    truth = source[0].get_text()
+    pix = source[0].get_pixmap(dpi=dpi, colorspace=fitz.csRGB if colour else fitz.csGRAY)
+    rng = np.random.default_rng(dpi)
+    pixels = np.frombuffer(pix.samples, dtype=np.uint8).astype(np.int16) - 18
+    pixels += rng.normal(0, 6, pixels.shape).astype(np.int16)
+    pix = fitz.Pixmap(pix.colorspace, pix.width, pix.height, np.clip(pixels, 0, 255).astype(np.uint8).tobytes(), 0)
+    doc = fitz.open()
+    page = doc.new_page(width=width, height=height)
+    page.insert_image(page.rect, pixmap=pix)
+    kind = "colour" if colour else "gray"
+    return Fixture(f"scan {width:.0f}x{height:.0f}pt {dpi}dpi {kind}", doc, truth)
+
+
+def _figure_page() -> Fixture:
+    """
+    A text page with an embedded figure whose caption-like text is part of the image
+    """
+    figure = _text_page(360, 200, 4, fontsize=14)
+    truth = figure[0].get_text()
+    pix = figure[0].get_pixmap(dpi=200)
+    doc = _text_page(612, 792, 10)
+    doc[0].insert_image(fitz.Rect(126, 420, 486, 620), pixmap=pix)
+    return Fixture("text page with figure", doc, truth)
+
+
+def fixtures() -> List[Fixture]:
+    return [
+        _scan(612, 792, 40, 200, colour=False),
+        _scan(612, 792, 40, 300, colour=True),
+        _scan(612, 792, 40, 400, colour=True),
+        _scan(1684, 2384, 80, 150, colour=False, fontsize=24),  # A1 poster
+        _figure_page(),
+    ]
+
+
+def baseline_jobs(page: fitz.Page) -> List[OCRJob]:
+    """
+    The old pipeline: scans rendered whole at 300 DPI RGB PNG, pages with a text layer never OCRed
+    """
+    if any(block[4].strip() for block in page.get_text("blocks")):
+        return []
+    pix = page.get_pixmap(matrix=fitz.Matrix(300 / 72, 300 / 72))
+    return [OCRJob(page.number, pix.tobytes(output="png"), page.rect.width, page.rect.height)]
+
+
+def adaptive_jobs(page: fitz.Page, image_format: str, quality: int) -> List[OCRJob]:
+    """
+    The areas PDFExtractor._extract_page sends to OCR, rendered with the given encoding
+    """
+    if any(block[4].strip() for block in page.get_text("blocks")):
+        areas = ocr_render.image_regions(page)
+    else:
+        areas = [(None, ocr_render.page_image_dpi(page))]
+
+    jobs = []
+    for clip, image_dpi in areas:
+        image = ocr_render.render(page, clip, image_dpi, image_format=image_format, quality=quality, grayscale=True)
+        jobs.append(OCRJob(page.number, image.data, page.rect.width, page.rect.height, image.dpi, image.origin))
+    return jobs
+
+
+def accuracy(truth: str, ocr_text: str) -> float:
+    return difflib.SequenceMatcher(None, truth.split(), ocr_text.split(), autojunk=False).ratio()
+
+
+def _measure(render_jobs, page: fitz.Page, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        jobs = render_jobs(page)
+        best = min(best, time.perf_counter() - start)
+    return jobs, best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--formats", nargs="+", default=["png", "jpeg"], choices=["png", "jpeg", "webp"])
+    parser.add_argument("--quality", type=int, default=ocr_render.OCR_IMAGE_QUALITY)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--ocr", action="store_true", help="measure accuracy with the real Vision API")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    # The figure fixture measures OCR of image regions, which is off by default
+    ocr_render.OCR_IMAGE_REGIONS = True
+
+    recognize = None
+    if args.ocr:
+        from google_ai import GoogleAIPDFExtractor
+        recognize = GoogleAIPDFExtractor().get_text_with_bboxes_batch
+
+    modes = [("baseline png 300dpi rgb", baseline_jobs)] + [
+        (f"adaptive {image_format} q{args.quality} gray",
+         lambda page, image_format=image_format: adaptive_jobs(page, image_format, args.quality))
+        for image_format in args.formats
+    ]
+
+    results = []
+    print(f"{'fixture':<34} {'mode':<26} {'images':>6} {'dpi':>5} {'render ms':>10} {'KiB':>8} {'accuracy':>9}")
+    for fixture in fixtures():
+        page = fixture.doc[0]
+        for mode, render_jobs in modes:
+            jobs, seconds = _measure(render_jobs, page, args.repeat)
+            size = sum(len(job.image) for job in jobs)
+            score = None
+            if recognize is not None:
+                texts = []
+                for result in (recognize(jobs) if jobs else []):
+                    if isinstance(result, BaseException):
+                        raise result
+                    texts.append(result["text"])
+                score = accuracy(fixture.truth, " ".join(texts))
+
+            dpi = "/".join(f"{job.dpi:.0f}" for job in jobs) or "-"
+            shown = "-" if score is None else f"{score:.3f}"
+            print(f"{fixture.name:<34} {mode:<26} {len(jobs):>6} {dpi:>5} {seconds * 1000:>10.1f} "
+                  f"{size / 1024:>8.0f} {shown:>9}")
+            results.append({
+                "fixture": fixture.name,
+                "mode": mode,
+                "images": len(jobs),
+                "dpi": [job.dpi for job in jobs],
+                "render_ms": seconds * 1000,
+                "bytes": size,
+                "accuracy": score
+            })
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
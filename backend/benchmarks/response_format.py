@@ -0,0 +1,90 @@
+"""
+Payload size and server-side serialization time of the /extract response
+formats: the default pydantic-validated JSON against the columnar compact
+JSON (orjson) and msgpack encodings.
+
+The endpoint runs in-process through FastAPI's TestClient with the extractor
+returning a synthetic result, so the timings cover response validation and
+encoding but no PDF work. Run from the backend directory:
+
+    python -m benchmarks.response_format --pages 1300 --blocks-per-page 25
+"""
+import argparse
+import gzip
+import os
+import random
+import time
+from unittest import mock
+
+# main builds the Vision client at import, which needs some API key to construct
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import compact  # noqa: E402
+import main  # noqa: E402
+
+_WORDS = "the of and to in is for on that with as by this are from at be or an which".split()
+
+
+def synthetic_result(pages: int, blocks_per_page: int, words_per_block: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    blocks = []
+    for page in range(pages):
+        method = "google" if rng.random() < 0.3 else "pymupdf"
+        y = 72.0
+        for _ in range(blocks_per_page):
+            height = rng.uniform(10, 60)
+            blocks.append({
+                "text": " ".join(rng.choice(_WORDS) for _ in range(words_per_block)),
+                "page": page,
+                "bbox": [rng.uniform(50, 80), y, rng.uniform(500, 560), y + height],
+                "width": 612.0,
+                "height": 792.0,
+                "method": method
+            })
+            y += height + 4
+    return {"text": "\n\n".join(block["text"] for block in blocks), "blocks": blocks}
+
+
+def _time(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main_() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=1300)
+    parser.add_argument("--blocks-per-page", type=int, default=25)
+    parser.add_argument("--words-per-block", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    result = synthetic_result(args.pages, args.blocks_per_page, args.words_per_block)
+    client = TestClient(main.app)
+    print(f"{len(result['blocks'])} blocks over {args.pages} pages")
+    print(f"{'format':<10} {'request ms':>11} {'encode ms':>10} {'KiB':>9} {'gzip KiB':>9}")
+
+    with mock.patch.object(main.PDFExtractor, "extract", new=mock.AsyncMock(return_value=result)):
+        for response_format in compact.FORMATS:
+            def request():
+                response = client.get(f"/extract/http://example.com/doc.pdf?format={response_format}")
+                response.raise_for_status()
+                return response.content
+
+            body = request()
+            elapsed = _time(request, args.repeat)
+            if response_format == "json":
+                encode = _time(lambda: main.PDFResponse(**result).model_dump_json(), args.repeat)
+            else:
+                encode = _time(lambda: compact.encode(result, response_format), args.repeat)
+            print(f"{response_format:<10} {elapsed * 1000:>11.1f} {encode * 1000:>10.1f} "
+                  f"{len(body) / 1024:>9.0f} {len(gzip.compress(body)) / 1024:>9.0f}")
+
+
+if __name__ == "__main__":
+    main_()
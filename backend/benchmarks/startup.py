@@ -0,0 +1,194 @@
+"""
+Cold start benchmark: how long a freshly started server takes to answer.
+
+Our machines scale to zero, so the first request after a deploy or an idle
+period waits for the interpreter to start, the backend to import and the
+app to start up. Each run starts uvicorn with main:app in a new process
+and measures:
+
+- import: seconds to import main in a fresh interpreter
+- first response: from starting the server process until the first
+  /extract of a one-page text document is answered
+- first OCR: the /extract of a one-page scan that follows, which pays for
+  loading the OCR backend unless it was warmed up
+
+Runs are repeated with OCR_WARMUP=0 and OCR_WARMUP=1. OCR goes to the fake
+Vision server from benchmarks/fake_vision.py, with no latency. The
+extraction benchmark includes these numbers in its JSON output; this module
+can also be run on its own:
+
+    python -m benchmarks.startup --repeat 5
+
+Run from the backend directory.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from typing import Iterator
+
+from benchmarks import corpus, fake_vision
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Seconds a server gets to answer before the run is abandoned
+TIMEOUT = 60
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def app_server(env: dict) -> Iterator[subprocess.Popen]:
+    """
+    Run uvicorn with main:app in a new process and yield it once it answers;
+    process.base_url holds its base URL
+    """
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    process.base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.perf_counter() + TIMEOUT
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {process.returncode}")
+            if time.perf_counter() > deadline:
+                raise RuntimeError("Server did not answer in time")
+            try:
+                _get(f"{process.base_url}/metrics")
+                break
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.05)
+        yield process
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def _import_seconds(env: dict) -> float:
+    code = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.split()[-1])
+
+
+def _get(url: str) -> None:
+    with urllib.request.urlopen(url, timeout=TIMEOUT) as response:
+        response.read()
+
+
+def _cold_start(text_url: str, scan_url: str, env: dict) -> dict:
+    """
+    Start a server, time its first text and first OCR extraction, and stop it
+    """
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        # Poll until the server listens; the first answered request is the measurement
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {process.returncode}")
+            if time.perf_counter() - start > TIMEOUT:
+                raise RuntimeError("Server did not answer in time")
+            try:
+                _get(f"{base}/extract/{text_url}")
+                break
+            except urllib.error.HTTPError:
+                raise
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.005)
+        first_response = time.perf_counter() - start
+
+        ocr_start = time.perf_counter()
+        _get(f"{base}/extract/{scan_url}")
+        first_ocr = time.perf_counter() - ocr_start
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {"first_response_seconds": first_response, "first_ocr_seconds": first_ocr}
+
+
+def measure(base_url: str, corpus_dir: str, repeat: int = 3) -> dict:
+    """
+    Median cold start timings without and with OCR warm-up
+
+    Args:
+        base_url: Where corpus_dir is served
+        corpus_dir: Corpus directory, the one-page fixtures are added to it
+
+    The environment must already point the backend at a fake Vision server.
+    """
+    paths = corpus.build(corpus_dir, list(corpus.PAGES))
+    text_url = f"{base_url}/{os.path.basename(paths['text-page'])}"
+    scan_url = f"{base_url}/{os.path.basename(paths['scanned-page'])}"
+    env = dict(os.environ, CACHE_DIR="", OCR_CACHE_DIR="")
+
+    results = {"import_seconds": round(statistics.median(_import_seconds(env) for _ in range(repeat)), 3)}
+    for name, warmup in (("cold", "0"), ("warmup", "1")):
+        runs = [_cold_start(text_url, scan_url, dict(env, OCR_WARMUP=warmup)) for _ in range(repeat)]
+        results[name] = {
+            stat: round(statistics.median(run[stat] for run in runs), 3)
+            for stat in ("first_response_seconds", "first_ocr_seconds")
+        }
+    return results
+
+
+def format_report(startup: dict, baseline: dict = None) -> str:
+    line = (f"startup: import {startup['import_seconds']:.2f}s, "
+            f"first /extract {startup['cold']['first_response_seconds']:.2f}s, "
+            f"first OCR {startup['cold']['first_ocr_seconds']:.2f}s "
+            f"({startup['warmup']['first_ocr_seconds']:.2f}s with OCR_WARMUP=1)")
+    if baseline:
+        change = startup["cold"]["first_response_seconds"] / baseline["cold"]["first_response_seconds"] - 1
+        line += f"  [{change:+.0%} first /extract]"
+    return line
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus-dir", default=os.path.join(tempfile.gettempdir(), "pdf-benchmark-corpus"))
+    parser.add_argument("--repeat", type=int, default=3, help="cold starts per mode, the median is reported")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    server = corpus.serve_directory(args.corpus_dir)
+    vision = fake_vision.serve()
+    os.environ.update({
+        "GOOGLE_API_KEY": os.environ.get("GOOGLE_API_KEY") or "benchmark",
+        "GOOGLE_VISION_ENDPOINT": f"http://127.0.0.1:{vision.server_port}",
+        "GOOGLE_VISION_TRANSPORT": "rest",
+    })
+    try:
+        startup = measure(f"http://127.0.0.1:{server.server_port}", args.corpus_dir, args.repeat)
+    finally:
+        server.shutdown()
+        vision.shutdown()
+
+    print(format_report(startup))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(startup, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
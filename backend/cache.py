@@ -0,0 +1,487 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Optional, Tuple
+
+import orjson
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _dumps(value: Any) -> bytes:
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+
+class MemoryLRU:
+    """
+    Thread-safe in-memory LRU store bounded by the total size of its entries
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()  # key -> (value, size)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str, value: Any, size: int) -> None:
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskLRU:
+    """
+    Thread-safe on-disk LRU store of byte blobs, one file per key, bounded by total file size
+
+    Recency is tracked in memory and seeded from file modification times on startup,
+    so the cache survives restarts when the directory is on a persistent volume.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()  # key -> size
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        existing = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.startswith(".") or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            existing.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(existing):
+            self._entries[name] = size
+            self.size += size
+
+    def path(self, key: str) -> str:
+        # Keys are hashed so arbitrary strings (URLs) map to safe file names
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.path(key)
+        name = os.path.basename(path)
+        with self._lock:
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            with self._lock:
+                self.size -= self._entries.pop(name, 0)
+            return None
+
+    def get_path(self, key: str) -> Optional[str]:
+        """
+        Return the file backing key, marking it recently used, or None if absent
+
+        Readers that already opened the file keep a valid handle if the entry is evicted.
+        """
+        path = self.path(key)
+        name = os.path.basename(path)
+        with self._lock:
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+        try:
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            with self._lock:
+                self.size -= self._entries.pop(name, 0)
+            return None
+
+    def temp_file(self) -> Tuple[int, str]:
+        """
+        Create a temporary file inside the cache directory for put_file(); returns (fd, path)
+        """
+        return tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+
+        # Write to a temporary file first so readers never see a partial entry
+        fd, tmp_path = self.temp_file()
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        self.put_file(key, tmp_path)
+
+    def put_file(self, key: str, src_path: str) -> None:
+        """
+        Move a finished file from temp_file() into the cache under key
+        """
+        size = os.path.getsize(src_path)
+        if size > self.max_bytes:
+            os.remove(src_path)
+            return
+        path = self.path(key)
+        name = os.path.basename(path)
+        os.replace(src_path, path)
+
+        with self._lock:
+            self.size -= self._entries.pop(name, 0)
+            self._entries[name] = size
+            self.size += size
+            while self.size > self.max_bytes:
+                evicted, evicted_size = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+                try:
+                    os.remove(os.path.join(self.directory, evicted))
+                except FileNotFoundError:
+                    pass
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class EntryWriter:
+    """
+    Writes a cache entry of the form {**header, "pages": [...], **trailer} one
+    page at a time, so a streamed document is never held in memory as a whole
+
+    The entry is spooled to a temporary file and stored by commit(), which
+    takes the fields only known once all pages are written; discard() drops it.
+    """
+
+    def __init__(self, cache: "ExtractionCache", key: str, header: dict):
+        self.cache = cache
+        self.key = key
+        fd, self.path = tempfile.mkstemp(dir=cache.disk.directory if cache.disk is not None else None, prefix=".tmp-")
+        self._file = os.fdopen(fd, "wb")
+        self._file.write(_dumps(header)[:-1] + (b',"pages":[' if header else b'"pages":['))
+        self._pages = 0
+
+    def add(self, page: Any) -> None:
+        if self._pages:
+            self._file.write(b",")
+        self._file.write(_dumps(page))
+        self._pages += 1
+
+    def commit(self, trailer: Optional[dict] = None) -> None:
+        self._file.write(b"]," + _dumps(trailer)[1:] if trailer else b"]}")
+        self._file.close()
+        self.cache.put_file(self.key, self.path)
+
+    def discard(self) -> None:
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class ExtractionCache:
+    """
+    Two-tier cache of extraction results keyed by the hash of the PDF bytes
+
+    A secondary index maps a URL plus its ETag/Last-Modified validators to the
+    content key, so a repeat request can be answered before the body is downloaded.
+    Concurrent misses for the same key share one computation.
+    """
+
+    def __init__(self, memory_bytes: int, disk_dir: Optional[str], disk_bytes: int):
+        self.memory = MemoryLRU(memory_bytes)
+        self.disk = DiskLRU(disk_dir, disk_bytes) if disk_dir else None
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "url_hits": 0,
+            "revalidated": 0,
+            "misses": 0,
+            "coalesced": 0
+        }
+        self._inflight = {}
+        self._downloads = {}  # url key -> Future set once that version of the URL is extracted
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def content_key(sha256: str, version: str) -> str:
+        """
+        Cache key for a document given the hex sha256 of its bytes and the extractor version
+        """
+        return f"{sha256}:{version}"
+
+    def count(self, stat: str) -> None:
+        with self._lock:
+            self.stats[stat] += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Look up a result in memory, then on disk (promoting disk hits to memory)
+        """
+        data = self.memory.get(key)
+        if data is not None:
+            self.count("memory_hits")
+            return orjson.loads(data)
+
+        if self.disk is not None:
+            data = self.disk.get(key)
+            if data is not None:
+                self.memory.put(key, data, len(data))
+                self.count("disk_hits")
+                return orjson.loads(data)
+
+        return None
+
+    def put(self, key: str, value: Any) -> None:
+        # Both tiers hold the serialized bytes, so the memory tier's size is exact
+        data = _dumps(value)
+        self.memory.put(key, data, len(data))
+        if self.disk is not None:
+            self.disk.put(key, data)
+
+    def writer(self, key: str, header: dict) -> "EntryWriter":
+        """
+        Start writing an entry whose "pages" arrive one at a time, see EntryWriter
+        """
+        return EntryWriter(self, key, header)
+
+    def put_file(self, key: str, path: str) -> None:
+        """
+        Store a serialized entry from a file made by EntryWriter, taking ownership of the file
+
+        Entries go to the disk tier only, they are promoted to memory when
+        read; without a disk tier they are read into memory.
+        """
+        if self.disk is not None:
+            self.disk.put_file(key, path)
+            return
+        try:
+            if os.path.getsize(path) <= self.memory.max_bytes:
+                with open(path, "rb") as f:
+                    data = f.read()
+                self.memory.put(key, data, len(data))
+        finally:
+            os.remove(path)
+
+    def claim(self, key: str) -> Tuple[Future, bool]:
+        """
+        Return the in-flight future for key and whether the caller owns (must compute) it
+
+        The owner sets the future's result or exception once the value is
+        cached and then calls release(key).
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                return future, False
+            future = self._inflight[key] = Future()
+            self.stats["misses"] += 1
+            return future, True
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            del self._inflight[key]
+
+    def inflight(self, key: str) -> Optional[Future]:
+        """
+        Return the future of a computation of key that is in progress, if any
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+            return future
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        Return the cached value for key, or compute and store it
+
+        If another thread is already computing the same key, wait for its
+        result instead of starting a second computation.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        future, owner = self.claim(key)
+        if not owner:
+            return future.result()
+
+        try:
+            value = compute()
+            self.put(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self.release(key)
+
+    async def get_or_compute_async(self, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        Async variant of get_or_compute: compute and cache I/O run in worker
+        threads, and coalesced callers await the owner's result without holding a thread
+        """
+        value = await asyncio.to_thread(self.get, key)
+        if value is not None:
+            return value
+
+        future, owner = self.claim(key)
+        if not owner:
+            # Shielded so a waiter that goes away does not cancel the owner's future
+            return await asyncio.shield(asyncio.wrap_future(future))
+
+        try:
+            value = await asyncio.to_thread(compute)
+            await asyncio.to_thread(self.put, key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self.release(key)
+
+    @staticmethod
+    def _url_key(url: str, etag: Optional[str], last_modified: Optional[str]) -> str:
+        return f"url:{url}\n{etag or ''}\n{last_modified or ''}"
+
+    def lookup_url(self, url: str, etag: Optional[str], last_modified: Optional[str]) -> Optional[str]:
+        """
+        Return the content key last seen for a URL with unchanged validators
+
+        Responses without an ETag or Last-Modified header are never looked up
+        by URL, since there is no way to tell whether the content changed.
+        """
+        if not etag and not last_modified:
+            return None
+
+        url_key = self._url_key(url, etag, last_modified)
+        key = self.memory.get(url_key)
+        if key is None and self.disk is not None:
+            data = self.disk.get(url_key)
+            key = data.decode() if data is not None else None
+
+        if key is not None:
+            self.count("url_hits")
+        return key
+
+    def claim_url(self, url: str, etag: Optional[str], last_modified: Optional[str]) -> Tuple[Optional[Future], bool]:
+        """
+        Claim the download of one version of a URL, so concurrent requests for
+        it can wait for the first one's result instead of downloading it again
+
+        Returns:
+            Tuple of (future, owner). The owner calls release_url() once its
+            result is cached and indexed, which sets the future the others
+            await. Responses without validators cannot be told apart and are
+            always owned, with no future.
+        """
+        if not etag and not last_modified:
+            return None, True
+        url_key = self._url_key(url, etag, last_modified)
+        with self._lock:
+            future = self._downloads.get(url_key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                return future, False
+            self._downloads[url_key] = Future()
+            return None, True
+
+    def release_url(self, url: str, etag: Optional[str], last_modified: Optional[str]) -> None:
+        with self._lock:
+            future = self._downloads.pop(self._url_key(url, etag, last_modified), None)
+        if future is not None:
+            future.set_result(None)
+
+    @staticmethod
+    def _latest_key(url: str) -> str:
+        return f"latest:{url}"
+
+    def latest_version(self, url: str) -> Optional[Tuple[str, Optional[str], Optional[str]]]:
+        """
+        Return the content key most recently indexed for a URL with the
+        ETag/Last-Modified it was served with, for revalidating it
+        """
+        value = self.memory.get(self._latest_key(url))
+        if value is None and self.disk is not None:
+            data = self.disk.get(self._latest_key(url))
+            value = data.decode() if data is not None else None
+        if value is None:
+            return None
+        key, _, validators = value.partition("\n")
+        etag, _, last_modified = validators.partition("\n")
+        return key, etag or None, last_modified or None
+
+    def latest_key(self, url: str) -> Optional[str]:
+        """
+        Return the content key most recently indexed for a URL, whatever its validators said
+        """
+        version = self.latest_version(url)
+        return version[0] if version is not None else None
+
+    def index_url(self, url: str, etag: Optional[str], last_modified: Optional[str], key: str) -> None:
+        latest_key = self._latest_key(url)
+        latest = f"{key}\n{etag or ''}\n{last_modified or ''}"
+        self.memory.put(latest_key, latest, len(latest_key) + len(latest))
+        if self.disk is not None:
+            self.disk.put(latest_key, latest.encode())
+
+        if not etag and not last_modified:
+            return
+
+        url_key = self._url_key(url, etag, last_modified)
+        self.memory.put(url_key, key, len(url_key) + len(key))
+        if self.disk is not None:
+            self.disk.put(url_key, key.encode())
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        stats.update({
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory.size,
+            "memory_evictions": self.memory.evictions
+        })
+        if self.disk is not None:
+            stats.update({
+                "disk_entries": len(self.disk),
+                "disk_bytes": self.disk.size,
+                "disk_evictions": self.disk.evictions
+            })
+        return stats
+
+
+extraction_cache = ExtractionCache(
+    memory_bytes=int(os.getenv("CACHE_MEMORY_BYTES", 256 * 1024 * 1024)),
+    disk_dir=os.getenv("CACHE_DIR", os.path.join(tempfile.gettempdir(), "pdf-extraction-cache")) or None,
+    disk_bytes=int(os.getenv("CACHE_DISK_BYTES", 2 * 1024 * 1024 * 1024))
+)
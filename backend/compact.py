@@ -0,0 +1,107 @@
+from typing import Optional, Tuple
+
+import msgpack
+import orjson
+from fastapi import HTTPException
+
+# Media types of the columnar encoding of an extraction result
+COMPACT_JSON = "application/vnd.pdf-extract.compact+json"
+MSGPACK = "application/msgpack"
+_MSGPACK_TYPES = (MSGPACK, "application/x-msgpack")
+
+FORMATS = ("json", "compact", "msgpack")
+
+
+def columnar(result: dict) -> dict:
+    """
+    Rearrange an extraction result into columns
+
+    Page size is stored once per page and method names once per document;
+    blocks refer to them by index, and bboxes are one flat [x0, y0, x1, y1, ...]
+    array. The layout:
+
+        {
+            "version": 1,
+            "text": str,
+            "methods": [str],
+            "pages": {"page": [int], "width": [float], "height": [float]},
+            "blocks": {"text": [str], "page": [int], "method": [int], "bbox": [float]}
+        }
+
+    where blocks.page indexes the pages columns and blocks.method indexes methods.
+    """
+    methods = {}
+    pages = {}
+    page_numbers, widths, heights = [], [], []
+    texts, page_indexes, method_indexes, bboxes = [], [], [], []
+
+    for block in result["blocks"]:
+        page_index = pages.get(block["page"])
+        if page_index is None:
+            page_index = pages[block["page"]] = len(pages)
+            page_numbers.append(block["page"])
+            widths.append(block["width"])
+            heights.append(block["height"])
+        method_index = methods.get(block["method"])
+        if method_index is None:
+            method_index = methods[block["method"]] = len(methods)
+
+        texts.append(block["text"])
+        page_indexes.append(page_index)
+        method_indexes.append(method_index)
+        bboxes.extend(block["bbox"])
+
+    return {
+        "version": 1,
+        "text": result["text"],
+        "methods": list(methods),
+        "pages": {"page": page_numbers, "width": widths, "height": heights},
+        "blocks": {"text": texts, "page": page_indexes, "method": method_indexes, "bbox": bboxes}
+    }
+
+
+def negotiate(format: Optional[str], accept: Optional[str]) -> str:
+    """
+    Pick the response format from the format query parameter, falling back to the Accept header
+
+    Raises:
+        HTTPException: 400 for an unknown format parameter
+    """
+    if format:
+        if format not in FORMATS:
+            raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(FORMATS)}")
+        return format
+
+    accept = (accept or "").lower()
+    if COMPACT_JSON in accept:
+        return "compact"
+    if any(media_type in accept for media_type in _MSGPACK_TYPES):
+        return "msgpack"
+    return "json"
+
+
+def encode(result: dict, format: str) -> Tuple[bytes, str]:
+    """
+    Serialize an extraction result in a compact format
+
+    Returns:
+        Tuple of (body, media_type)
+    """
+    if format == "msgpack":
+        return msgpack.packb(columnar(result), use_bin_type=True), MSGPACK
+    return orjson.dumps(columnar(result)), COMPACT_JSON
+
+
+def encode_word_index(index, format: str, extra: Optional[dict] = None) -> Tuple[bytes, str]:
+    """
+    Serialize a word_index.WordIndex, plus any extra fields; msgpack carries
+    its arrays as raw little-endian bytes (uint32 start/end/page, float32 bbox)
+
+    Returns:
+        Tuple of (body, media_type)
+    """
+    if format == "msgpack":
+        return msgpack.packb({**index.to_bytes(), **(extra or {})}, use_bin_type=True), MSGPACK
+    if format == "compact":
+        return orjson.dumps({**index.to_lists(), **(extra or {})}), COMPACT_JSON
+    return orjson.dumps({**index.to_lists(), **(extra or {})}), "application/json"
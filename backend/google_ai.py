@@ -1,166 +1,145 @@
 import io
-from typing import Optional
+from typing import List, Optional, Tuple
 from google.cloud import vision
 from google.cloud.vision_v1 import types
+from google.api_core import exceptions as core_exceptions
 from google.api_core.client_options import ClientOptions
 from dotenv import load_dotenv
 import os
+import threading
+
+import layout
 
 load_dotenv()
 
-client_options = ClientOptions(api_key=os.getenv("GOOGLE_API_KEY"))
-client = vision.ImageAnnotatorClient(client_options=client_options)
+_client: Optional[vision.ImageAnnotatorClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> vision.ImageAnnotatorClient:
+    """
+    Return the Vision client, creating it (and its channel) on first use
+
+    GOOGLE_VISION_ENDPOINT points the client at another server, e.g. a local fake
+    with GOOGLE_VISION_ENDPOINT=http://127.0.0.1:9090 and GOOGLE_VISION_TRANSPORT=rest
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            client_options = ClientOptions(
+                api_key=os.getenv("GOOGLE_API_KEY"),
+                api_endpoint=os.getenv("GOOGLE_VISION_ENDPOINT") or None
+            )
+            _client = vision.ImageAnnotatorClient(
+                client_options=client_options,
+                transport=os.getenv("GOOGLE_VISION_TRANSPORT", "grpc")
+            )
+        return _client
+
+
+# Errors that are worth retrying with backoff
+TRANSIENT_ERRORS = (
+    core_exceptions.ServiceUnavailable,
+    core_exceptions.TooManyRequests,
+    core_exceptions.InternalServerError,
+    core_exceptions.DeadlineExceeded,
+    core_exceptions.GatewayTimeout,
+)
 
 class GoogleAIPDFExtractor:
     def __init__(self, file_url=None):
         self.file_url = file_url
         self.has_init = False
 
-    def should_continue_paragraph(self, prev_line, curr_line):
-        """
-        Determine if the current line should continue the previous paragraph
-        """
-        if not prev_line or not curr_line:
-            return False
-            
-        # Get last word of previous line and first word of current line
-        prev_text = ' '.join(block['text'] for block in prev_line)
-        curr_text = ' '.join(block['text'] for block in curr_line)
-        
-        # Calculate the vertical gap between lines
-        prev_bottom = max(block['bbox'][3] for block in prev_line)
-        curr_top = min(block['bbox'][1] for block in curr_line)
-        y_gap = curr_top - prev_bottom
-        
-        # If the gap is too large, it's definitely a new paragraph
-        if y_gap > 30:
-            return False
-            
-        # Check for sentence continuation indicators
-        prev_ends_sentence = prev_text.strip().endswith(('.', '!', '?', ':'))
-        curr_starts_capital = curr_text.strip() and curr_text.strip()[0].isupper()
-        curr_starts_list = curr_text.strip().startswith(('•', '-', '*')) or \
-                          any(curr_text.strip().startswith(f"{n}.") for n in range(1, 10))
-        
-        # Continue paragraph if:
-        # 1. Small gap AND
-        # 2. Not end of sentence OR next line doesn't start with capital
-        # 3. Not a list item
-        return (y_gap <= 20 and 
-                (not prev_ends_sentence or not curr_starts_capital) and
-                not curr_starts_list)
-
-    def get_text_with_bboxes(self, page_img_bytes, page_num: int, page_width: float, page_height: float) -> dict:
+    def get_text_with_bboxes(self, page_img_bytes, page_num: int, page_width: float, page_height: float,
+                             dpi: float = layout.LAYOUT_DPI) -> dict:
         """
         Extract text and bounding boxes from a PDF page using Google Cloud Vision API.
         """
         image = types.Image(content=page_img_bytes)
-        response = client.text_detection(image=image)
-        texts = response.text_annotations
-        
-        if not texts:
-            return {"text": "", "blocks": []}
+        response = types.AnnotateImageResponse.pb(get_client().text_detection(image=image))
+        return self.blocks_from_annotations(response.text_annotations, page_num, page_width, page_height, dpi)
+
+    def _annotate_batch(self, images: List[bytes]) -> list:
+        """
+        Send images to text detection in a single batch annotate request
+
+        Returns:
+            For each image, its raw AnnotateImageResponse protobuf message, which
+            is much cheaper to walk than the proto-plus wrapper, or the exception
+            the Vision API reported for it
+        """
+        requests = [
+            types.AnnotateImageRequest(
+                image=types.Image(content=image),
+                features=[types.Feature(type_=types.Feature.Type.TEXT_DETECTION)]
+            )
+            for image in images
+        ]
+        response = get_client().batch_annotate_images(requests=requests)
+
+        return [
+            core_exceptions.from_grpc_status(image_response.error.code, image_response.error.message)
+            if image_response.error.code else image_response
+            for image_response in types.BatchAnnotateImagesResponse.pb(response).responses
+        ]
 
-        # Get full text
-        full_text = texts[0].description
-        
-        # Create blocks from the word-level annotations
-        word_blocks = []
-        for text_block in texts[1:]:
-            vertices = [(vertex.x, vertex.y) for vertex in text_block.bounding_poly.vertices]
-            x_coords = [vertex[0] for vertex in vertices]
-            y_coords = [vertex[1] for vertex in vertices]
-            
-            word_blocks.append({
-                "text": text_block.description,
-                "bbox": [min(x_coords), min(y_coords), max(x_coords), max(y_coords)],
-                "page": page_num,
-                "width": page_width,
-                "height": page_height,
-                "method": "google"
-            })
-
-        # Sort blocks by vertical position then horizontal
-        sorted_blocks = sorted(word_blocks, key=lambda x: (x['bbox'][1], x['bbox'][0]))
-        
-        # Group words into lines
-        lines = []
-        current_line = []
-        y_threshold = 12  # slightly more lenient
-        
-        for block in sorted_blocks:
-            if not current_line:
-                current_line.append(block)
-                continue
-                
-            y_diff = abs(block['bbox'][1] - current_line[0]['bbox'][1])
-            if y_diff <= y_threshold:
-                current_line.append(block)
+    def read_batch(self, images: List[bytes]) -> list:
+        """
+        OCR several images with a single batch annotate request, without grouping the words
+
+        Returns:
+            For each image, either (text, words, boxes) with the full text, the
+            word texts and an (n, 4) array of their boxes in image pixels, or the
+            exception the Vision API reported for that image
+        """
+        results = []
+        for image_response in self._annotate_batch(images):
+            if isinstance(image_response, Exception):
+                results.append(image_response)
+            elif not image_response.text_annotations:
+                results.append(("", *layout.word_boxes([])))
             else:
-                current_line.sort(key=lambda x: x['bbox'][0])
-                lines.append(current_line)
-                current_line = [block]
-        
-        if current_line:
-            current_line.sort(key=lambda x: x['bbox'][0])
-            lines.append(current_line)
-
-        # Group lines into paragraphs with improved continuation logic
-        paragraphs = []
-        current_paragraph = []
-        
-        for i, line in enumerate(lines):
-            if not current_paragraph:
-                current_paragraph.extend(line)
-                continue
-            
-            prev_line = lines[i-1]
-            if self.should_continue_paragraph(prev_line, line):
-                current_paragraph.extend(line)
+                texts = image_response.text_annotations
+                results.append((texts[0].description, *layout.word_boxes(texts[1:])))
+        return results
+
+    def get_text_with_bboxes_batch(self, jobs: List) -> list:
+        """
+        Run OCR on several rendered pages with a single batch annotate request.
+
+        Args:
+            jobs: List of OCRJob (page_num, image, page_width, page_height)
+
+        Returns:
+            For each job, either a {"text", "blocks"} dict or the exception
+            the Vision API reported for that image
+        """
+        results = []
+        for job, image_response in zip(jobs, self._annotate_batch([job.image for job in jobs])):
+            if isinstance(image_response, Exception):
+                results.append(image_response)
             else:
-                # Finalize current paragraph
-                x0 = min(block['bbox'][0] for block in current_paragraph)
-                y0 = min(block['bbox'][1] for block in current_paragraph)
-                x1 = max(block['bbox'][2] for block in current_paragraph)
-                y1 = max(block['bbox'][3] for block in current_paragraph)
-                
-                text = ' '.join(block['text'] for block in current_paragraph)
-                # Clean up spaces and handle hyphenation
-                text = text.replace(' ,', ',').replace(' .', '.').replace(' !', '!').replace(' ?', '?')
-                text = text.replace('- ', '-').replace(' -', '-')  # Handle hyphenation
-                
-                paragraphs.append({
-                    'text': text,
-                    'page': page_num,
-                    'bbox': [x0, y0, x1, y1],
-                    'width': page_width,
-                    'height': page_height,
-                    'method': 'google'
-                })
-                
-                current_paragraph = list(line)
-
-        # Add the last paragraph
-        if current_paragraph:
-            x0 = min(block['bbox'][0] for block in current_paragraph)
-            y0 = min(block['bbox'][1] for block in current_paragraph)
-            x1 = max(block['bbox'][2] for block in current_paragraph)
-            y1 = max(block['bbox'][3] for block in current_paragraph)
-            
-            text = ' '.join(block['text'] for block in current_paragraph)
-            text = text.replace(' ,', ',').replace(' .', '.').replace(' !', '!').replace(' ?', '?')
-            text = text.replace('- ', '-').replace(' -', '-')
-            
-            paragraphs.append({
-                'text': text,
-                'page': page_num,
-                'bbox': [x0, y0, x1, y1],
-                'width': page_width,
-                'height': page_height,
-                'method': 'google'
-            })
+                results.append(self.blocks_from_annotations(
+                    image_response.text_annotations, job.page_num, job.page_width, job.page_height,
+                    job.dpi, job.origin
+                ))
+        return results
+
+    def blocks_from_annotations(self, texts, page_num: int, page_width: float, page_height: float,
+                                dpi: float = layout.LAYOUT_DPI, origin: Tuple[float, float] = (0.0, 0.0)) -> dict:
+        """
+        Group Vision word annotations into paragraph blocks.
+
+        Args:
+            texts: Vision text annotations, the full page text first and then one per word
+            dpi: Resolution the image was rendered at
+            origin: Page coordinates of the image's top-left corner
+        """
+        if not texts:
+            return {"text": "", "blocks": []}
 
         return {
-            "text": full_text,
-            "blocks": paragraphs
-        }
\ No newline at end of file
+            "text": texts[0].description,
+            "blocks": layout.paragraph_blocks(texts[1:], page_num, page_width, page_height, "google", dpi, origin)
+        }
@@ -0,0 +1,70 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Seconds to wait for the origin to accept a connection / between received chunks
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+# Concurrent requests allowed against a single origin host
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "8"))
+
+_client: Optional[httpx.AsyncClient] = None
+_host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Return the shared async HTTP client, creating it on first use
+
+    One client is shared by every request so connections to popular origins
+    are pooled and kept alive instead of being re-established per download.
+    """
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE
+            )
+        )
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _host_semaphores.clear()
+
+
+def _host_semaphore(url: str) -> asyncio.Semaphore:
+    host = urlsplit(url).netloc
+    semaphore = _host_semaphores.get(host)
+    if semaphore is None:
+        semaphore = _host_semaphores[host] = asyncio.Semaphore(HTTP_MAX_PER_HOST)
+    return semaphore
+
+
+@asynccontextmanager
+async def stream(url: str, headers: Optional[dict] = None) -> AsyncIterator[httpx.Response]:
+    """
+    Send a GET request and yield the response with its body not yet read
+
+    The per-host slot is held until the context exits, so at most
+    HTTP_MAX_PER_HOST downloads run against one origin at a time.
+    """
+    async with _host_semaphore(url):
+        async with get_client().stream("GET", url, headers=headers) as response:
+            yield response
@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from pdfextractor import PageSelection, PDFExtractor
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Jobs extracted at the same time in the background
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Jobs allowed to wait for a worker before new ones are refused
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+# Seconds a finished job and its pages are kept for the client to collect
+JOB_TTL = int(os.getenv("JOB_TTL", "900"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class Job:
+    """
+    One background extraction and the pages it has produced so far
+
+    stage is "queued", "downloading" (fetching and opening the PDF),
+    "extracting" or, once finished, the final status.
+    """
+
+    def __init__(self, url: str, selection: Optional[PageSelection] = None):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.selection = selection
+        self.status = QUEUED
+        self.stage = QUEUED
+        self.page_count: Optional[int] = None
+        self.pages_total: Optional[int] = None
+        self.pages: List[dict] = []
+        self.error: Optional[dict] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancelled = threading.Event()
+        # The task running the job, cancelled by JobManager.cancel while it downloads or waits for admission
+        self.task: Optional[asyncio.Task] = None
+
+    def finish(self, status: str, error: Optional[dict] = None) -> None:
+        self.status = self.stage = status
+        self.error = error
+        self.finished_at = time.time()
+
+    def describe(self) -> dict:
+        return {
+            "id": self.id,
+            "url": self.url,
+            "status": self.status,
+            "stage": self.stage,
+            "page_count": self.page_count,
+            "pages_total": self.pages_total,
+            "pages_done": len(self.pages),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "expires_at": self.finished_at + JOB_TTL if self.finished_at is not None else None
+        }
+
+
+class JobManager:
+    """
+    Runs extraction jobs on a bounded pool of background workers
+
+    Jobs live in this process's memory only. Each worker extracts one
+    document at a time through PDFExtractor.stream_pages, so jobs share the
+    extraction cache, the process pool and the OCR dispatcher with /extract.
+    Finished jobs are dropped JOB_TTL seconds after they end.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, queue_size: int = JOB_QUEUE_SIZE, ttl: int = JOB_TTL):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.ttl = ttl
+        self.jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        """
+        Start the workers on the running event loop
+        """
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for job in self.jobs.values():
+            job.cancelled.set()
+            if job.task is not None:
+                job.task.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, url: str, selection: Optional[PageSelection] = None) -> Job:
+        """
+        Queue a document for extraction
+
+        Raises:
+            HTTPException: 503 if JOB_QUEUE_SIZE jobs are already waiting
+        """
+        self._expire()
+        job = Job(url, selection)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise HTTPException(status_code=503, detail="Too many extraction jobs queued, try again later")
+        self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Job:
+        """
+        Raises:
+            HTTPException: 404 for unknown or expired jobs
+        """
+        self._expire()
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found or expired")
+        return job
+
+    def cancel(self, job_id: str) -> Job:
+        """
+        Stop a job; pages already extracted stay available until it expires
+
+        A job still downloading or waiting for admission is interrupted right
+        away. Once it is extracting, no page is stored after the cancellation
+        and the pages queued ahead of it are dropped.
+        """
+        job = self.get(job_id)
+        if job.status not in FINISHED:
+            job.cancelled.set()
+            if job.status == QUEUED:
+                job.finish(CANCELLED)
+            elif job.stage == "downloading" and job.task is not None:
+                job.task.cancel()
+        return job
+
+    def counts(self) -> Dict[str, int]:
+        counts = dict.fromkeys((QUEUED, RUNNING) + FINISHED, 0)
+        for job in list(self.jobs.values()):
+            counts[job.status] += 1
+        return counts
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.ttl
+        for job_id, job in list(self.jobs.items()):
+            if job.finished_at is not None and job.finished_at < cutoff:
+                del self.jobs[job_id]
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            if job.cancelled.is_set():
+                continue
+            job.task = asyncio.create_task(self._run(job))
+            # wait() rather than await, so cancelling the job does not cancel the worker
+            await asyncio.wait([job.task])
+
+    async def _run(self, job: Job) -> None:
+        job.status = RUNNING
+        job.stage = "downloading"
+        job.started_at = time.time()
+        try:
+            extractor = PDFExtractor(background=True)
+            page_count, pages = await extractor.stream_pages(job.url, job.selection)
+            try:
+                job.page_count = page_count
+                job.pages_total = len((job.selection or PageSelection()).resolve(page_count))
+                job.stage = "extracting"
+                # Cancelling the task now would leave the thread running, the thread watches job.cancelled instead
+                await asyncio.shield(asyncio.to_thread(self._collect, job, pages))
+            finally:
+                # Releases the download and admission also when cancelled before _collect took the stream
+                await asyncio.to_thread(pages.close)
+            job.finish(CANCELLED if job.cancelled.is_set() else DONE)
+        except HTTPException as e:
+            job.finish(FAILED, {"status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            logger.exception("Extraction job %s failed", job.id)
+            job.finish(FAILED, {"status_code": 500, "detail": f"Internal server error while processing PDF: {str(e)}"})
+        except asyncio.CancelledError:
+            job.finish(CANCELLED)
+            raise
+
+    @staticmethod
+    def _collect(job: Job, pages: Iterator[tuple]) -> None:
+        """
+        Store pages on the job as they are extracted, stopping as soon as it is cancelled
+        """
+        try:
+            while not job.cancelled.is_set():
+                page = next(pages, None)
+                # A page finished after the cancellation is dropped too
+                if page is None or job.cancelled.is_set():
+                    break
+                page_num, page_text, page_blocks = page
+                job.pages.append({"page": page_num, "text": page_text, "blocks": page_blocks})
+        finally:
+            # Closing the iterator cancels queued OCR and removes the download
+            close = getattr(pages, "close", None)
+            if close is not None:
+                close()
+
+
+job_manager = JobManager()
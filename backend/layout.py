@@ -0,0 +1,172 @@
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+# Thresholds below are in pixels of an image rendered at this DPI and scale with the actual render DPI
+LAYOUT_DPI = 300
+# Words whose top edge is within this many pixels of a line's first word join that line
+LINE_Y_THRESHOLD = 12
+# Largest vertical gap (in pixels) between two lines of the same paragraph
+PARAGRAPH_MAX_GAP = 20
+
+_SENTENCE_END = ('.', '!', '?', ':')
+_LIST_MARKERS = ('•', '-', '*') + tuple(f"{n}." for n in range(1, 10))
+
+
+def word_boxes(annotations: Sequence) -> Tuple[List[str], np.ndarray]:
+    """
+    Read OCR word annotations into their texts and an (n, 4) array of [x0, y0, x1, y1] boxes
+
+    Args:
+        annotations: Objects shaped like Vision's EntityAnnotation, with a
+            description and bounding_poly.vertices
+
+    Returns:
+        (words, boxes), with boxes keeping the dtype of the vertex coordinates
+    """
+    words = [annotation.description for annotation in annotations]
+    polygons = [annotation.bounding_poly.vertices for annotation in annotations]
+    counts = list(map(len, polygons))
+    xs = [vertex.x for vertices in polygons for vertex in vertices]
+    ys = [vertex.y for vertices in polygons for vertex in vertices]
+
+    if not words:
+        return words, np.empty((0, 4), dtype=np.int64)
+
+    xs, ys = np.array(xs), np.array(ys)
+    starts = np.cumsum(counts) - counts
+    boxes = np.stack([
+        np.minimum.reduceat(xs, starts),
+        np.minimum.reduceat(ys, starts),
+        np.maximum.reduceat(xs, starts),
+        np.maximum.reduceat(ys, starts)
+    ], axis=1)
+    return words, boxes
+
+
+def _line_starts(tops: np.ndarray, threshold: float) -> np.ndarray:
+    """
+    Split words sorted by top edge into lines
+
+    A line takes every following word whose top is within threshold of the
+    line's first word, so each line boundary is one binary search.
+    """
+    starts = [0]
+    start = 0
+    while True:
+        start = int(np.searchsorted(tops, tops[start] + threshold, side="right"))
+        if start >= len(tops):
+            return np.array(starts)
+        starts.append(start)
+
+
+def _clean_text(text: str) -> str:
+    # Clean up spaces and handle hyphenation
+    text = text.replace(' ,', ',').replace(' .', '.').replace(' !', '!').replace(' ?', '?')
+    return text.replace('- ', '-').replace(' -', '-')
+
+
+def group_paragraphs(words: List[str], boxes: np.ndarray, dpi: float = LAYOUT_DPI) -> Tuple[List[str], np.ndarray]:
+    """
+    Group OCR words into paragraphs in reading order
+
+    Words are sorted top to bottom, clustered into lines, ordered left to
+    right within each line, and consecutive lines are merged into a paragraph
+    when the gap between them is small, the previous line does not end a
+    sentence followed by a capitalised line, and the new line is not a list item.
+
+    Args:
+        words: Word texts
+        boxes: (n, 4) array of [x0, y0, x1, y1] word boxes in image pixels
+        dpi: Resolution the image was rendered at
+
+    Returns:
+        (texts, boxes) of the paragraphs, boxes as a (p, 4) array of [x0, y0, x1, y1]
+    """
+    if not words:
+        return [], np.empty((0, 4), dtype=boxes.dtype)
+
+    x0, y0, x1, y1 = boxes.T
+    # lexsort is stable, so words on the same spot keep their annotation order
+    order = np.lexsort((x0, y0))
+    scale = dpi / LAYOUT_DPI
+    line_starts = _line_starts(y0[order], LINE_Y_THRESHOLD * scale)
+
+    line_ids = np.zeros(len(words), dtype=np.intp)
+    line_ids[line_starts[1:]] = 1
+    line_ids = np.cumsum(line_ids)
+    order = order[np.lexsort((x0[order], line_ids))]
+
+    ordered = boxes[order]
+    ordered_words = [words[i] for i in order.tolist()]
+    line_bounds = zip(line_starts.tolist(), line_starts[1:].tolist() + [len(words)])
+    line_texts = [' '.join(ordered_words[start:stop]).strip() for start, stop in line_bounds]
+
+    line_tops = np.minimum.reduceat(ordered[:, 1], line_starts)
+    line_bottoms = np.maximum.reduceat(ordered[:, 3], line_starts)
+    ends_sentence = np.array([text.endswith(_SENTENCE_END) for text in line_texts])
+    starts_capital = np.array([bool(text) and text[0].isupper() for text in line_texts])
+    starts_list = np.array([text.startswith(_LIST_MARKERS) for text in line_texts])
+
+    # continues[i] says whether line i + 1 carries on the paragraph of line i
+    continues = (
+        (line_tops[1:] - line_bottoms[:-1] <= PARAGRAPH_MAX_GAP * scale)
+        & (~ends_sentence[:-1] | ~starts_capital[1:])
+        & ~starts_list[1:]
+    )
+    paragraph_starts = line_starts[np.concatenate(([0], np.flatnonzero(~continues) + 1))]
+
+    bboxes = np.stack([
+        np.minimum.reduceat(ordered[:, 0], paragraph_starts),
+        np.minimum.reduceat(ordered[:, 1], paragraph_starts),
+        np.maximum.reduceat(ordered[:, 2], paragraph_starts),
+        np.maximum.reduceat(ordered[:, 3], paragraph_starts)
+    ], axis=1)
+
+    bounds = zip(paragraph_starts.tolist(), paragraph_starts[1:].tolist() + [len(words)])
+    return [_clean_text(' '.join(ordered_words[start:stop])) for start, stop in bounds], bboxes
+
+
+def place_paragraphs(texts: Sequence[str], bboxes, page_num: int, page_width: float, page_height: float,
+                     method: str, dpi: float = LAYOUT_DPI, origin: Tuple[float, float] = (0.0, 0.0)) -> List[dict]:
+    """
+    Turn paragraphs found in an image of a page into blocks on that page
+
+    Args:
+        texts: Paragraph texts
+        bboxes: (p, 4) [x0, y0, x1, y1] paragraph boxes in image pixels
+        dpi: Resolution the image was rendered at
+        origin: Page coordinates of the image's top-left corner
+
+    Returns:
+        Blocks with bboxes in page coordinates (points), like the text-layer blocks
+    """
+    points = np.array(origin * 2) + np.asarray(bboxes, dtype=float).reshape(-1, 4) * (72 / dpi)
+    return [
+        {
+            'text': text,
+            'page': page_num,
+            'bbox': bbox,
+            'width': page_width,
+            'height': page_height,
+            'method': method
+        }
+        for text, bbox in zip(texts, points.tolist())
+    ]
+
+
+def paragraph_blocks(annotations: Sequence, page_num: int, page_width: float, page_height: float,
+                     method: str, dpi: float = LAYOUT_DPI, origin: Tuple[float, float] = (0.0, 0.0)) -> List[dict]:
+    """
+    Build paragraph blocks for a page from the OCR word annotations of an image of it
+
+    Args:
+        annotations: Word annotations, see word_boxes
+        dpi: Resolution the image was rendered at
+        origin: Page coordinates of the image's top-left corner
+
+    Returns:
+        Blocks with bboxes in page coordinates (points), like the text-layer blocks
+    """
+    texts, bboxes = group_paragraphs(*word_boxes(annotations), dpi)
+    return place_paragraphs(texts, bboxes, page_num, page_width, page_height, method, dpi, origin)
@@ -1,12 +1,52 @@
-from typing import List
-from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Iterator, List, Optional
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-import requests
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+import httpx
 from pydantic import BaseModel
-from pdfextractor import PDFExtractor
+import batch
+import compact
+import http_client
+import metrics
+import ocr_backends
+import page_render
+import pdfextractor
+import word_index
+from admission import admission
+from cache import extraction_cache
+from jobs import job_manager
+from pdfextractor import PAGE_SEPARATOR, PageSelection, PageStream, PDFExtractor
+from proxy_cache import proxy, proxy_cache
 
-app = FastAPI()
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+# httpx logs every upstream request at INFO, several lines per extraction
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+# Token required in X-Admin-Token by the profiling endpoints, which are disabled while it is unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Share one pooled HTTP client between all requests
+    http_client.get_client()
+    job_manager.start()
+    if ocr_backends.OCR_WARMUP:
+        # Off the startup path, so requests are served while the OCR SDK loads
+        app.state.ocr_warm_up = asyncio.create_task(asyncio.to_thread(ocr_backends.warm_up))
+    yield
+    await job_manager.stop()
+    await http_client.close_client()
+
+app = FastAPI(lifespan=lifespan)
+
+app.add_middleware(metrics.MetricsMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -14,6 +54,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let the PDF viewer read the headers it needs for range requests
+    expose_headers=["Accept-Ranges", "Content-Range", "Content-Length", "ETag"],
 )
 
 class TextBlock(BaseModel):
@@ -28,6 +70,16 @@ class PDFResponse(BaseModel):
     text: str
     blocks: List[TextBlock]
 
+class JobRequest(BaseModel):
+    url: str
+    pages: Optional[str] = None
+    cursor: Optional[int] = None
+    count: Optional[int] = None
+
+class BatchRequest(BaseModel):
+    # Each document takes the same fields as a job
+    documents: List[JobRequest]
+
 def fix_url(url: str) -> str:
     """
     Fix URL if it has a single slash after protocol
@@ -36,71 +88,73 @@ def fix_url(url: str) -> str:
     # Check for the common Azure issue with https:/ instead of https://
     if url.startswith("https:/") and not url.startswith("https://"):
         fixed_url = "https://" + url[7:]
-        print(f"Fixed URL from {url} to {fixed_url}")
+        logger.debug("Fixed URL from %s to %s", url, fixed_url)
         return fixed_url
     
     # Check for the same issue with http:/
     if url.startswith("http:/") and not url.startswith("http://"):
         fixed_url = "http://" + url[6:]
-        print(f"Fixed URL from {url} to {fixed_url}")
+        logger.debug("Fixed URL from %s to %s", url, fixed_url)
         return fixed_url
         
     return url
 
 @app.get("/proxy-pdf/{url:path}")
-async def proxy_pdf(url: str):
+async def proxy_pdf(url: str, request: Request):
     """
     Proxy endpoint to serve PDFs with proper CORS headers
+
+    PDFs are kept in a local disk cache and revalidated upstream with
+    ETag/Last-Modified, and byte-range and conditional requests are
+    answered from the cache so the viewer can load large files partially.
     """
     try:
         # Fix URL if needed
         url = fix_url(url)
         
-        print(f"Attempting to fetch PDF from: {url}")  # Debug logging
+        logger.debug("Attempting to fetch PDF from: %s", url)
         
-        response = requests.get(
-            url, 
-            stream=True,
-        )        
-        # Log response details
-        print(f"Response status: {response.status_code}")
-        print(f"Response headers: {dict(response.headers)}")
-        
-        response.raise_for_status()
-        
-        return StreamingResponse(
-            response.iter_content(chunk_size=8192),
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"inline; filename=document.pdf",
-                "Content-Type": "application/pdf",
-                "Access-Control-Allow-Origin": "http://localhost:3000"
-            }
-        )
-    except requests.RequestException as e:
-        print(f"Request error: {str(e)}")  # Debug logging
+        return await proxy(url, request.headers)
+    except HTTPException:
+        raise
+    except httpx.HTTPError as e:
+        logger.warning("Request error for %s: %s", url, e)
         raise HTTPException(
             status_code=500, 
             detail=f"Failed to fetch PDF: {str(e)}"
         )
     except Exception as e:
-        print(f"Unexpected error: {str(e)}")  # Debug logging
+        logger.exception("Unexpected error proxying %s", url)
         raise HTTPException(
             status_code=500, 
             detail=f"Unexpected error: {str(e)}"
         )
 
 @app.get("/extract/{url:path}", response_model=PDFResponse)
-async def extract(url: str):
+async def extract(url: str, request: Request, pages: Optional[str] = None, cursor: Optional[int] = None,
+                  count: Optional[int] = None, format: Optional[str] = None):
     """
     Extract text from a PDF URL
+
+    Only part of the document is processed when pages (e.g. 10-40, 0-based and
+    inclusive) or cursor/count are given.
+
+    format=compact (or Accept: application/vnd.pdf-extract.compact+json) and
+    format=msgpack (or Accept: application/msgpack) return the columnar layout
+    described in compact.columnar, serialized without per-block validation.
     """
     try:
         # Fix URL if needed
         url = fix_url(url)
+        selection = PageSelection.parse(pages, cursor, count)
+        response_format = compact.negotiate(format, request.headers.get("Accept"))
         
         extractor = PDFExtractor()
-        result = extractor.extract(url)
+        result = await extractor.extract(url, selection)
+
+        if response_format != "json":
+            body, media_type = compact.encode(result, response_format)
+            return Response(body, media_type=media_type, headers={"Vary": "Accept"})
         
         return PDFResponse(
             text=result["text"],
@@ -113,3 +167,364 @@ async def extract(url: str):
             status_code=500,
             detail=f"Unexpected error: {str(e)}"
         ) from e
+
+
+def _format_record(record: dict, fmt: str) -> str:
+    """
+    Serialize one streamed record as an NDJSON line or a Server-Sent Event
+    """
+    data = json.dumps(record)
+    if fmt == "sse":
+        return f"event: {record['type']}\ndata: {data}\n\n"
+    return data + "\n"
+
+def _stream_records(page_count: int, selection: Optional[PageSelection], pages: Iterator[tuple],
+                    fmt: str) -> Iterator[str]:
+    """
+    Yield a record for each page as it is processed, followed by a summary record
+    """
+    block_count = 0
+    try:
+        for page_num, page_text, page_blocks in pages:
+            block_count += len(page_blocks)
+            yield _format_record({
+                "type": "page",
+                "page": page_num,
+                "text": page_text,
+                "blocks": page_blocks
+            }, fmt)
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band
+        yield _format_record({
+            "type": "error",
+            "detail": f"Internal server error while processing PDF: {str(e)}"
+        }, fmt)
+        return
+
+    selected = (selection or PageSelection()).resolve(page_count)
+    yield _format_record({
+        "type": "summary",
+        "page_count": page_count,
+        "pages": [selected.start, selected.stop],
+        "block_count": block_count,
+        "separator": PAGE_SEPARATOR
+    }, fmt)
+
+class PageStreamResponse(StreamingResponse):
+    """
+    Streams records made from a PageStream and closes the stream once the
+    response is over, also when the client went away before the first page
+    """
+
+    def __init__(self, pages: PageStream, content: Iterator[str], **kwargs):
+        super().__init__(content, **kwargs)
+        self.pages = pages
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # In a thread, it waits for a page still being extracted for the response
+            await asyncio.to_thread(self.pages.close)
+
+@app.get("/extract-stream/{url:path}")
+async def extract_stream(url: str, format: str = "ndjson", pages: Optional[str] = None,
+                         cursor: Optional[int] = None, count: Optional[int] = None):
+    """
+    Extract text from a PDF URL, streaming each page as soon as it is processed
+
+    Pages are sent in order as NDJSON lines (default) or Server-Sent Events
+    (format=sse), followed by a summary record. Joining the page texts with
+    the summary's separator gives the same text as /extract before cleanup.
+    Accepts the same page selection parameters as /extract.
+    """
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'")
+
+    url = fix_url(url)
+    selection = PageSelection.parse(pages, cursor, count)
+
+    extractor = PDFExtractor()
+    page_count, page_iter = await extractor.stream_pages(url, selection)
+
+    return PageStreamResponse(
+        page_iter, _stream_records(page_count, selection, page_iter, format),
+        media_type="text/event-stream" if format == "sse" else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+async def _stream_batch(documents: List[batch.BatchDocument], fmt: str) -> AsyncIterator[str]:
+    """
+    Yield a record for each document as it finishes, in completion order, followed by a summary record
+    """
+    start = time.perf_counter()
+    failed = 0
+    async for record in batch.extract_batch(documents):
+        failed += record["type"] == "error"
+        yield _format_record(record, fmt)
+    yield _format_record({
+        "type": "summary",
+        "documents": len(documents),
+        "failed": failed,
+        "seconds": round(time.perf_counter() - start, 3)
+    }, fmt)
+
+@app.post("/extract-batch")
+async def extract_batch(batch_request: BatchRequest, format: str = "ndjson"):
+    """
+    Extract many PDFs in one request, streaming each document's result as soon as it is done
+
+    Takes {"documents": [{"url", "pages", "cursor", "count"}, ...]} with the
+    page selection parameters of /extract. Documents are extracted
+    BATCH_CONCURRENCY at a time on the shared download client, worker pool
+    and OCR dispatcher. Each finished document is sent as an NDJSON line
+    (default) or Server-Sent Event (format=sse) with its index in the
+    request and the /extract text and blocks. A document that fails gets an
+    error record with its status_code and detail, and the others carry on.
+    A summary record comes last.
+    """
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'")
+    if not 0 < len(batch_request.documents) <= batch.BATCH_MAX_DOCUMENTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"documents must hold between 1 and {batch.BATCH_MAX_DOCUMENTS} entries"
+        )
+
+    documents = [
+        batch.BatchDocument(fix_url(document.url), document.pages, document.cursor, document.count)
+        for document in batch_request.documents
+    ]
+    return StreamingResponse(
+        _stream_batch(documents, format),
+        media_type="text/event-stream" if format == "sse" else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+@app.get("/metadata/{url:path}")
+async def metadata(url: str, pages: Optional[str] = None, cursor: Optional[int] = None,
+                   count: Optional[int] = None):
+    """
+    Page count of a PDF plus, for each selected page, its size and whether
+    it has a text layer or needs OCR. No page is OCR'd, so this is cheap
+    enough to call before fetching pages lazily with /extract?pages=...
+    Accepts the same page selection parameters as /extract; a large
+    document is best described a window at a time.
+    """
+    url = fix_url(url)
+    selection = PageSelection.parse(pages, cursor, count)
+
+    extractor = PDFExtractor()
+    return await extractor.metadata(url, selection)
+
+@app.get("/render/{url:path}")
+async def render(url: str, request: Request, page: int = 0, scale: float = 1.0, thumbnail: bool = False,
+                 format: str = "jpeg"):
+    """
+    Image of one page of a PDF (0-based), so viewers on slow machines do not have to render it
+
+    scale=1 renders at 72 DPI (one pixel per PDF point); thumbnail=true
+    renders a RENDER_THUMBNAIL_WIDTH pixels wide thumbnail instead. format
+    is jpeg, png or webp. Images are cached in memory and on disk and carry
+    an ETag, so If-None-Match requests are answered with 304; the next
+    RENDER_PREFETCH pages are rendered in the background.
+    """
+    if format not in page_render.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(page_render.MEDIA_TYPES)}")
+    if page < 0 or not 0 < scale <= page_render.RENDER_MAX_SCALE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"page must be >= 0 and scale between 0 and {page_render.RENDER_MAX_SCALE:g}"
+        )
+    url = fix_url(url)
+
+    # Scales are rounded so near-identical zoom levels share cached images
+    return await page_render.render(url, page, None if thumbnail else round(scale, 2), format, request.headers)
+
+@app.get("/words/{url:path}")
+async def words(url: str, request: Request, pages: Optional[str] = None, cursor: Optional[int] = None,
+                count: Optional[int] = None, start: Optional[int] = None, end: Optional[int] = None,
+                offset: int = 0, limit: int = word_index.WORDS_PAGE_SIZE, format: Optional[str] = None):
+    """
+    Map character offsets in the /extract text (for the same page selection) to word boxes
+
+    Returns parallel arrays {"start", "end", "page", "bbox"} of word spans,
+    sorted by offset, with bbox flat in PDF points (four numbers per span), so
+    a selection is resolved with a binary search over start/end. Text from OCR
+    has one span per block. format=msgpack sends the arrays as raw
+    little-endian uint32/float32 bytes.
+
+    Responses hold at most limit spans (WORDS_PAGE_SIZE at most), starting at
+    span offset; "total" is the number of spans and "next_offset" the offset
+    of the next request, null after the last one. The character offsets always
+    refer to the whole text.
+
+    With start and end, returns the highlight rectangles of the characters
+    [start, end) instead, one per line: {"rects": [{"page", "bbox"}]}.
+    """
+    url = fix_url(url)
+    selection = PageSelection.parse(pages, cursor, count)
+    if (start is None) != (end is None) or (start is not None and not 0 <= start < end):
+        raise HTTPException(status_code=400, detail="start and end must be given together with 0 <= start < end")
+    if offset < 0 or not 1 <= limit <= word_index.WORDS_PAGE_SIZE:
+        raise HTTPException(
+            status_code=400, detail=f"offset must be >= 0 and limit between 1 and {word_index.WORDS_PAGE_SIZE}"
+        )
+    response_format = compact.negotiate(format, request.headers.get("Accept"))
+
+    extractor = PDFExtractor()
+    index = await extractor.word_index(url, selection)
+
+    if start is not None:
+        return {"rects": index.rects(start, end)}
+    next_offset = offset + limit if offset + limit < len(index) else None
+    body, media_type = compact.encode_word_index(
+        index.slice(offset, limit), response_format,
+        {"offset": offset, "next_offset": next_offset, "total": len(index)}
+    )
+    return Response(body, media_type=media_type, headers={"Vary": "Accept"})
+
+@app.get("/search/{url:path}")
+async def search(url: str, q: str, limit: int = 20):
+    """
+    Ranked blocks of a PDF matching a query, with their page and bbox
+
+    All words of q must appear in a block; "quoted phrases" must appear in
+    order. Each hit's block is its index in the /extract blocks. The index is
+    cached with the document, so searches after the first extraction take
+    milliseconds whatever the document length.
+    """
+    if not q.strip() or limit < 1:
+        raise HTTPException(status_code=400, detail="q must not be empty and limit must be >= 1")
+    url = fix_url(url)
+
+    extractor = PDFExtractor()
+    return dict(await extractor.search(url, q, limit), query=q)
+
+@app.post("/jobs", status_code=202)
+async def create_job(job_request: JobRequest):
+    """
+    Start extracting a PDF in the background and return the job's status
+
+    For documents too large to extract within a request timeout: poll
+    GET /jobs/{id} for progress and collect finished pages from
+    GET /jobs/{id}/pages. Accepts the same page selection as /extract.
+    """
+    url = fix_url(job_request.url)
+    selection = PageSelection.parse(job_request.pages, job_request.cursor, job_request.count)
+    return job_manager.submit(url, selection).describe()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Status of an extraction job: pages done out of pages_total and the current stage
+    """
+    return job_manager.get(job_id).describe()
+
+@app.get("/jobs/{job_id}/pages")
+async def get_job_pages(job_id: str, cursor: int = 0, limit: int = 100):
+    """
+    Pages a job has finished so far, in page order
+
+    cursor is the number of pages already collected; pass the returned
+    next_cursor to fetch the following ones. Once status is done and
+    next_cursor equals pages_done, the document is complete, and joining
+    the page texts with separator gives the /extract text before cleanup.
+    """
+    if cursor < 0 or limit < 1:
+        raise HTTPException(status_code=400, detail="cursor must be >= 0 and limit >= 1")
+    job = job_manager.get(job_id)
+    pages = job.pages[cursor:cursor + limit]
+    return {
+        "status": job.status,
+        "pages": pages,
+        "next_cursor": cursor + len(pages),
+        "pages_done": len(job.pages),
+        "separator": PAGE_SEPARATOR
+    }
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """
+    Cancel an extraction job; pages finished before it stopped can still be collected
+    """
+    return job_manager.cancel(job_id).describe()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Hit/miss counters and sizes of the extraction result cache
+    """
+    stats = extraction_cache.get_stats()
+    stats["proxy"] = dict(proxy_cache.stats, entries=len(proxy_cache.store), bytes=proxy_cache.store.size)
+    return stats
+
+
+def _collect_stats() -> list:
+    """
+    Cache and OCR dispatcher counters that are kept by their owners, read at scrape time
+    """
+    samples = []
+    for name, value in extraction_cache.get_stats().items():
+        kind = "gauge" if name.endswith(("_entries", "_bytes")) else "counter"
+        samples.append((f"extraction_cache_{name}" + ("_total" if kind == "counter" else ""), kind, {}, value))
+    for name, value in proxy_cache.stats.items():
+        samples.append(("proxy_cache_requests_total", "counter", {"result": name}, value))
+    samples.append(("proxy_cache_entries", "gauge", {}, len(proxy_cache.store)))
+    samples.append(("proxy_cache_bytes", "gauge", {}, proxy_cache.store.size))
+    for name, value in page_render.renderer.get_stats().items():
+        kind = "gauge" if name.endswith(("_entries", "_bytes", "_documents")) else "counter"
+        samples.append((f"render_{name}" + ("_total" if kind == "counter" else ""), kind, {}, value))
+    for name, value in admission.get_stats().items():
+        samples.append((f"admission_{name}", "gauge", {}, value))
+    for status, count in job_manager.counts().items():
+        samples.append(("extraction_jobs", "gauge", {"status": status}, count))
+    dispatcher = pdfextractor._ocr_dispatcher
+    if dispatcher is not None:
+        for name, value in dispatcher.stats.items():
+            samples.append((f"ocr_{name}_total", "counter", {}, value))
+    ocr = ocr_backends._ocr
+    if ocr is not None:
+        for name, value in ocr.get_stats().items():
+            if name in ("hits", "misses"):
+                samples.append(("ocr_cache_lookups_total", "counter", {"result": name}, value))
+            else:
+                samples.append((f"ocr_cache_{name}", "gauge", {}, value))
+    return samples
+
+metrics.registry.register_collector(_collect_stats)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Counters and latency histograms in the Prometheus text format
+
+    stage_* series cover the processing stages (download, parse, extract,
+    render, ocr, ocr_wait), including work done in the worker processes.
+    """
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+def _require_admin(token: Optional[str]) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Profiling endpoints are disabled, set ADMIN_TOKEN")
+    if token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.put("/metrics/profiling")
+async def set_profiling(sample_rate: float, x_admin_token: Optional[str] = Header(None)):
+    """
+    Change the fraction of requests whose stage spans are recorded, without a restart
+
+    sample_rate=0 turns profiling off and 1 profiles every request.
+    """
+    _require_admin(x_admin_token)
+    metrics.set_sample_rate(sample_rate)
+    return {"sample_rate": metrics.get_sample_rate()}
+
+@app.get("/metrics/profiles")
+async def get_profiles(x_admin_token: Optional[str] = Header(None)):
+    """
+    The most recent sampled requests with the timing of each stage span
+    """
+    _require_admin(x_admin_token)
+    return {"sample_rate": metrics.get_sample_rate(), "profiles": list(metrics.profiles)}
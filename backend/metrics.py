@@ -0,0 +1,284 @@
+import bisect
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Fraction of requests whose spans are recorded as a per-request profile; can be changed at runtime
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Profiles kept in memory for /metrics/profiles
+PROFILE_HISTORY = int(os.getenv("PROFILE_HISTORY", "50"))
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Label sets are stored as sorted (name, value) tuples
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_value(value: float) -> str:
+    # Byte counters outgrow the precision of the %g format
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Registry:
+    """
+    Thread-safe counters and latency histograms, rendered in the Prometheus text format
+
+    Worker processes record into their own registry and hand drain() snapshots
+    back to the parent, which merge()s them, so /metrics covers work done anywhere.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, list]] = {}  # -> [bucket counts..., sum, count]
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[[], list]] = []
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = _labels(labels)
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            values = series.get(key)
+            if values is None:
+                values = series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                values[index] += 1
+            values[-2] += seconds
+            values[-1] += 1
+
+    def register_collector(self, collect: Callable[[], list]) -> None:
+        """
+        Add a callback returning [(name, type, labels dict, value)] read at render time,
+        for values that live elsewhere (cache sizes, dispatcher stats)
+        """
+        self._collectors.append(collect)
+
+    def drain(self) -> dict:
+        """
+        Return everything recorded so far and reset the registry
+        """
+        with self._lock:
+            snapshot = {"counters": self._counters, "histograms": self._histograms}
+            self._counters, self._histograms = {}, {}
+        return snapshot
+
+    def merge(self, snapshot: dict) -> None:
+        with self._lock:
+            for name, series in snapshot["counters"].items():
+                target = self._counters.setdefault(name, {})
+                for key, value in series.items():
+                    target[key] = target.get(key, 0) + value
+            for name, series in snapshot["histograms"].items():
+                target = self._histograms.setdefault(name, {})
+                for key, values in series.items():
+                    if key in target:
+                        target[key] = [a + b for a, b in zip(target[key], values)]
+                    else:
+                        target[key] = list(values)
+
+    @staticmethod
+    def _format_labels(key: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(key) + ([extra] if extra else [])
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+    def render(self) -> str:
+        lines = []
+
+        def header(name: str, kind: str) -> None:
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {k: list(v) for k, v in series.items()} for name, series in self._histograms.items()}
+
+        for name in sorted(counters):
+            header(name, "counter")
+            for key, value in sorted(counters[name].items()):
+                lines.append(f"{name}{self._format_labels(key)} {_format_value(value)}")
+
+        for name in sorted(histograms):
+            header(name, "histogram")
+            for key, values in sorted(histograms[name].items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, values):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._format_labels(key, ('le', f'{bound:g}'))} {cumulative}")
+                lines.append(f"{name}_bucket{self._format_labels(key, ('le', '+Inf'))} {values[-1]}")
+                lines.append(f"{name}_sum{self._format_labels(key)} {_format_value(values[-2])}")
+                lines.append(f"{name}_count{self._format_labels(key)} {values[-1]}")
+
+        collected = {}
+        for collect in self._collectors:
+            for name, kind, labels, value in collect():
+                collected.setdefault((name, kind), []).append((_labels(labels), value))
+        for (name, kind), samples in sorted(collected.items()):
+            header(name, kind)
+            for key, value in samples:
+                lines.append(f"{name}{self._format_labels(key)} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+registry.describe("stage_duration_seconds", "Time spent in each processing stage")
+registry.describe("stage_bytes_total", "Bytes handled by each processing stage")
+registry.describe("stage_pages_total", "Pages handled by each processing stage")
+registry.describe("stage_errors_total", "Processing stage runs that raised")
+registry.describe("http_requests_total", "HTTP requests by route and status")
+registry.describe("http_request_duration_seconds", "HTTP request latency by route")
+
+# Spans of the current request when it was sampled for profiling, None otherwise
+_profile: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("profile", default=None)
+profiles: deque = deque(maxlen=PROFILE_HISTORY)
+_sample_rate = PROFILE_SAMPLE_RATE
+
+
+class Span:
+    """
+    One timed run of a stage; set bytes and pages before it ends
+    """
+    __slots__ = ("stage", "bytes", "pages", "start")
+
+    def __init__(self, stage: str, bytes: int = 0, pages: int = 0):
+        self.stage = stage
+        self.bytes = bytes
+        self.pages = pages
+        self.start = time.perf_counter()
+
+
+@contextmanager
+def span(stage: str, bytes: int = 0, pages: int = 0) -> Iterator[Span]:
+    """
+    Time a processing stage, recording its duration, bytes and pages
+
+    Stages: download, parse, extract (text layer of one page), render (one
+    image for OCR), ocr (one batch OCR request) and ocr_wait (a page's
+    consumer waiting for its OCR results).
+    """
+    current = Span(stage, bytes, pages)
+    failed = False
+    try:
+        yield current
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - current.start
+        registry.observe("stage_duration_seconds", elapsed, stage=stage)
+        if current.bytes:
+            registry.inc("stage_bytes_total", current.bytes, stage=stage)
+        if current.pages:
+            registry.inc("stage_pages_total", current.pages, stage=stage)
+        if failed:
+            registry.inc("stage_errors_total", stage=stage)
+
+        trace = _profile.get()
+        if trace is not None:
+            trace.append({
+                "stage": stage,
+                "offset_ms": round((current.start - trace[0]) * 1000, 3),
+                "duration_ms": round(elapsed * 1000, 3),
+                "bytes": current.bytes,
+                "pages": current.pages,
+                "error": failed
+            })
+
+
+def get_sample_rate() -> float:
+    return _sample_rate
+
+
+def set_sample_rate(rate: float) -> None:
+    """
+    Change the fraction of requests profiled, effective for the next request
+    """
+    global _sample_rate
+    _sample_rate = min(1.0, max(0.0, rate))
+    logger.info("Profiling sample rate set to %s", _sample_rate)
+
+
+def _route(scope: dict) -> str:
+    # Use the route template rather than the raw path, which embeds the PDF URL
+    route = scope.get("route")
+    if route is not None and hasattr(route, "path"):
+        return route.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests and their latency per route, and
+    recording the spans of a sampled fraction of requests as profiles
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+        # The first element holds the request start so spans can report offsets from it
+        trace = [start] if _sample_rate and random.random() < _sample_rate else None
+        token = _profile.set(trace)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _profile.reset(token)
+            elapsed = time.perf_counter() - start
+            route = _route(scope)
+            registry.inc("http_requests_total", route=route, status=status)
+            registry.observe("http_request_duration_seconds", elapsed, route=route)
+            if trace is not None:
+                profile = {
+                    "route": route,
+                    "path": scope.get("path"),
+                    "status": status,
+                    "duration_ms": round(elapsed * 1000, 3),
+                    "spans": trace[1:]
+                }
+                profiles.append(profile)
+                logger.info("profile %s", json.dumps(profile))
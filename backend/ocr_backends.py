@@ -0,0 +1,281 @@
+import csv
+import hashlib
+import io
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import List, Optional, Tuple, Type
+
+import numpy as np
+from dotenv import load_dotenv
+
+import layout
+from cache import ExtractionCache
+from ocr_dispatcher import OCRJob
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Which OCR service reads scanned pages: google, azure or local (the tesseract binary)
+OCR_BACKEND = os.getenv("OCR_BACKEND", "google")
+# Bump whenever recognized paragraphs change (grouping rules, backend parsing) so stale entries are not served
+OCR_CACHE_VERSION = "1"
+# Seconds the local backend may spend on one image
+TESSERACT_TIMEOUT = float(os.getenv("TESSERACT_TIMEOUT", "60"))
+TESSERACT_LANG = os.getenv("TESSERACT_LANG", "eng")
+# Set to 1 to load the OCR backend's SDK and client at startup instead of on the first scanned page
+OCR_WARMUP = os.getenv("OCR_WARMUP", "0") == "1"
+
+# Recognized paragraphs per page image, keyed by the hash of the image
+ocr_cache = ExtractionCache(
+    memory_bytes=int(os.getenv("OCR_CACHE_MEMORY_BYTES", 64 * 1024 * 1024)),
+    disk_dir=os.getenv("OCR_CACHE_DIR", os.path.join(tempfile.gettempdir(), "pdf-ocr-cache")) or None,
+    disk_bytes=int(os.getenv("OCR_CACHE_DISK_BYTES", 1024 * 1024 * 1024))
+)
+
+
+class OCRBackend:
+    """
+    An OCR service that reads the words in rendered page images
+
+    Backends only report words and their boxes in image pixels; grouping
+    them into paragraph blocks is shared, so every backend produces the
+    same block schema.
+    """
+    # OCR_BACKEND value selecting the backend
+    name = ""
+    # "method" of the blocks it produces
+    method = ""
+    # Exception types worth retrying
+    transient_errors: Tuple[Type[BaseException], ...] = ()
+
+    def read(self, jobs: List[OCRJob]) -> list:
+        """
+        Read the words of several images, in one request where the service allows it
+
+        Returns:
+            For each job, either (text, words, boxes) with the full text, the
+            word texts and an (n, 4) array of [x0, y0, x1, y1] word boxes in
+            image pixels, or the exception that image failed with
+        """
+        raise NotImplementedError
+
+    def warm_up(self) -> None:
+        """
+        Create the service client ahead of the first request
+        """
+
+
+# Backends import their SDK when they are created, so processes that never
+# OCR a page (and the extraction workers) do not pay for it at startup
+
+
+class GoogleOCRBackend(OCRBackend):
+    name = "google"
+    method = "google"
+
+    def __init__(self):
+        import google_ai
+
+        self.transient_errors = google_ai.TRANSIENT_ERRORS
+        self.client = google_ai.GoogleAIPDFExtractor()
+        self.get_client = google_ai.get_client
+
+    def warm_up(self) -> None:
+        self.get_client()
+
+    def read(self, jobs: List[OCRJob]) -> list:
+        return self.client.read_batch([job.image for job in jobs])
+
+
+class AzureOCRBackend(OCRBackend):
+    """
+    Azure Document Intelligence prebuilt-read, one analysis per image
+    """
+    name = "azure"
+    method = "azure"
+
+    def __init__(self):
+        import azure_ai
+
+        self.transient_errors = azure_ai.TRANSIENT_ERRORS
+        self.read_images = azure_ai.read_images
+        self.get_client = azure_ai.get_client
+
+    def warm_up(self) -> None:
+        self.get_client()
+
+    def read(self, jobs: List[OCRJob]) -> list:
+        return self.read_images([job.image for job in jobs])
+
+
+class LocalOCRBackend(OCRBackend):
+    """
+    The tesseract command line tool, for development and offline use without a paid API
+
+    tesseract is not part of the Docker image; install it (e.g. apt install
+    tesseract-ocr) where this backend is used.
+    """
+    name = "local"
+    method = "tesseract"
+    transient_errors = (subprocess.TimeoutExpired,)
+
+    def __init__(self):
+        self.binary = shutil.which("tesseract")
+        if self.binary is None:
+            raise RuntimeError("OCR_BACKEND=local needs the tesseract binary on the PATH")
+
+    def read(self, jobs: List[OCRJob]) -> list:
+        results = []
+        for job in jobs:
+            try:
+                results.append(self._read_image(job))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def _read_image(self, job: OCRJob) -> tuple:
+        output = subprocess.run(
+            [self.binary, "stdin", "stdout", "--dpi", str(round(job.dpi)), "-l", TESSERACT_LANG, "tsv"],
+            input=job.image, capture_output=True, timeout=TESSERACT_TIMEOUT, check=True
+        ).stdout.decode()
+
+        words, boxes, lines = [], [], {}
+        for row in csv.DictReader(io.StringIO(output), delimiter="\t", quoting=csv.QUOTE_NONE):
+            # Level 5 rows are words, the others are the blocks, paragraphs and lines holding them
+            text = (row.get("text") or "").strip()
+            if row["level"] == "5" and text:
+                left, top = int(row["left"]), int(row["top"])
+                words.append(text)
+                boxes.append([left, top, left + int(row["width"]), top + int(row["height"])])
+                lines.setdefault((row["block_num"], row["par_num"], row["line_num"]), []).append(text)
+        text = "\n".join(" ".join(line) for line in lines.values())
+        return text, words, np.array(boxes, dtype=np.int64).reshape(-1, 4)
+
+
+BACKENDS = {backend.name: backend for backend in (GoogleOCRBackend, AzureOCRBackend, LocalOCRBackend)}
+
+
+def create_backend(name: str = OCR_BACKEND) -> OCRBackend:
+    """
+    Raises:
+        ValueError: For an unknown backend name
+    """
+    backend = BACKENDS.get(name)
+    if backend is None:
+        raise ValueError(f"Unknown OCR backend {name!r}, expected one of {', '.join(BACKENDS)}")
+    return backend()
+
+
+class CachedOCR:
+    """
+    Runs OCR jobs through a backend, caching what each page image contains by its hash
+
+    Cached paragraphs are kept in image pixels and placed on the page of the
+    job asking for them, so a page that recurs within or across documents
+    (cover sheets, reused slides) is only sent to the OCR service once.
+    Identical images in the same batch are sent once too.
+    """
+
+    def __init__(self, backend: OCRBackend, cache: ExtractionCache = ocr_cache):
+        self.backend = backend
+        self.cache = cache
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, stat: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[stat] += amount
+
+    def key(self, job: OCRJob) -> str:
+        # Grouping thresholds scale with the DPI, so it is part of the key
+        digest = hashlib.sha256(job.image).hexdigest()
+        return ExtractionCache.content_key(digest, f"{self.backend.name}:{job.dpi:g}:{OCR_CACHE_VERSION}")
+
+    def _place(self, value: dict, job: OCRJob) -> dict:
+        """
+        A cached image's paragraphs as the {"text", "blocks"} result for job's page
+        """
+        blocks = layout.place_paragraphs(
+            value["paragraphs"], value["bboxes"], job.page_num, job.page_width, job.page_height,
+            self.backend.method, job.dpi, job.origin
+        )
+        return {"text": value["text"], "blocks": blocks}
+
+    def lookup(self, job: OCRJob) -> Optional[dict]:
+        """
+        The {"text", "blocks"} result for job if its image is cached, else None
+        """
+        value = self.cache.get(self.key(job))
+        if value is None:
+            return None
+        self._count("hits")
+        return self._place(value, job)
+
+    def recognize_batch(self, jobs: List[OCRJob]) -> list:
+        """
+        OCRDispatcher callable: OCR the jobs whose images are not cached yet
+
+        Returns:
+            For each job, either a {"text", "blocks"} dict or the exception that job failed with
+        """
+        keys = [self.key(job) for job in jobs]
+        values = {key: self.cache.get(key) for key in keys}
+        # One job per distinct uncached image
+        missing = {key: job for key, job in zip(keys, jobs) if values[key] is None}
+        self._count("hits", len(jobs) - len(missing))
+
+        if missing:
+            for (key, job), result in zip(missing.items(), self.backend.read(list(missing.values()))):
+                if isinstance(result, BaseException):
+                    values[key] = result
+                    continue
+                text, words, boxes = result
+                paragraphs, bboxes = layout.group_paragraphs(words, boxes, job.dpi)
+                values[key] = {"text": text, "paragraphs": paragraphs, "bboxes": bboxes.tolist()}
+                self.cache.put(key, values[key])
+                self._count("misses")
+
+        return [
+            values[key] if isinstance(values[key], BaseException) else self._place(values[key], job)
+            for key, job in zip(keys, jobs)
+        ]
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        cache_stats = self.cache.get_stats()
+        stats.update({name: value for name, value in cache_stats.items() if name.endswith(("_entries", "_bytes"))})
+        return stats
+
+
+_ocr: Optional[CachedOCR] = None
+_ocr_lock = threading.Lock()
+
+
+def get_ocr() -> CachedOCR:
+    """
+    Return this process's cached OCR for the configured backend, creating it on first use
+    """
+    global _ocr
+    with _ocr_lock:
+        if _ocr is None:
+            _ocr = CachedOCR(create_backend())
+        return _ocr
+
+
+def warm_up() -> None:
+    """
+    Load the configured backend and create its client, see OCR_WARMUP
+
+    Failures are only logged; the first page that needs OCR reports them.
+    """
+    try:
+        get_ocr().backend.warm_up()
+        logger.info("OCR backend %s warmed up", OCR_BACKEND)
+    except Exception:
+        logger.exception("Warming up OCR backend %s failed", OCR_BACKEND)
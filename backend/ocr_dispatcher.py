@@ -0,0 +1,198 @@
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, NamedTuple, Optional, Tuple, Type
+
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+# OCR requests allowed in flight at once
+OCR_MAX_CONCURRENCY = int(os.getenv("OCR_MAX_CONCURRENCY", "8"))
+# Pages sent per batch annotate request (the Vision API accepts at most 16)
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", "8"))
+# Upper bound on the image bytes in one batch request
+OCR_BATCH_MAX_BYTES = int(os.getenv("OCR_BATCH_MAX_BYTES", 16 * 1024 * 1024))
+# Seconds to wait for more pages before sending a partial batch
+OCR_BATCH_WAIT = float(os.getenv("OCR_BATCH_WAIT", "0.05"))
+# Images per second sent to the OCR service, 0 disables the budget
+OCR_RATE_LIMIT = float(os.getenv("OCR_RATE_LIMIT", "0"))
+OCR_MAX_RETRIES = int(os.getenv("OCR_MAX_RETRIES", "4"))
+OCR_RETRY_BACKOFF = float(os.getenv("OCR_RETRY_BACKOFF", "0.5"))
+
+
+class OCRJob(NamedTuple):
+    """
+    A rendered page (or area of one) waiting for OCR; picklable so worker processes can hand it back
+
+    dpi and origin map image pixels back to page coordinates, see ocr_render.RenderedImage.
+    """
+    page_num: int
+    image: bytes
+    page_width: float
+    page_height: float
+    dpi: float = 300.0
+    origin: Tuple[float, float] = (0.0, 0.0)
+
+
+class RateLimiter:
+    """
+    Token bucket allowing `rate` units per second with bursts of up to `burst` units
+
+    Requests are charged in full even when they are larger than the bucket:
+    the bucket goes into debt and the request waits until it is paid off, so
+    later requests wait too and the long-run rate never exceeds `rate`.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, units: float = 1.0) -> None:
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= units
+            wait = -self.tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+
+class OCRDispatcher:
+    """
+    Collects OCR jobs from any thread and sends them to the OCR service in batches
+
+    Jobs are grouped into batches of up to OCR_BATCH_SIZE pages, at most
+    OCR_MAX_CONCURRENCY batches are in flight, every image draws from a shared
+    rate budget, and transient failures are retried with exponential backoff.
+
+    Args:
+        recognize_batch: Callable taking a list of OCRJobs and returning, for each job,
+            either a {"text", "blocks"} dict or the exception that job failed with
+        transient_errors: Exception types worth retrying
+    """
+
+    def __init__(self, recognize_batch: Callable[[List[OCRJob]], list],
+                 transient_errors: Tuple[Type[BaseException], ...] = (),
+                 max_concurrency: int = OCR_MAX_CONCURRENCY,
+                 batch_size: int = OCR_BATCH_SIZE,
+                 batch_max_bytes: int = OCR_BATCH_MAX_BYTES,
+                 batch_wait: float = OCR_BATCH_WAIT,
+                 rate_limit: float = OCR_RATE_LIMIT,
+                 max_retries: int = OCR_MAX_RETRIES,
+                 retry_backoff: float = OCR_RETRY_BACKOFF):
+        self.recognize_batch = recognize_batch
+        self.transient_errors = transient_errors + (ConnectionError, TimeoutError)
+        self.batch_size = batch_size
+        self.batch_max_bytes = batch_max_bytes
+        self.batch_wait = batch_wait
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.stats = {"pages": 0, "batches": 0, "retries": 0, "failures": 0}
+
+        self._queue: queue.Queue = queue.Queue()
+        self._slots = threading.Semaphore(max_concurrency)
+        self._stats_lock = threading.Lock()
+        threading.Thread(target=self._collect, name="ocr-dispatcher", daemon=True).start()
+
+    def submit(self, job: OCRJob) -> Future:
+        """
+        Queue a page for OCR and return a future for its {"text", "blocks"} result
+        """
+        future = Future()
+        self._queue.put((job, future))
+        return future
+
+    def _count(self, stat: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[stat] += amount
+
+    def _collect(self) -> None:
+        """
+        Form batches from the queue and hand each one to its own sender thread
+        """
+        while True:
+            batch = [self._queue.get()]
+            batch_bytes = len(batch[0][0].image)
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if batch_bytes + len(item[0].image) > self.batch_max_bytes:
+                    # Too big to join this batch, it starts the next one
+                    self._send_async(batch)
+                    batch, batch_bytes = [item], 0
+                    deadline = time.monotonic() + self.batch_wait
+                else:
+                    batch.append(item)
+                batch_bytes += len(item[0].image)
+
+            self._send_async(batch)
+
+    def _send_async(self, batch: list) -> None:
+        # Blocks while OCR_MAX_CONCURRENCY batches are in flight, letting the queue build up bigger batches
+        self._slots.acquire()
+        threading.Thread(target=self._send, args=(batch,), daemon=True).start()
+
+    def _backoff(self, attempt: int) -> None:
+        time.sleep(self.retry_backoff * (2 ** attempt) * (0.5 + random.random()))
+
+    def _send(self, batch: list) -> None:
+        try:
+            pending = [(job, future) for job, future in batch if future.set_running_or_notify_cancel()]
+            for attempt in range(self.max_retries + 1):
+                if not pending:
+                    return
+                if attempt:
+                    self._count("retries", len(pending))
+                    self._backoff(attempt - 1)
+
+                self.rate_limiter.acquire(len(pending))
+                self._count("batches")
+                jobs = [job for job, _ in pending]
+                try:
+                    with metrics.span("ocr", pages=len(jobs), bytes=sum(len(job.image) for job in jobs)):
+                        results = self.recognize_batch(jobs)
+                except self.transient_errors as e:
+                    if attempt == self.max_retries:
+                        self._fail(pending, e)
+                        return
+                    continue
+                except Exception as e:
+                    self._fail(pending, e)
+                    return
+
+                retry = []
+                for (job, future), result in zip(pending, results):
+                    if not isinstance(result, BaseException):
+                        self._count("pages")
+                        future.set_result(result)
+                    elif isinstance(result, self.transient_errors) and attempt < self.max_retries:
+                        retry.append((job, future))
+                    else:
+                        self._fail([(job, future)], result)
+                pending = retry
+        finally:
+            self._slots.release()
+
+    def _fail(self, pending: list, error: BaseException) -> None:
+        self._count("failures", len(pending))
+        for _, future in pending:
+            future.set_exception(error)
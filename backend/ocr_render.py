@@ -0,0 +1,158 @@
+import math
+import os
+from typing import List, NamedTuple, Optional, Tuple
+
+import fitz
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Render resolution bounds; within them the DPI follows the resolution of the page's images
+OCR_MAX_DPI = float(os.getenv("OCR_MAX_DPI", "300"))
+OCR_MIN_DPI = float(os.getenv("OCR_MIN_DPI", "150"))
+# Largest rendered image in pixels, oversized pages are rendered at a lower DPI instead
+OCR_MAX_PIXELS = int(os.getenv("OCR_MAX_PIXELS", 24 * 1000 * 1000))
+# png, jpeg or webp
+OCR_IMAGE_FORMAT = os.getenv("OCR_IMAGE_FORMAT", "jpeg").lower()
+OCR_IMAGE_QUALITY = int(os.getenv("OCR_IMAGE_QUALITY", "85"))
+OCR_GRAYSCALE = os.getenv("OCR_GRAYSCALE", "1") == "1"
+# Set to 1 to also OCR images embedded in pages that already have a text layer (figures, scanned inserts)
+OCR_IMAGE_REGIONS = os.getenv("OCR_IMAGE_REGIONS", "0") == "1"
+# Images covering less of the page than this fraction are not worth an OCR request
+OCR_MIN_REGION_AREA = float(os.getenv("OCR_MIN_REGION_AREA", "0.05"))
+
+
+class RenderedImage(NamedTuple):
+    """
+    An encoded rendering of (part of) a page
+
+    Pixel (px, py) of the image lies at page point
+    (origin[0] + px * 72 / dpi, origin[1] + py * 72 / dpi).
+    """
+    data: bytes
+    dpi: float
+    origin: Tuple[float, float]
+
+
+def _image_dpi(info: dict) -> Optional[float]:
+    """
+    Effective resolution of an embedded image as placed on the page
+    """
+    bbox = fitz.Rect(info["bbox"])
+    if bbox.is_empty:
+        return None
+    return max(info["width"] * 72 / bbox.width, info["height"] * 72 / bbox.height)
+
+
+def choose_dpi(rect: fitz.Rect, image_dpi: Optional[float] = None) -> float:
+    """
+    Pick the render DPI for an area of a page
+
+    Scans are rendered at their own resolution (clamped to OCR_MIN_DPI..OCR_MAX_DPI),
+    since rendering finer than the source adds bytes but no detail. Areas
+    without images (vector drawings, outlined text) get OCR_MAX_DPI. Large
+    areas are scaled down to stay under OCR_MAX_PIXELS.
+    """
+    dpi = OCR_MAX_DPI if image_dpi is None else min(OCR_MAX_DPI, max(OCR_MIN_DPI, image_dpi))
+    area = rect.width * rect.height
+    if area > 0:
+        dpi = min(dpi, 72 * math.sqrt(OCR_MAX_PIXELS / area))
+    return dpi
+
+
+def encode(pix: fitz.Pixmap, image_format: str, quality: int) -> bytes:
+    if image_format == "png":
+        return pix.tobytes("png")
+    if image_format in ("jpeg", "jpg"):
+        return pix.tobytes("jpeg", jpg_quality=quality)
+    if image_format == "webp":
+        # MuPDF cannot write WebP, OpenCV can
+        import cv2
+        pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+        if pix.n == 3:
+            pixels = pixels[:, :, ::-1]  # OpenCV expects BGR
+        ok, data = cv2.imencode(".webp", pixels, [cv2.IMWRITE_WEBP_QUALITY, quality])
+        if not ok:
+            raise ValueError("WebP encoding failed")
+        return data.tobytes()
+    raise ValueError(f"Unsupported OCR image format: {image_format}")
+
+
+def render(page: fitz.Page, clip: Optional[fitz.Rect] = None, image_dpi: Optional[float] = None,
+           image_format: str = OCR_IMAGE_FORMAT, quality: int = OCR_IMAGE_QUALITY,
+           grayscale: bool = OCR_GRAYSCALE) -> RenderedImage:
+    """
+    Render a page, or the clip area of it, for OCR
+
+    Args:
+        page: fitz.Page object
+        clip: Area of the page to render, defaults to the whole page
+        image_dpi: Resolution of the images in that area, if known
+        image_format: png, jpeg or webp
+        quality: JPEG/WebP quality
+        grayscale: Render a single gray channel instead of RGB
+
+    Returns:
+        RenderedImage of the area
+    """
+    area = clip or page.rect
+    dpi = choose_dpi(area, image_dpi)
+    pix = page.get_pixmap(
+        matrix=fitz.Matrix(dpi / 72, dpi / 72),
+        clip=clip,
+        colorspace=fitz.csGRAY if grayscale else fitz.csRGB,
+        alpha=False
+    )
+    return RenderedImage(encode(pix, image_format, quality), dpi, (area.x0, area.y0))
+
+
+def page_image_dpi(page: fitz.Page) -> Optional[float]:
+    """
+    Resolution of the sharpest image on the page, None if it has no images
+    """
+    dpis = [dpi for dpi in map(_image_dpi, page.get_image_info()) if dpi]
+    return max(dpis) if dpis else None
+
+
+def image_regions(page: fitz.Page) -> List[Tuple[fitz.Rect, Optional[float]]]:
+    """
+    Areas of a page covered by embedded images large enough to OCR
+
+    Overlapping images are merged so no area is sent twice. Areas with
+    text-layer words drawn over them are skipped: a slide background or a
+    letterhead would otherwise cost an OCR request on every page, and its text
+    would be rendered along with it and come back twice.
+
+    Returns:
+        List of (rect, image_dpi) in page coordinates
+    """
+    if not OCR_IMAGE_REGIONS:
+        return []
+
+    page_area = page.rect.width * page.rect.height
+    regions = []
+    for info in page.get_image_info():
+        rect = fitz.Rect(info["bbox"]) & page.rect
+        if rect.is_empty or rect.width * rect.height < OCR_MIN_REGION_AREA * page_area:
+            continue
+        dpi = _image_dpi(info)
+        merged = True
+        while merged:
+            merged = False
+            for i, (other, other_dpi) in enumerate(regions):
+                if rect.intersects(other):
+                    rect = rect | other
+                    dpi = max(filter(None, (dpi, other_dpi)), default=None)
+                    del regions[i]
+                    merged = True
+                    break
+        regions.append((rect, dpi))
+    if not regions:
+        return []
+
+    words = [
+        fitz.Point((x0 + x1) / 2, (y0 + y1) / 2)
+        for x0, y0, x1, y1, text, *_ in page.get_text("words") if text.strip()
+    ]
+    return [(rect, dpi) for rect, dpi in regions if not any(rect.contains(word) for word in words)]
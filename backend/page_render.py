@@ -0,0 +1,267 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+import fitz
+import httpx
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+import metrics
+import ocr_render
+import proxy_cache
+from cache import DiskLRU, MemoryLRU
+from proxy_cache import CachedPDF
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Rendered page images kept in memory and on disk (an empty RENDER_CACHE_DIR disables the disk tier)
+RENDER_CACHE_MEMORY_BYTES = int(os.getenv("RENDER_CACHE_MEMORY_BYTES", 64 * 1024 * 1024))
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", os.path.join(tempfile.gettempdir(), "pdf-render-cache"))
+RENDER_CACHE_DISK_BYTES = int(os.getenv("RENDER_CACHE_DISK_BYTES", 1024 * 1024 * 1024))
+# Pages after the requested one rendered in the background, so scrolling finds them cached
+RENDER_PREFETCH = int(os.getenv("RENDER_PREFETCH", "3"))
+# Prefetches allowed to wait for the prefetch thread before new ones are dropped
+RENDER_PREFETCH_QUEUE = int(os.getenv("RENDER_PREFETCH_QUEUE", "32"))
+# Documents kept open between requests, since opening a long PDF parses its whole page tree
+RENDER_OPEN_DOCUMENTS = int(os.getenv("RENDER_OPEN_DOCUMENTS", "8"))
+# Width in pixels of thumbnails
+RENDER_THUMBNAIL_WIDTH = int(os.getenv("RENDER_THUMBNAIL_WIDTH", "200"))
+# Largest scale (1 renders at 72 DPI); pages are scaled down further to stay under RENDER_MAX_PIXELS
+RENDER_MAX_SCALE = float(os.getenv("RENDER_MAX_SCALE", "4"))
+RENDER_MAX_PIXELS = int(os.getenv("RENDER_MAX_PIXELS", 16 * 1000 * 1000))
+RENDER_IMAGE_QUALITY = int(os.getenv("RENDER_IMAGE_QUALITY", "80"))
+# Bump whenever rendering changes so cached images and the ETags clients hold are invalidated
+RENDER_VERSION = "1"
+
+MEDIA_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+class Tile(NamedTuple):
+    """
+    One page image of one version of a document; scale None means a thumbnail
+    """
+    url: str
+    document_etag: str
+    page: int
+    scale: Optional[float]
+    image_format: str
+
+    @property
+    def key(self) -> str:
+        size = "thumbnail" if self.scale is None else f"{self.scale:g}"
+        return f"render:{self.url}\n{self.document_etag}\n{self.page}\n{size}\n{self.image_format}\n{RENDER_VERSION}"
+
+    @property
+    def etag(self) -> str:
+        return f'"{hashlib.sha256(self.key.encode()).hexdigest()[:32]}"'
+
+
+class PageRenderer:
+    """
+    Renders page images of proxied PDFs behind a memory and a disk LRU
+
+    Documents are read from the proxy cache, the copy /proxy-pdf already
+    serves the viewer, and the last RENDER_OPEN_DOCUMENTS stay open so
+    consecutive pages skip parsing the document again. Concurrent requests for
+    the same image share one render.
+    """
+
+    def __init__(self, memory_bytes: int, disk_dir: Optional[str], disk_bytes: int,
+                 open_documents: int = RENDER_OPEN_DOCUMENTS):
+        self.memory = MemoryLRU(memory_bytes)
+        self.disk = DiskLRU(disk_dir, disk_bytes) if disk_dir else None
+        self.open_documents = open_documents
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "renders": 0, "prefetches": 0}
+        self._documents: OrderedDict = OrderedDict()  # (path, etag) -> (fitz.Document, lock)
+        self._inflight = {}
+        self._prefetching = 0
+        self._prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render-prefetch")
+        self._lock = threading.Lock()
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self.stats[stat] += 1
+
+    def get(self, tile: Tile) -> Optional[bytes]:
+        """
+        Look up a rendered image in memory, then on disk (promoting disk hits to memory)
+        """
+        data = self.memory.get(tile.key)
+        if data is not None:
+            self._count("memory_hits")
+            return data
+        if self.disk is not None:
+            data = self.disk.get(tile.key)
+            if data is not None:
+                self.memory.put(tile.key, data, len(data))
+                self._count("disk_hits")
+                return data
+        return None
+
+    def _document(self, entry: CachedPDF) -> tuple:
+        """
+        Return an open (document, lock) for a cached PDF, opening it if needed
+        """
+        key = (entry.path, entry.etag)
+        with self._lock:
+            document = self._documents.get(key)
+            if document is not None:
+                self._documents.move_to_end(key)
+                return document
+        document = (fitz.open(entry.path, filetype="pdf"), threading.Lock())
+
+        evicted = []
+        with self._lock:
+            if key in self._documents:
+                evicted.append(document)
+                document = self._documents[key]
+            else:
+                self._documents[key] = document
+                while len(self._documents) > self.open_documents:
+                    evicted.append(self._documents.popitem(last=False)[1])
+        for doc, lock in evicted:
+            with lock:
+                doc.close()
+        return document
+
+    def _render(self, entry: CachedPDF, tile: Tile) -> bytes:
+        while True:
+            doc, lock = self._document(entry)
+            with lock:
+                # Closed when it was evicted between lookup and lock
+                if doc.is_closed:
+                    continue
+                if not 0 <= tile.page < len(doc):
+                    raise HTTPException(
+                        status_code=404,
+                        detail=f"Page {tile.page} not found, the document has {len(doc)} pages"
+                    )
+                page = doc[tile.page]
+                scale = RENDER_THUMBNAIL_WIDTH / page.rect.width if tile.scale is None else tile.scale
+                area = page.rect.width * page.rect.height * scale * scale
+                if area > RENDER_MAX_PIXELS:
+                    scale *= (RENDER_MAX_PIXELS / area) ** 0.5
+                with metrics.span("page_render", pages=1) as stage:
+                    pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+                    data = ocr_render.encode(pix, tile.image_format, RENDER_IMAGE_QUALITY)
+                    stage.bytes = len(data)
+            self._count("renders")
+            return data
+
+    def render(self, entry: CachedPDF, tile: Tile) -> bytes:
+        """
+        Return the encoded image for a tile, rendering and caching it on a miss
+
+        Raises:
+            HTTPException: 404 if the page does not exist
+        """
+        data = self.get(tile)
+        if data is not None:
+            return data
+
+        with self._lock:
+            future = self._inflight.get(tile.key)
+            owner = future is None
+            if owner:
+                future = self._inflight[tile.key] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            data = self._render(entry, tile)
+            self.memory.put(tile.key, data, len(data))
+            if self.disk is not None:
+                self.disk.put(tile.key, data)
+            future.set_result(data)
+            return data
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[tile.key]
+
+    def prefetch(self, entry: CachedPDF, tile: Tile) -> None:
+        """
+        Render the next RENDER_PREFETCH pages at the same size in the background
+
+        Pages already cached or being rendered are skipped, and so is
+        everything once RENDER_PREFETCH_QUEUE prefetches are waiting.
+        """
+        for page in range(tile.page + 1, tile.page + 1 + RENDER_PREFETCH):
+            ahead = tile._replace(page=page)
+            with self._lock:
+                if ahead.key in self._inflight or self._prefetching >= RENDER_PREFETCH_QUEUE:
+                    continue
+                self._prefetching += 1
+            self._prefetcher.submit(self._prefetch_one, entry, ahead)
+
+    def _prefetch_one(self, entry: CachedPDF, tile: Tile) -> None:
+        try:
+            if self.memory.get(tile.key) is None and (self.disk is None or self.disk.get_path(tile.key) is None):
+                self.render(entry, tile)
+                self._count("prefetches")
+        except HTTPException:
+            # Past the last page
+            pass
+        except Exception:
+            logger.exception("Prefetching page %d of %s failed", tile.page, tile.url)
+        finally:
+            with self._lock:
+                self._prefetching -= 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats, open_documents=len(self._documents))
+        stats.update({"memory_entries": len(self.memory), "memory_bytes": self.memory.size})
+        if self.disk is not None:
+            stats.update({"disk_entries": len(self.disk), "disk_bytes": self.disk.size})
+        return stats
+
+
+renderer = PageRenderer(RENDER_CACHE_MEMORY_BYTES, RENDER_CACHE_DIR or None, RENDER_CACHE_DISK_BYTES)
+
+
+async def render(url: str, page: int, scale: Optional[float], image_format: str, request_headers) -> Response:
+    """
+    Serve an image of one page of a PDF, with an ETag that changes with the document
+
+    Answers If-None-Match with 304 without rendering, and queues the
+    following pages for prefetching.
+
+    Args:
+        url: Direct url to the pdf
+        page: 0-based page number
+        scale: 1 renders at 72 DPI; None renders a RENDER_THUMBNAIL_WIDTH wide thumbnail
+        image_format: png, jpeg or webp
+
+    Raises:
+        HTTPException: 400 if the PDF cannot be downloaded or opened, 404 if the page does not exist
+    """
+    try:
+        entry = await proxy_cache.fetch(url)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=400, detail=f"Failed to download PDF: {str(e)}") from e
+
+    tile = Tile(url, entry.etag, page, scale, image_format)
+    headers = {"ETag": tile.etag, "Cache-Control": f"public, max-age={proxy_cache.PROXY_CACHE_TTL}"}
+    if_none_match = request_headers.get("If-None-Match")
+    if if_none_match and tile.etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    try:
+        data = await asyncio.to_thread(renderer.render, entry, tile)
+    except fitz.FileDataError as e:
+        raise HTTPException(status_code=400, detail="Invalid or corrupted PDF file") from e
+    renderer.prefetch(entry, tile)
+    return Response(data, media_type=MEDIA_TYPES[image_format], headers=headers)
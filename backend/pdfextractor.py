@@ -1,64 +1,524 @@
-from io import BytesIO
+import asyncio
+import functools
+import hashlib
+import logging
+import math
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack, asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
 import fitz
-import requests
+import httpx
+from dotenv import load_dotenv
 from fastapi import HTTPException
 
-from google_ai import GoogleAIPDFExtractor
+import admission
+import http_client
+import metrics
+import ocr_render
+import search_index
+import word_index
+from cache import ExtractionCache, MemoryLRU, extraction_cache
+from ocr_backends import CachedOCR, get_ocr
+from ocr_dispatcher import OCRDispatcher, OCRJob
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Number of worker processes used for parallel extraction
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", os.cpu_count() or 1))
+# Set to 1 to always use the single-process extraction path
+EXTRACT_SERIAL = os.getenv("EXTRACT_SERIAL", "0") == "1"
+# Documents shorter than this are not worth the cost of dispatching to the pool
+PARALLEL_MIN_PAGES = int(os.getenv("PARALLEL_MIN_PAGES", "16"))
+# Page ranges handed out per worker, more ranges balance OCR-heavy stretches better
+RANGES_PER_WORKER = 4
+MAX_RANGE_PAGES = 32
+# Page ranges in flight per worker, bounds the rendered pages held for OCR
+RANGE_WINDOW = 2
+# Pages extraction may run ahead of the oldest page still waiting for OCR
+OCR_LOOKAHEAD = int(os.getenv("OCR_LOOKAHEAD", "32"))
+# Pages of a selection checked for a text layer to estimate how many need OCR before admission
+OCR_SAMPLE_PAGES = int(os.getenv("OCR_SAMPLE_PAGES", "16"))
+
+# Downloads larger than this are rejected instead of filling the disk
+MAX_PDF_BYTES = int(os.getenv("MAX_PDF_BYTES", 512 * 1024 * 1024))
+# Where downloads are spooled, defaults to the system temp dir
+DOWNLOAD_DIR = os.getenv("DOWNLOAD_DIR") or None
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Seconds a request waits for another one downloading the same version of a URL
+# before it downloads the document itself
+COALESCE_TIMEOUT = float(os.getenv("COALESCE_TIMEOUT", "30"))
+
+# Parsed search indexes kept in this process, so queries do not deserialize them from the cache
+SEARCH_INDEX_CACHE_ENTRIES = int(os.getenv("SEARCH_INDEX_CACHE_ENTRIES", "16"))
+
+# Bump whenever extraction output changes so stale cache entries are not served
+EXTRACTOR_VERSION = "5"
+
+PAGE_SEPARATOR = "\n\n---\n\n"
+
+# Subset fonts are renamed with a random tag (ABCDEF+Name) every time a PDF is written
+_SUBSET_TAG = re.compile(r"^[A-Z]{6}\+")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+
+_ocr_dispatcher: Optional[OCRDispatcher] = None
+_ocr_dispatcher_lock = threading.Lock()
+
+# Content key -> search index; every index counts as 1 against the bound
+_search_indexes = MemoryLRU(SEARCH_INDEX_CACHE_ENTRIES)
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Return the shared process pool, creating it on first use.
+
+    Workers are spawned rather than forked so they never inherit the
+    parent's gRPC channel to Google Cloud Vision.
+    """
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        _pool_workers = workers
+    return _pool
+
+
+def _reset_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False)
+    _pool = None
+
+
+def _as_http_error(e: Exception) -> HTTPException:
+    """
+    Map an exception raised while processing a PDF to the HTTPException returned to the client
+    """
+    if isinstance(e, fitz.FileDataError):
+        return HTTPException(
+            status_code=400,
+            detail="Invalid or corrupted PDF file"
+        )
+    return HTTPException(
+        status_code=500,
+        detail=f"Internal server error while processing PDF: {str(e)}"
+    )
+
+
+def _runs(pages: Sequence[int]) -> List[range]:
+    """
+    Group ascending page numbers into contiguous runs
+    """
+    if isinstance(pages, range):
+        return [pages] if pages else []
+    runs = []
+    for page_num in pages:
+        if runs and runs[-1].stop == page_num:
+            runs[-1] = range(runs[-1].start, page_num + 1)
+        else:
+            runs.append(range(page_num, page_num + 1))
+    return runs
+
+
+def _page_ranges(pages: Sequence[int], workers: int) -> List[range]:
+    """
+    Split the selected pages into contiguous page ranges for the worker pool
+    """
+    size = max(1, min(MAX_RANGE_PAGES, math.ceil(len(pages) / (workers * RANGES_PER_WORKER))))
+    return [
+        range(start, min(start + size, run.stop))
+        for run in _runs(pages) for start in range(run.start, run.stop, size)
+    ]
+
+
+def _page_fingerprint(doc, page, digests: Dict[int, str]) -> str:
+    """
+    Hash everything extraction reads from a page: its geometry, content
+    streams, images, form XObjects and fonts
+
+    Streams are hashed by content rather than xref number, since xrefs are
+    renumbered whenever a PDF is rewritten; digests memoizes them by xref
+    because images and forms are usually shared between pages.
+    """
+    def digest(xref: int) -> str:
+        if xref not in digests:
+            digests[xref] = hashlib.blake2b(doc.xref_stream_raw(xref) or b"", digest_size=16).hexdigest()
+        return digests[xref]
+
+    fingerprint = hashlib.blake2b(digest_size=16)
+    fingerprint.update(repr((tuple(page.rect), page.rotation)).encode())
+    for xref in page.get_contents():
+        fingerprint.update(digest(xref).encode())
+    for xref, smask, *_, name, _, _ in page.get_images(full=True):
+        fingerprint.update(repr((name, digest(xref), digest(smask) if smask else "")).encode())
+    for xref, name, *_ in page.get_xobjects():
+        fingerprint.update(repr((name, digest(xref))).encode())
+    for _, _, font_type, basefont, name, encoding, *_ in page.get_fonts(full=True):
+        fingerprint.update(repr((name, _SUBSET_TAG.sub("", basefont), font_type, encoding)).encode())
+    return fingerprint.hexdigest()
+
+
+def _sample(pages: range, count: int) -> Sequence[int]:
+    """
+    Up to count page numbers spread evenly over pages
+    """
+    if len(pages) <= count:
+        return pages
+    return [pages[len(pages) * n // count] for n in range(count)]
+
+
+def _has_text(page_blocks: list) -> bool:
+    """
+    Whether a page has searchable text, given its get_text("blocks"); pages without it are OCR'd
+    """
+    return any(block[4].strip() for block in page_blocks)
+
+
+class PageSelection(NamedTuple):
+    """
+    A contiguous run of 0-based pages; stop is exclusive and None means the last page
+    """
+    start: int = 0
+    stop: Optional[int] = None
+
+    @classmethod
+    def parse(cls, spec: Optional[str] = None, cursor: Optional[int] = None,
+              count: Optional[int] = None) -> Optional["PageSelection"]:
+        """
+        Build a selection from a "10-40" / "10-" / "10" spec (inclusive, 0-based)
+        or from a cursor plus a page count. Returns None for the whole document.
+
+        Raises:
+            HTTPException: If the spec is malformed
+        """
+        if spec:
+            first, dash, last = spec.partition("-")
+            if not first.strip().isdigit() or (last.strip() and not last.strip().isdigit()):
+                raise HTTPException(
+                    status_code=400,
+                    detail="pages must look like 10-40, 10- or 10"
+                )
+            start = int(first)
+            if not dash:
+                stop = start + 1
+            else:
+                stop = int(last) + 1 if last.strip() else None
+            if stop is not None and stop <= start:
+                raise HTTPException(status_code=400, detail="pages range is empty")
+            return cls(start, stop)
+
+        if cursor is not None or count is not None:
+            start = cursor or 0
+            if start < 0 or (count is not None and count < 1):
+                raise HTTPException(status_code=400, detail="cursor must be >= 0 and count >= 1")
+            return cls(start, start + count if count is not None else None)
+
+        return None
+
+    def resolve(self, page_count: int) -> range:
+        """
+        The pages of a document with page_count pages that the selection covers
+
+        Raises:
+            HTTPException: 400 if the selection starts past the last page
+        """
+        if self.start > 0 and self.start >= page_count:
+            raise HTTPException(
+                status_code=400,
+                detail=f"pages start at {self.start} but the document has {page_count} pages"
+            )
+        stop = page_count if self.stop is None else min(self.stop, page_count)
+        return range(min(self.start, page_count), stop)
+
+
+def _get_ocr_dispatcher(ocr: CachedOCR) -> OCRDispatcher:
+    """
+    Return this process's OCR dispatcher, creating it on first use
+    """
+    global _ocr_dispatcher
+    with _ocr_dispatcher_lock:
+        if _ocr_dispatcher is None:
+            _ocr_dispatcher = OCRDispatcher(
+                ocr.recognize_batch,
+                transient_errors=ocr.backend.transient_errors
+            )
+        return _ocr_dispatcher
+
+
+def _extract_page_range(pdf_path: str, start: int, stop: int) -> list:
+    """
+    Worker entry point: open the document in this process and extract pages [start, stop)
+
+    Pages that need OCR come back as PendingPages so the parent process can
+    send their OCRJobs through its OCR dispatcher. The metrics recorded in
+    the worker are handed back too, for the parent to merge into its registry.
+
+    Returns:
+        Tuple of (list of (display_text, blocks) tuples or PendingPages in page
+        order, metrics.Registry.drain() snapshot)
+    """
+    extractor = PDFExtractor(serial=True)
+    with metrics.span("parse", bytes=os.path.getsize(pdf_path)) as stage:
+        doc = fitz.open(pdf_path)
+        stage.pages = stop - start
+    try:
+        results = [extractor._extract_page(doc[page_num], page_num) for page_num in range(start, stop)]
+    finally:
+        doc.close()
+    return results, metrics.registry.drain()
+
+
+def _conditional_headers(etag: Optional[str], last_modified: Optional[str]) -> dict:
+    """
+    Headers asking the origin to answer 304 if the version last seen is still current
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+
+def _index_key(key: str) -> str:
+    return f"{key}:index={search_index.INDEX_VERSION}"
+
+
+def _build_index(key: str, entry: dict) -> dict:
+    """
+    Return the search index of a fully extracted document, building and caching it if needed
+    """
+    return extraction_cache.get_or_compute(_index_key(key), lambda: search_index.build(entry["pages"]))
+
+
+def _build_index_later(key: str, entry: Optional[dict] = None) -> None:
+    """
+    Index a freshly extracted document on a background thread so the response
+    is not held up; without an entry, the document is read back from the cache
+    """
+    def build() -> None:
+        document = entry if entry is not None else extraction_cache.get(key)
+        if document is not None:
+            _build_index(key, document)
+
+    threading.Thread(target=build, name="search-index", daemon=True).start()
+
+
+class PendingPage(NamedTuple):
+    """
+    A page waiting on OCR: the text and blocks of its text layer (empty for
+    scans) plus the OCRJobs for the areas that need OCR, replaced by futures
+    once they are dispatched
+    """
+    text: str
+    blocks: list
+    ocr: list
+
+
+class DownloadedPDF:
+    """
+    A PDF spooled to a temporary file, removed again by close()
+
+    fitz reads the document from the file on demand, so the process never
+    holds a full in-memory copy of the download.
+    """
+
+    def __init__(self, path: str, sha256: str, size: int):
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+        # Called once by close(), see PDFExtractor._fetch
+        self.on_close: Optional[Callable[[], None]] = None
+
+    def close(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        on_close, self.on_close = self.on_close, None
+        if on_close is not None:
+            on_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PageStream:
+    """
+    Processed pages of a document as (page_num, display_text, blocks), in page order
+
+    PDFExtractor.stream_pages hands the stream whatever its pages still hold,
+    like the spooled download and the admission ticket, and close() releases
+    them whether the iteration finished, stopped early or never started, so
+    callers must close the stream once they are done with it. close() may be
+    called from any thread; an iteration in progress stops after its current page.
+    """
+
+    def __init__(self, pages: Iterator[tuple], release: Sequence[Callable[[], None]] = ()):
+        self._pages = pages
+        self._release = list(release)
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> tuple:
+        with self._lock:
+            if self._closed:
+                raise StopIteration
+            return next(self._pages)
+
+    def close(self) -> None:
+        self._closed = True
+        with self._lock, ExitStack() as stack:
+            release, self._release = self._release, []
+            for callback in reversed(release):
+                stack.callback(callback)
+            close = getattr(self._pages, "close", None)
+            if close is not None:
+                close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
 
 class PDFExtractor:
-    def __init__(self):
-        self.google_ai = GoogleAIPDFExtractor()
-        
-    def _check_url(self, pdf_url: str) -> requests.Response:
+    def __init__(self, workers: Optional[int] = None, serial: Optional[bool] = None, background: bool = False):
         """
-        Validate URL and return PDF content buffer
+        Args:
+            workers: Number of worker processes for parallel extraction, defaults to EXTRACT_WORKERS
+            serial: Force the single-process path, defaults to EXTRACT_SERIAL
+            background: Wait for admission as long as it takes instead of being
+                rejected, for background jobs
+        """
+        self.workers = workers or EXTRACT_WORKERS
+        self.serial = EXTRACT_SERIAL if serial is None else serial
+        self.background = background
+
+    @asynccontextmanager
+    async def _check_url(self, pdf_url: str, headers: Optional[dict] = None) -> AsyncIterator[httpx.Response]:
+        """
+        Validate URL and yield the streaming response for the PDF
+
+        Uses the shared async HTTP client, so waiting on the origin never blocks
+        the event loop. Errors while reading the body inside the context are
+        reported the same way as connection errors.
 
         Args:
             pdf_url: Direct url to the pdf
+            headers: Extra request headers, e.g. to make the request conditional
 
-        Returns:
-            Response object containing the PDF content
+        Yields:
+            Response object whose body has not been read yet, or a 304 when the
+            headers made the request conditional
 
         Raises:
             HTTPException: For various error conditions
         """
         try:
-            response = requests.get(pdf_url, stream=True)
-            response.raise_for_status()
-            return response
-        except requests.RequestException as e:
+            async with http_client.stream(pdf_url, headers=headers) as response:
+                # A 304 answers a conditional request, the caller handles it
+                if response.status_code != 304 or not headers:
+                    response.raise_for_status()
+                yield response
+        except httpx.HTTPError as e:
             raise HTTPException(
                 status_code=400,
                 detail=f"Failed to download PDF: {str(e)}"
             ) from e
-        except Exception as e:
+
+    async def _spool(self, response: httpx.Response) -> DownloadedPDF:
+        """
+        Stream the response body into a temporary file, hashing it on the way
+
+        Args:
+            response: Streaming response from _check_url
+
+        Returns:
+            DownloadedPDF for the spooled file; the caller must close it
+
+        Raises:
+            HTTPException: 413 if the body is larger than MAX_PDF_BYTES
+        """
+        content_length = response.headers.get("Content-Length")
+        if content_length and content_length.isdigit() and int(content_length) > MAX_PDF_BYTES:
             raise HTTPException(
-                status_code=500,
-                detail=f"Internal server error while checking PDF URL: {str(e)}"
-            ) from e
+                status_code=413,
+                detail=f"PDF is larger than the {MAX_PDF_BYTES} byte limit"
+            )
 
-    def _process_page(self, page, page_num: int) -> tuple:
+        fd, path = tempfile.mkstemp(suffix=".pdf", dir=DOWNLOAD_DIR)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with metrics.span("download") as stage, os.fdopen(fd, "wb") as pdf_file:
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    stage.bytes = size
+                    if size > MAX_PDF_BYTES:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"PDF is larger than the {MAX_PDF_BYTES} byte limit"
+                        )
+                    digest.update(chunk)
+                    pdf_file.write(chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+
+        return DownloadedPDF(path, digest.hexdigest(), size)
+
+    def _extract_page(self, page, page_num: int):
         """
-        Process a single page using PyMuPDF, falling back to Google Cloud Vision for non-searchable pages
+        Extract a single page using PyMuPDF, rendering whatever needs OCR
+
+        Pages without searchable text are rendered whole. With OCR_IMAGE_REGIONS
+        on, pages with a text layer also get their embedded images (see
+        ocr_render.image_regions) rendered, so text inside figures and scanned
+        inserts is not lost.
 
         Args:
             page: fitz.Page object
             page_num: Page number (0-based)
 
         Returns:
-            Tuple of (display_text, blocks) where blocks contain text and bbox info
+            Tuple of (display_text, blocks) where blocks contain text and bbox info,
+            or a PendingPage holding the rendered images that still need OCR
         """
-        page_blocks = page.get_text("blocks")
         page_text = ""
         blocks = []
 
-        # Check if page has searchable text
-        has_text = any(block[4].strip() for block in page_blocks)
+        with metrics.span("extract", pages=1) as stage:
+            page_blocks = page.get_text("blocks")
+
+            # Check if page has searchable text
+            has_text = _has_text(page_blocks)
 
-        if has_text:
-            print(f"Page {page_num} processed with PyMuPDF")
             # Process searchable text with PyMuPDF
-            for block in page_blocks:
+            for block in page_blocks if has_text else ():
                 text = block[4].strip()
                 if text:
                     page_text += text + "\n\n"
@@ -70,86 +530,793 @@ class PDFExtractor:
                         "height": page.rect.height,
                         "method": "pymupdf"
                     })
+            stage.bytes = len(page_text.encode())
+
+            regions = ocr_render.image_regions(page) if has_text else []
+
+        if not has_text:
+            logger.debug("Page %d requires OCR", page_num)
+            return PendingPage("", [], [self._ocr_job(page, page_num, None, ocr_render.page_image_dpi(page))])
+
+        logger.debug("Page %d processed with PyMuPDF", page_num)
+        if not regions:
+            return page_text, blocks
+        logger.debug("Page %d has %d image region(s) that need OCR", page_num, len(regions))
+        return PendingPage(page_text, blocks, [
+            self._ocr_job(page, page_num, clip, image_dpi) for clip, image_dpi in regions
+        ])
+
+    @staticmethod
+    def _ocr_job(page, page_num: int, clip: Optional[fitz.Rect], image_dpi: Optional[float]) -> OCRJob:
+        # Only whole-page renders count as pages, regions are part of a page already extracted
+        with metrics.span("render", pages=int(clip is None)) as stage:
+            image = ocr_render.render(page, clip, image_dpi)
+            stage.bytes = len(image.data)
+        return OCRJob(page_num, image.data, page.rect.width, page.rect.height, image.dpi, image.origin)
+
+    def _submit(self, pending: PendingPage) -> PendingPage:
+        """
+        Send a page's OCRJobs to the dispatcher, replacing them with their futures
+
+        Images already in the OCR cache get completed futures without a request.
+        """
+        ocr = get_ocr()
+        dispatcher = _get_ocr_dispatcher(ocr)
+        futures = []
+        for job in pending.ocr:
+            if not isinstance(job, OCRJob):
+                futures.append(job)
+                continue
+            cached = ocr.lookup(job)
+            if cached is None:
+                futures.append(dispatcher.submit(job))
+            else:
+                future = Future()
+                future.set_result(cached)
+                futures.append(future)
+        return pending._replace(ocr=futures)
+
+    @staticmethod
+    def _ready(result) -> bool:
+        return not isinstance(result, PendingPage) or all(future.done() for future in result.ocr)
+
+    @staticmethod
+    def _ocr_result(pending: PendingPage) -> tuple:
+        """
+        Wait for a page's dispatched OCR and merge it with its text layer into (display_text, blocks)
+        """
+        texts = []
+        blocks = list(pending.blocks)
+        # OCR requests run on the dispatcher's threads; this is the time the page's consumer waits for them
+        with metrics.span("ocr_wait", pages=1):
+            for future in pending.ocr:
+                ocr_result = future.result()
+                if ocr_result["text"]:
+                    texts.append(ocr_result["text"])
+                    blocks.extend(ocr_result["blocks"])
+        return pending.text + "\n\n".join(texts), blocks
+
+    def _process_page(self, page, page_num: int) -> tuple:
+        """
+        Process a single page using PyMuPDF, falling back to OCR for non-searchable content
+
+        Args:
+            page: fitz.Page object
+            page_num: Page number (0-based)
+
+        Returns:
+            Tuple of (display_text, blocks) where blocks contain text and bbox info
+        """
+        result = self._extract_page(page, page_num)
+        if isinstance(result, PendingPage):
+            return self._ocr_result(self._submit(result))
+        return result
+
+    def _resolve_in_order(self, items: Iterator[tuple]) -> Iterator[tuple]:
+        """
+        Turn (page_num, result) items into (page_num, display_text, blocks) in page order
+
+        A result is a finished (display_text, blocks) tuple or a PendingPage,
+        whose OCR may already be dispatched. OCR jobs are dispatched as soon
+        as they appear and extraction of later pages continues while they are in
+        flight, up to OCR_LOOKAHEAD pages ahead of the oldest unfinished page.
+        """
+        pending = deque()
+        try:
+            for page_num, result in items:
+                if isinstance(result, PendingPage):
+                    result = self._submit(result)
+                pending.append((page_num, result))
+
+                while pending and (len(pending) > OCR_LOOKAHEAD or self._ready(pending[0][1])):
+                    yield self._finish(*pending.popleft())
+
+            while pending:
+                yield self._finish(*pending.popleft())
+        finally:
+            # Drop queued OCR work if the consumer went away early
+            for _, result in pending:
+                if isinstance(result, PendingPage):
+                    for future in result.ocr:
+                        future.cancel()
+
+    def _finish(self, page_num: int, result) -> tuple:
+        if isinstance(result, PendingPage):
+            result = self._ocr_result(result)
+        page_text, page_blocks = result
+        return page_num, page_text, page_blocks
+
+    def _iter_pages_serial(self, doc, pages: Sequence[int]) -> Iterator[tuple]:
+        """
+        Extract the selected pages of an open document in this process
+        """
+        try:
+            for page_num in pages:
+                yield page_num, self._extract_page(doc[page_num], page_num)
+        finally:
+            doc.close()
+
+    def _dispatch_when_done(self, range_future: Future) -> Future:
+        """
+        Return a future for a worker's page range in which PendingPages have had
+        their OCRJobs dispatched, submitted the moment the range finishes
+        """
+        dispatched = Future()
+
+        def on_done(future: Future) -> None:
+            try:
+                results, snapshot = future.result()
+                metrics.registry.merge(snapshot)
+                dispatched.set_result([
+                    self._submit(result) if isinstance(result, PendingPage) else result
+                    for result in results
+                ])
+            except BaseException as e:
+                dispatched.set_exception(e)
+
+        range_future.add_done_callback(on_done)
+        return dispatched
+
+    def _iter_pages_parallel(self, pdf_path: str, pages: Sequence[int]) -> Iterator[tuple]:
+        """
+        Extract the document on the worker pool, one page range per task.
+
+        Each worker opens its own handle on the spooled file, so only the path
+        is sent to the pool. Only RANGE_WINDOW ranges per worker are in flight
+        at once, which bounds the rendered OCR images held in memory, and
+        results are collected in submission order, which keeps them in page order.
+        """
+        pool = _get_pool(self.workers)
+        ranges = iter(_page_ranges(pages, self.workers))
+        window = deque()
+
+        def submit_next() -> None:
+            page_range = next(ranges, None)
+            if page_range is not None:
+                range_future = pool.submit(_extract_page_range, pdf_path, page_range.start, page_range.stop)
+                window.append((page_range.start, range_future, self._dispatch_when_done(range_future)))
+
+        try:
+            for _ in range(self.workers * RANGE_WINDOW):
+                submit_next()
+            while window:
+                start, _, dispatched = window.popleft()
+                submit_next()
+                for offset, result in enumerate(dispatched.result()):
+                    yield start + offset, result
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM killed), start from a fresh pool next time
+            _reset_pool()
+            raise
+        finally:
+            # Stop queued ranges if the consumer went away early
+            for _, range_future, _ in window:
+                range_future.cancel()
+
+    def _use_parallel(self, page_count: int) -> bool:
+        return not self.serial and self.workers > 1 and page_count >= PARALLEL_MIN_PAGES
+
+    @staticmethod
+    def _splice(pages: range, reuse: dict, extracted: Iterator[tuple]) -> Iterator[tuple]:
+        """
+        Merge reused (display_text, blocks) results with the (page_num, result)
+        items of the pages that were extracted, in page order
+        """
+        try:
+            for page_num in pages:
+                if page_num in reuse:
+                    yield page_num, tuple(reuse[page_num])
+                else:
+                    yield next(extracted)
+        finally:
+            extracted.close()
+
+    def iter_pages(self, pdf_path: str, selection: Optional[PageSelection] = None,
+                   reuse: Optional[dict] = None) -> Tuple[int, Iterator[tuple]]:
+        """
+        Open a PDF and return its page count plus an iterator over processed pages
+
+        The document is opened eagerly so that invalid files fail here rather than
+        part way through the iteration.
+
+        Args:
+            pdf_path: Path to the PDF file
+            selection: Pages to process, defaults to the whole document
+            reuse: (display_text, blocks) of pages known not to have changed, by
+                page number; only the other pages are extracted
+
+        Returns:
+            Tuple of (page_count, iterator of (page_num, display_text, blocks) in page order)
+        """
+        with metrics.span("parse", bytes=os.path.getsize(pdf_path)) as stage:
+            doc = fitz.open(pdf_path, filetype="pdf")
+            page_count = stage.pages = len(doc)
+        pages = (selection or PageSelection()).resolve(page_count)
+        changed = [page_num for page_num in pages if page_num not in reuse] if reuse else pages
+
+        if not changed:
+            doc.close()
+            # A generator, so _splice can close it like the others
+            items = (item for item in ())
+        elif self._use_parallel(len(changed)):
+            doc.close()
+            items = self._iter_pages_parallel(pdf_path, changed)
         else:
-            print(f"Page {page_num} requires OCR, using Google Cloud Vision")
-            # Use Google Cloud Vision for non-searchable page
-            
-            # Get page dimensions
-            page_width = page.rect.width
-            page_height = page.rect.height
-            
-            # Render the page to an image
-            pix = page.get_pixmap(matrix=fitz.Matrix(300/72, 300/72))  # Render at 300 DPI
-            img_bytes = pix.tobytes(output="png")
-            
-            # Process with Google Vision
-            google_result = self.google_ai.get_text_with_bboxes(
-                img_bytes, page_num, page_width, page_height
-            )
-            
-            if google_result["text"]:
-                page_text = google_result["text"]
-                blocks.extend(google_result["blocks"])
+            items = self._iter_pages_serial(doc, changed)
+        if reuse:
+            items = self._splice(pages, reuse, items)
+        return page_count, self._resolve_in_order(items)
+
+    @staticmethod
+    def page_metadata(pdf_path: str, selection: Optional[PageSelection] = None) -> dict:
+        """
+        Describe the selected pages ahead of extraction, without any OCR
 
-        return page_text, blocks
+        A page is reported as having a text layer by the same check extraction
+        uses (see _has_text), so needs_ocr is true exactly for the pages that
+        extraction will send to OCR.
 
-    def extract_with_pymu(self, pdf_url: str) -> dict:
+        Args:
+            pdf_path: Path to the PDF file
+            selection: Pages to describe, defaults to the whole document
+
+        Returns:
+            Dictionary with page_count and, per selected page, its size, has_text and needs_ocr
         """
-        Extract text from PDF using PyMuPDF with fallback to Google Cloud Vision for non-searchable pages
+        with metrics.span("parse", bytes=os.path.getsize(pdf_path)) as stage:
+            doc = fitz.open(pdf_path, filetype="pdf")
+            stage.pages = len(doc)
+        try:
+            pages = []
+            for page_num in (selection or PageSelection()).resolve(len(doc)):
+                page = doc[page_num]
+                has_text = _has_text(page.get_text("blocks"))
+                pages.append({
+                    "page": page_num,
+                    "width": page.rect.width,
+                    "height": page.rect.height,
+                    "has_text": has_text,
+                    "needs_ocr": not has_text
+                })
+            return {"page_count": len(doc), "pages": pages}
+        finally:
+            doc.close()
+
+    @staticmethod
+    def _estimate(pdf_path: str, selection: Optional[PageSelection]) -> Tuple[int, float]:
+        """
+        Page count of a PDF and the share of the selected pages that need OCR,
+        from the text layer check (see _has_text) of up to OCR_SAMPLE_PAGES of them
+        """
+        with metrics.span("parse", bytes=os.path.getsize(pdf_path)) as stage:
+            doc = fitz.open(pdf_path, filetype="pdf")
+            stage.pages = len(doc)
+        try:
+            sample = _sample((selection or PageSelection()).resolve(len(doc)), OCR_SAMPLE_PAGES)
+            ocr_pages = sum(not _has_text(doc[page_num].get_text("blocks")) for page_num in sample)
+            return len(doc), ocr_pages / len(sample) if sample else 0.0
+        finally:
+            doc.close()
+
+    @staticmethod
+    def page_fingerprints(pdf_path: str, selection: Optional[PageSelection] = None) -> List[str]:
+        """
+        Fingerprints of the selected pages (see _page_fingerprint), which let
+        unchanged pages of a republished document be reused instead of extracted
+        """
+        doc = fitz.open(pdf_path, filetype="pdf")
+        try:
+            digests = {}
+            return [
+                _page_fingerprint(doc, doc[page_num], digests)
+                for page_num in (selection or PageSelection()).resolve(len(doc))
+            ]
+        finally:
+            doc.close()
+
+    @staticmethod
+    def _assemble(page_results: list) -> dict:
+        """
+        Combine per-page (display_text, blocks) tuples into the final result
+        """
+        text_parts = []
+        blocks = []
+        for page_num, (page_text, page_blocks) in enumerate(page_results):
+            text_parts.append(page_text)
+            blocks.extend(page_blocks)
+
+            # Add page separator if not the last page
+            if page_num < len(page_results) - 1:
+                text_parts.append(PAGE_SEPARATOR)
+
+        # Clean up the display text
+        text = "".join(text_parts).strip()
+        text = text.replace("\n\n\n", "\n\n")
+
+        return {
+            "text": text,  # Combined text for display
+            "blocks": blocks  # List of {text, page, bbox} for highlighting
+        }
+
+    def _extract_entry(self, pdf_path: str, selection: Optional[PageSelection] = None,
+                       reuse: Optional[dict] = None, fingerprints: bool = False) -> dict:
+        """
+        Process the selected pages of a PDF into a cache entry:
+        {"page_count", "start", "pages": [[display_text, blocks], ...]}, plus
+        the pages' "fingerprints" if asked for
+        """
+        page_count, pages = self.iter_pages(pdf_path, selection, reuse)
+        entry = {
+            "page_count": page_count,
+            "start": (selection or PageSelection()).resolve(page_count).start,
+            "pages": [[page_text, page_blocks] for _, page_text, page_blocks in pages]
+        }
+        if fingerprints:
+            entry["fingerprints"] = self.page_fingerprints(pdf_path, selection)
+        return entry
+
+    @staticmethod
+    def _entry_pages(entry: dict) -> Iterator[tuple]:
+        return (
+            (entry["start"] + offset, page_text, page_blocks)
+            for offset, (page_text, page_blocks) in enumerate(entry["pages"])
+        )
+
+    @staticmethod
+    def _selection_key(key: str, selection: Optional[PageSelection]) -> str:
+        if selection is None:
+            return key
+        return f"{key}:pages={selection.start}-{'' if selection.stop is None else selection.stop}"
+
+    def _cached_entry(self, key: str, selection: Optional[PageSelection]) -> Optional[dict]:
+        """
+        Find the selected pages in the cache, slicing them out of a cached full document if there is one
+        """
+        entry = extraction_cache.get(key)
+        if entry is not None:
+            if selection is None:
+                return entry
+            pages = selection.resolve(entry["page_count"])
+            sliced = {
+                "page_count": entry["page_count"],
+                "start": pages.start,
+                "pages": entry["pages"][pages.start:pages.stop]
+            }
+            if "fingerprints" in entry:
+                sliced["fingerprints"] = entry["fingerprints"][pages.start:pages.stop]
+            return sliced
+        if selection is not None:
+            return extraction_cache.get(self._selection_key(key, selection))
+        return None
+
+    async def extract_with_pymu(self, pdf_url: str, selection: Optional[PageSelection] = None) -> dict:
+        """
+        Extract text from PDF using PyMuPDF with fallback to OCR for non-searchable pages
+
+        Large documents are split into page ranges and processed on a pool of worker
+        processes; the output is identical to the serial path. The CPU-bound work
+        runs in a thread so the event loop stays free.
 
         Args:
             pdf_url: Direct url to the pdf
+            selection: Pages to extract, defaults to the whole document
 
         Returns:
             Dictionary containing text content and bounding box information
         """
         try:
-            response = self._check_url(pdf_url)
-            pdf_buffer = BytesIO(response.content)
-            doc = fitz.open(stream=pdf_buffer, filetype="pdf")
+            async with self._check_url(pdf_url) as response:
+                download = await self._spool(response)
+            with download:
+                entry = await asyncio.to_thread(self._extract_entry, download.path, selection)
+            return await asyncio.to_thread(self._assemble, entry["pages"])
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise _as_http_error(e) from e
 
-            result = {
-                "text": "",  # Combined text for display
-                "blocks": []  # List of {text, page, bbox} for highlighting
-            }
+    def _reusable_pages(self, pdf_url: str, key: str, pdf_path: str, selection: Optional[PageSelection]
+                        ) -> Tuple[Optional[List[str]], dict]:
+        """
+        Find the selected pages whose fingerprint matches a page of the
+        previous version of the URL, if that is still cached
 
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                page_text, page_blocks = self._process_page(page, page_num)
+        The selected pages are only fingerprinted when there is such a
+        previous version. Pages are matched by fingerprint rather than
+        position, so inserting or removing a page does not invalidate the ones after it.
 
-                # Add page text and blocks to result
-                result["text"] += page_text
-                result["blocks"].extend(page_blocks)
+        Returns:
+            Tuple of (fingerprints of the selected pages, or None if they were
+            not needed, [display_text, blocks] of the reusable pages by their
+            page number in the new version)
+        """
+        previous_key = extraction_cache.latest_key(pdf_url)
+        if previous_key is None or previous_key == key or not previous_key.endswith(f":{EXTRACTOR_VERSION}"):
+            return None, {}
+        previous = extraction_cache.get(previous_key)
+        if previous is None and selection is not None:
+            previous = extraction_cache.get(self._selection_key(previous_key, selection))
+        if previous is None or "fingerprints" not in previous:
+            return None, {}
 
-                # Add page separator if not the last page
-                if page_num < len(doc) - 1:
-                    result["text"] += "\n\n---\n\n"
+        known = {}
+        for offset, fingerprint in enumerate(previous["fingerprints"]):
+            known.setdefault(fingerprint, (previous["start"] + offset, previous["pages"][offset]))
 
-            # Clean up
-            doc.close()
-            pdf_buffer.close()
+        fingerprints = self.page_fingerprints(pdf_path, selection)
+        start = (selection or PageSelection()).start
+        reuse = {}
+        for page_num, fingerprint in enumerate(fingerprints, start):
+            match = known.get(fingerprint)
+            if match is None:
+                continue
+            previous_num, (page_text, page_blocks) = match
+            if previous_num != page_num:
+                page_blocks = [dict(block, page=page_num) for block in page_blocks]
+            reuse[page_num] = [page_text, page_blocks]
 
-            # Clean up the display text
-            result["text"] = result["text"].strip()
-            result["text"] = result["text"].replace("\n\n\n", "\n\n")
+        metrics.registry.inc("pages_reused_total", len(reuse))
+        logger.info("Reusing %d of %d pages from the previous version of %s", len(reuse), len(fingerprints), pdf_url)
+        return fingerprints, reuse
 
-            return result
+    async def _prepare(self, pdf_url: str, download: DownloadedPDF, key: str, selection: Optional[PageSelection]
+                       ) -> Tuple[Optional[List[str]], dict, admission.Ticket]:
+        """
+        Get ready to extract a download that is not cached
 
-        except fitz.FileDataError as e:
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid or corrupted PDF file"
-            ) from e
+        Finds the pages that did not change since the URL was last extracted,
+        and waits for the admission controller to make room for the rest.
+        Their cost is estimated from the file size and the share of the
+        selected pages that need OCR, judged from a sample of them, so the
+        work done before admission does not grow with the document.
+
+        Returns:
+            Tuple of (fingerprints of the selected pages if they were needed to
+            find reusable pages, else None; reusable pages by page number;
+            admission ticket)
+
+        Raises:
+            HTTPException: 429 when the server is too busy, 400 if the selection is past the last page
+        """
+        page_count, ocr_share = await asyncio.to_thread(self._estimate, download.path, selection)
+        fingerprints, reuse = await asyncio.to_thread(self._reusable_pages, pdf_url, key, download.path, selection)
+
+        changed = len((selection or PageSelection()).resolve(page_count)) - len(reuse)
+        cost = admission.estimate(
+            download.size, changed, round(changed * ocr_share),
+            OCR_LOOKAHEAD + self.workers * RANGE_WINDOW * MAX_RANGE_PAGES
+        )
+        ticket = await admission.admission.admit(cost, queue=not self.background)
+        return fingerprints, reuse, ticket
+
+    async def _extract_download(self, pdf_url: str, download: DownloadedPDF, key: str, validators: tuple,
+                                selection: Optional[PageSelection] = None) -> dict:
+        """
+        Extract the selected pages of a download that is not cached into the
+        extraction cache, and index the URL to it
+
+        Concurrent requests for the same pages are coalesced before admission:
+        only the first one takes admission budget, the others wait for its
+        result.
+        """
+        selection_key = self._selection_key(key, selection)
+        future, owner = extraction_cache.claim(selection_key)
+        if not owner:
+            entry = await asyncio.shield(asyncio.wrap_future(future))
+        else:
+            try:
+                # Another request may have finished it since this one looked
+                entry = await asyncio.to_thread(extraction_cache.get, selection_key)
+                if entry is None:
+                    fingerprints, reuse, ticket = await self._prepare(pdf_url, download, key, selection)
+                    with ticket:
+                        entry = await asyncio.to_thread(
+                            self._extract_entry, download.path, selection, reuse, fingerprints is None
+                        )
+                    if fingerprints is not None:
+                        entry["fingerprints"] = fingerprints
+                    await asyncio.to_thread(extraction_cache.put, selection_key, entry)
+                future.set_result(entry)
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            finally:
+                extraction_cache.release(selection_key)
+        extraction_cache.index_url(pdf_url, *validators, key)
+        return entry
+
+    async def _fetch(self, pdf_url: str, lookup: Callable[[str], Optional[Any]], wait: bool = True,
+                     revalidate: bool = True) -> Tuple[Optional[Any], Optional[DownloadedPDF], str, tuple]:
+        """
+        Find a cached value for a PDF, downloading it only when necessary
+
+        The version of the URL indexed last is revalidated with a conditional
+        request, and lookup(content_key) is tried with its key when the origin
+        answers 304, so a hit does not start a transfer. Otherwise lookup is
+        tried with the key the URL index has for the current ETag/Last-Modified,
+        which avoids reading the body, and then with the key of the downloaded
+        bytes. When another request is already downloading the same version of
+        the URL, this one waits for it to finish and looks again before downloading.
+
+        Returns:
+            Tuple of (cached value or None, spooled download if there was no cached
+            value, content key, (etag, last_modified))
+        """
+        latest = await asyncio.to_thread(extraction_cache.latest_version, pdf_url) if revalidate else None
+        headers = _conditional_headers(*latest[1:]) if latest is not None else {}
+
+        download = None
+        async with self._check_url(pdf_url, headers) as response:
+            if response.status_code == 304:
+                key, validators = latest[0], latest[1:]
+                value = await asyncio.to_thread(lookup, key)
+                if value is not None:
+                    extraction_cache.count("revalidated")
+                    return value, None, key, validators
+            else:
+                validators = (response.headers.get("ETag"), response.headers.get("Last-Modified"))
+                key = await asyncio.to_thread(extraction_cache.lookup_url, pdf_url, *validators)
+                if key is not None:
+                    value = await asyncio.to_thread(lookup, key)
+                    if value is not None:
+                        return value, None, key, validators
+
+                pending, owner = extraction_cache.claim_url(pdf_url, *validators)
+                if owner:
+                    try:
+                        download = await self._spool(response)
+                    except BaseException:
+                        extraction_cache.release_url(pdf_url, *validators)
+                        raise
+                    # Wakes the waiters once the caller is done with the download, by then it is cached and indexed
+                    download.on_close = functools.partial(extraction_cache.release_url, pdf_url, *validators)
+                elif not wait:
+                    download = await self._spool(response)
+
+        if response.status_code == 304:
+            # Current, but this value is not cached for it: fetch the body after all
+            return await self._fetch(pdf_url, lookup, wait, revalidate=False)
+        if download is None:
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(pending)), COALESCE_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.info("Gave up waiting for another download of %s after %gs", pdf_url, COALESCE_TIMEOUT)
+            return await self._fetch(pdf_url, lookup, wait=False)
+
+        key = ExtractionCache.content_key(download.sha256, EXTRACTOR_VERSION)
+        value = await asyncio.to_thread(lookup, key)
+        if value is not None:
+            extraction_cache.index_url(pdf_url, *validators, key)
+            download.close()
+            return value, None, key, validators
+        return None, download, key, validators
+
+    def _cache_pages(self, pdf_url: str, key: str, validators: tuple, pdf_path: str,
+                     selection: Optional[PageSelection], page_count: int, fingerprints: Optional[List[str]],
+                     pages: Iterator[tuple]) -> Iterator[tuple]:
+        """
+        Pass processed pages through, writing them to the extraction cache as
+        they go, so the server never holds the whole result; the entry is
+        stored and the URL indexed once the document is complete
+
+        Without fingerprints, the pages are fingerprinted after the last one,
+        so they do not hold up the first.
+        """
+        writer = extraction_cache.writer(self._selection_key(key, selection), {
+            "page_count": page_count,
+            "start": (selection or PageSelection()).resolve(page_count).start
+        })
+        try:
+            for page_num, page_text, page_blocks in pages:
+                writer.add([page_text, page_blocks])
+                yield page_num, page_text, page_blocks
+
+            if fingerprints is None:
+                fingerprints = self.page_fingerprints(pdf_path, selection)
+            # Before the PageStream closes the download, which lets requests waiting for it go on
+            writer.commit({"fingerprints": fingerprints})
+            extraction_cache.index_url(pdf_url, *validators, key)
+        except BaseException:
+            writer.discard()
+            raise
+        if selection is None:
+            _build_index_later(key)
+
+    async def stream_pages(self, pdf_url: str, selection: Optional[PageSelection] = None
+                           ) -> Tuple[int, PageStream]:
+        """
+        Download a PDF and return its page count plus a stream of processed pages,
+        so callers can forward each page as soon as it is ready
+
+        Documents already in the extraction cache are replayed from it. The
+        stream does blocking work and should be consumed off the event loop,
+        and it must be closed, see PageStream.
+
+        Args:
+            pdf_url: Direct url to the pdf
+            selection: Pages to process, defaults to the whole document
+
+        Returns:
+            Tuple of (page_count, PageStream)
+
+        Raises:
+            HTTPException: If the PDF cannot be downloaded or opened
+        """
+        download = ticket = None
+        try:
+            entry, download, key, validators = await self._fetch(
+                pdf_url, lambda k: self._cached_entry(k, selection)
+            )
+            if entry is not None:
+                return entry["page_count"], PageStream(self._entry_pages(entry))
+
+            # The same pages are being extracted for another request; replay its result instead of taking admission
+            pending = extraction_cache.inflight(self._selection_key(key, selection))
+            if pending is not None:
+                entry = await asyncio.shield(asyncio.wrap_future(pending))
+                download.close()
+                return entry["page_count"], PageStream(self._entry_pages(entry))
+
+            fingerprints, reuse, ticket = await self._prepare(pdf_url, download, key, selection)
+            page_count, pages = await asyncio.to_thread(self.iter_pages, download.path, selection, reuse)
+            pages = self._cache_pages(
+                pdf_url, key, validators, download.path, selection, page_count, fingerprints, pages
+            )
+            return page_count, PageStream(pages, (download.close, ticket.release))
+        except BaseException as e:
+            # On success the download and ticket are owned and released by the page stream
+            if download is not None:
+                download.close()
+            if ticket is not None:
+                ticket.release()
+            if isinstance(e, Exception) and not isinstance(e, HTTPException):
+                raise _as_http_error(e) from e
+            raise
+
+    async def extract(self, pdf_url: str, selection: Optional[PageSelection] = None) -> dict:
+        """
+        Top level extraction method that uses extract_with_pymu's pipeline behind the extraction cache
+
+        Results are keyed by the hash of the PDF bytes, and indexed by URL plus
+        ETag/Last-Modified so unchanged documents skip the download as well.
+        Concurrent requests for the same document share one extraction.
+
+        Args:
+            pdf_url: Direct url to the pdf
+            selection: Pages to extract, defaults to the whole document
+        """
+        try:
+            entry, download, key, validators = await self._fetch(
+                pdf_url, lambda k: self._cached_entry(k, selection)
+            )
+            if entry is None:
+                with download:
+                    entry = await self._extract_download(pdf_url, download, key, validators, selection)
+                if selection is None:
+                    _build_index_later(key, entry)
+            return await asyncio.to_thread(self._assemble, entry["pages"])
+        except HTTPException:
+            raise
         except Exception as e:
-            if isinstance(e, HTTPException):
-                raise e
-            raise HTTPException(
-                status_code=500,
-                detail=f"Internal server error while processing PDF: {str(e)}"
-            ) from e
+            raise _as_http_error(e) from e
+
+    async def search(self, pdf_url: str, query: str, limit: int = 20) -> dict:
+        """
+        Search a document's blocks through its inverted index (see search_index.search)
+
+        The index is built when a whole document is extracted and cached with
+        it; documents that were never extracted are extracted first. The
+        indexes of recently searched documents are also kept parsed in
+        memory, so repeated queries skip reading them from the cache.
+
+        Args:
+            pdf_url: Direct url to the pdf
+            query: Words to find, "quoted phrases" must appear in this order
+            limit: Maximum number of hits returned
+        """
+        def lookup(key: str) -> Optional[dict]:
+            index = _search_indexes.get(key)
+            if index is not None:
+                return index
+            index = extraction_cache.get(_index_key(key))
+            if index is None:
+                entry = extraction_cache.get(key)
+                index = _build_index(key, entry) if entry is not None else None
+            if index is not None:
+                _search_indexes.put(key, index, 1)
+            return index
+
+        try:
+            index, download, key, validators = await self._fetch(pdf_url, lookup)
+            if index is None:
+                with download:
+                    entry = await self._extract_download(pdf_url, download, key, validators)
+                index = await asyncio.to_thread(_build_index, key, entry)
+                _search_indexes.put(key, index, 1)
+            return search_index.search(index, query, limit)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise _as_http_error(e) from e
 
-    def extract(self, pdf_url: str) -> dict:
+    async def word_index(self, pdf_url: str, selection: Optional[PageSelection] = None) -> word_index.WordIndex:
         """
-        Top level extraction method that now uses extract_with_pymu
+        Character offset to word bbox index for the text /extract returns for the same selection
+
+        Built from the PDF on first use and cached with the document.
+
+        Args:
+            pdf_url: Direct url to the pdf
+            selection: Pages the offsets refer to, defaults to the whole document
         """
-        return self.extract_with_pymu(pdf_url)
\ No newline at end of file
+        def words_key(key: str) -> str:
+            return f"{self._selection_key(key, selection)}:words={word_index.INDEX_VERSION}"
+
+        def build(pdf_path: str, entry: dict) -> dict:
+            text = self._assemble(entry["pages"])["text"]
+            return word_index.build(pdf_path, text, entry["pages"], entry["start"]).to_cache()
+
+        try:
+            value, download, key, validators = await self._fetch(
+                pdf_url, lambda k: extraction_cache.get(words_key(k))
+            )
+            if value is None:
+                with download:
+                    entry = await asyncio.to_thread(self._cached_entry, key, selection)
+                    if entry is None:
+                        entry = await self._extract_download(pdf_url, download, key, validators, selection)
+                    value = await extraction_cache.get_or_compute_async(
+                        words_key(key), lambda: build(download.path, entry)
+                    )
+                    extraction_cache.index_url(pdf_url, *validators, key)
+            return word_index.WordIndex.from_cache(value)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise _as_http_error(e) from e
+
+    async def metadata(self, pdf_url: str, selection: Optional[PageSelection] = None) -> dict:
+        """
+        Page count of a PDF and the text layer / OCR status of the selected pages, without extracting them
+        """
+        def metadata_key(key: str) -> str:
+            return f"{self._selection_key(key, selection)}:metadata"
+
+        try:
+            value, download, key, validators = await self._fetch(
+                pdf_url, lambda k: extraction_cache.get(metadata_key(k))
+            )
+            if value is None:
+                with download:
+                    value = await extraction_cache.get_or_compute_async(
+                        metadata_key(key), lambda: self.page_metadata(download.path, selection)
+                    )
+                    extraction_cache.index_url(pdf_url, *validators, key)
+            return value
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise _as_http_error(e) from e
+
+
+metrics.registry.describe("pages_reused_total", "Pages of republished documents reused from their previous version instead of extracted")
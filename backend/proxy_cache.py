@@ -0,0 +1,322 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from contextlib import AsyncExitStack
+from typing import AsyncIterator, NamedTuple, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from fastapi.responses import Response, StreamingResponse
+
+import http_client
+from cache import DiskLRU
+
+load_dotenv()
+
+PROXY_CACHE_DIR = os.getenv("PROXY_CACHE_DIR", os.path.join(tempfile.gettempdir(), "pdf-proxy-cache"))
+PROXY_CACHE_BYTES = int(os.getenv("PROXY_CACHE_BYTES", 1024 * 1024 * 1024))
+# Seconds a cached PDF is served without asking the origin whether it changed
+PROXY_CACHE_TTL = int(os.getenv("PROXY_CACHE_TTL", "300"))
+CHUNK_SIZE = 64 * 1024
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class CachedPDF(NamedTuple):
+    path: str
+    size: int
+    etag: str  # upstream ETag, or a content hash when the origin sends none
+    last_modified: Optional[str]
+    fetched_at: float
+    upstream_etag: bool = True
+
+
+class ProxyCache:
+    """
+    Disk cache of proxied PDFs with the upstream validators needed to revalidate them
+
+    Bodies and their metadata are separate entries of one DiskLRU; an entry
+    missing either half is treated as a miss.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.store = DiskLRU(directory, max_bytes)
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0}
+
+    def get(self, url: str) -> Optional[CachedPDF]:
+        meta = self.store.get(f"meta:{url}")
+        path = self.store.get_path(f"body:{url}")
+        if meta is None or path is None:
+            return None
+        meta = json.loads(meta)
+        return CachedPDF(path, meta["size"], meta["etag"], meta["last_modified"], meta["fetched_at"],
+                         meta["upstream_etag"])
+
+    def put(self, url: str, tmp_path: str, entry: CachedPDF) -> None:
+        """
+        Move a fully downloaded temp_file() into the cache with the entry's metadata
+        """
+        self.store.put_file(f"body:{url}", tmp_path)
+        self._put_meta(url, entry)
+
+    def refresh(self, entry: CachedPDF, url: str) -> CachedPDF:
+        """
+        Record that the origin confirmed the cached copy is still current
+        """
+        entry = entry._replace(fetched_at=time.time())
+        self._put_meta(url, entry)
+        return entry
+
+    def _put_meta(self, url: str, entry: CachedPDF) -> None:
+        self.store.put(f"meta:{url}", json.dumps({
+            "size": entry.size,
+            "etag": entry.etag,
+            "last_modified": entry.last_modified,
+            "fetched_at": entry.fetched_at,
+            "upstream_etag": entry.upstream_etag
+        }).encode())
+
+
+proxy_cache = ProxyCache(PROXY_CACHE_DIR, PROXY_CACHE_BYTES)
+
+
+def _base_headers(etag: str, last_modified: Optional[str]) -> dict:
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Cache-Control": f"public, max-age={PROXY_CACHE_TTL}",
+        "Content-Disposition": "inline; filename=document.pdf",
+        "ETag": etag,
+    }
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+    return headers
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range "bytes=start-end" header into an inclusive (start, end) pair
+
+    Returns None when the whole file should be sent (no header, or a
+    multi-range request we choose not to support).
+
+    Raises:
+        HTTPException: 416 if the range cannot be satisfied
+    """
+    if not header:
+        return None
+    match = _RANGE_PATTERN.match(header.strip())
+    if match is None:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+
+async def _read_file(f, start: int, end: int) -> AsyncIterator[bytes]:
+    with f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def serve_cached(entry: CachedPDF, request_headers) -> Response:
+    """
+    Answer a request from a cached PDF, honouring If-None-Match and Range
+
+    The file is opened before returning, so the response stays valid even if
+    the entry is evicted or replaced while it is being sent.
+    """
+    headers = _base_headers(entry.etag, entry.last_modified)
+
+    if_none_match = request_headers.get("If-None-Match")
+    if if_none_match and entry.etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    byte_range = parse_range(request_headers.get("Range"), entry.size)
+    # If-Range: only honour the range if the client's copy is still current
+    if_range = request_headers.get("If-Range")
+    if byte_range is not None and if_range and if_range not in (entry.etag, entry.last_modified):
+        byte_range = None
+
+    if byte_range is None:
+        start, end, status = 0, entry.size - 1, 200
+    else:
+        (start, end), status = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{entry.size}"
+
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _read_file(open(entry.path, "rb"), start, end),
+        status_code=status,
+        media_type="application/pdf",
+        headers=headers
+    )
+
+
+def _entry_for(response: httpx.Response, path: str, digest) -> CachedPDF:
+    """
+    Describe a downloaded body, falling back to a content hash when the origin sends no ETag
+    """
+    upstream_etag = response.headers.get("ETag")
+    return CachedPDF(
+        path,
+        os.path.getsize(path),
+        upstream_etag or f'"{digest.hexdigest()[:32]}"',
+        response.headers.get("Last-Modified"),
+        time.time(),
+        upstream_etag is not None
+    )
+
+
+async def _download(response: httpx.Response) -> CachedPDF:
+    """
+    Spool an upstream body into a cache temp file
+    """
+    fd, tmp_path = proxy_cache.store.temp_file()
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return _entry_for(response, tmp_path, digest)
+
+
+async def _tee(url: str, stack, response: httpx.Response, fd: int, tmp_path: str) -> AsyncIterator[bytes]:
+    """
+    Relay upstream chunks to the client while writing them to the cache,
+    committing the copy only if the whole body arrived
+    """
+    digest = hashlib.sha256()
+    complete = False
+    try:
+        async with stack:
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    yield chunk
+            complete = True
+    finally:
+        if complete:
+            proxy_cache.put(url, tmp_path, _entry_for(response, tmp_path, digest))
+        else:
+            os.remove(tmp_path)
+
+
+def _conditional_headers(entry: Optional[CachedPDF]) -> dict:
+    """
+    Headers asking the origin to answer 304 if a cached copy is still current
+    """
+    headers = {}
+    if entry is not None:
+        if entry.upstream_etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+    return headers
+
+
+async def fetch(url: str) -> CachedPDF:
+    """
+    Return the cached copy of a PDF, revalidating or downloading it first when needed
+
+    For callers that read the file themselves (see page_render); the returned
+    path stays readable once opened, even if the entry is evicted later.
+
+    Raises:
+        httpx.HTTPError: If the origin cannot be reached or answers with an error
+    """
+    entry = proxy_cache.get(url)
+    if entry is not None and time.time() - entry.fetched_at < PROXY_CACHE_TTL:
+        proxy_cache.stats["hits"] += 1
+        return entry
+
+    async with http_client.stream(url, headers=_conditional_headers(entry)) as response:
+        if response.status_code == 304 and entry is not None:
+            proxy_cache.stats["revalidated"] += 1
+            return proxy_cache.refresh(entry, url)
+        response.raise_for_status()
+        proxy_cache.stats["misses"] += 1
+        downloaded = await _download(response)
+    proxy_cache.put(url, downloaded.path, downloaded)
+    return downloaded._replace(path=proxy_cache.store.path(f"body:{url}"))
+
+
+async def proxy(url: str, request_headers) -> Response:
+    """
+    Serve a PDF through the local cache
+
+    Fresh copies are served directly; stale ones are revalidated upstream
+    with If-None-Match/If-Modified-Since. Misses are streamed to the client
+    while being written to the cache, unless the client asked for a byte
+    range, in which case the file is cached first and the range served from it.
+    """
+    entry = proxy_cache.get(url)
+    if entry is not None and time.time() - entry.fetched_at < PROXY_CACHE_TTL:
+        proxy_cache.stats["hits"] += 1
+        return serve_cached(entry, request_headers)
+
+    stack = AsyncExitStack()
+    try:
+        response = await stack.enter_async_context(http_client.stream(url, headers=_conditional_headers(entry)))
+        if response.status_code == 304 and entry is not None:
+            await stack.aclose()
+            proxy_cache.stats["revalidated"] += 1
+            return serve_cached(proxy_cache.refresh(entry, url), request_headers)
+        response.raise_for_status()
+        proxy_cache.stats["misses"] += 1
+
+        if request_headers.get("Range"):
+            async with stack:
+                downloaded = await _download(response)
+            try:
+                return serve_cached(downloaded, request_headers)
+            finally:
+                proxy_cache.put(url, downloaded.path, downloaded)
+
+        fd, tmp_path = proxy_cache.store.temp_file()
+        headers = {
+            "Accept-Ranges": "bytes",
+            "Cache-Control": f"public, max-age={PROXY_CACHE_TTL}",
+            "Content-Disposition": "inline; filename=document.pdf",
+        }
+        for name in ("Content-Length", "ETag", "Last-Modified"):
+            if name in response.headers and not (name == "Content-Length" and "Content-Encoding" in response.headers):
+                headers[name] = response.headers[name]
+        return StreamingResponse(
+            _tee(url, stack, response, fd, tmp_path),
+            media_type="application/pdf",
+            headers=headers
+        )
+    except BaseException:
+        await stack.aclose()
+        raise
@@ -0,0 +1,172 @@
+import bisect
+import math
+import re
+from collections import defaultdict
+from typing import List, Tuple
+
+# Bump when the index layout changes
+INDEX_VERSION = 1
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+_TOKEN = re.compile(r"\w+")
+_PHRASE = re.compile(r'"([^"]*)"')
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.casefold())
+
+
+def build(pages: list) -> dict:
+    """
+    Build an inverted index over the blocks of an extracted document
+
+    Args:
+        pages: [[display_text, blocks], ...] as stored in an extraction cache entry;
+            blocks are numbered in that order, which is the order /extract returns them in
+
+    Returns:
+        JSON-serializable index of the form
+
+            {
+                "version": 1,
+                "blocks": {"page": [int], "bbox": [float], "length": [int]},
+                "average_length": float,
+                "sizes": {page: [width, height]},
+                "terms": {term: [[block, ...], [position, ...]]},
+                "df": {term: int}
+            }
+
+        where bbox is flat (four numbers per block), length is each block's
+        token count and every term's postings are sorted by block, then position.
+    """
+    block_pages, bboxes, lengths = [], [], []
+    sizes = {}
+    postings = defaultdict(lambda: ([], []))
+
+    for _, page_blocks in pages:
+        for block in page_blocks:
+            block_id = len(block_pages)
+            block_pages.append(block["page"])
+            bboxes.extend(block["bbox"])
+            sizes.setdefault(str(block["page"]), [block["width"], block["height"]])
+
+            tokens = tokenize(block["text"])
+            lengths.append(len(tokens))
+            for position, token in enumerate(tokens):
+                blocks, positions = postings[token]
+                blocks.append(block_id)
+                positions.append(position)
+
+    return {
+        "version": INDEX_VERSION,
+        "blocks": {"page": block_pages, "bbox": bboxes, "length": lengths},
+        "average_length": sum(lengths) / len(lengths) if lengths else 0.0,
+        "sizes": sizes,
+        "terms": {term: [blocks, positions] for term, (blocks, positions) in postings.items()},
+        "df": {term: len(set(blocks)) for term, (blocks, _) in postings.items()}
+    }
+
+
+def parse_query(query: str) -> Tuple[List[str], List[List[str]]]:
+    """
+    Split a query into single terms and "quoted phrases"
+
+    Returns:
+        Tuple of (terms, phrases) where each phrase is its list of tokens
+    """
+    terms, phrases = [], []
+    for match in _PHRASE.findall(query):
+        tokens = tokenize(match)
+        if len(tokens) > 1:
+            phrases.append(tokens)
+        else:
+            # A quoted single word is just a term
+            terms.extend(tokens)
+    terms.extend(tokenize(_PHRASE.sub(" ", query)))
+    return terms, phrases
+
+
+def _positions(index: dict, term: str, block: int) -> List[int]:
+    """
+    Positions of term within one block, found by binary search over the term's postings
+    """
+    blocks, positions = index["terms"][term]
+    lo = bisect.bisect_left(blocks, block)
+    hi = bisect.bisect_right(blocks, block, lo)
+    return positions[lo:hi]
+
+
+def _has_phrase(index: dict, phrase: List[str], block: int) -> bool:
+    following = [set(_positions(index, term, block)) for term in phrase[1:]]
+    return any(
+        all(start + offset + 1 in positions for offset, positions in enumerate(following))
+        for start in _positions(index, phrase[0], block)
+    )
+
+
+def search(index: dict, query: str, limit: int = 20) -> dict:
+    """
+    Find the blocks containing every term and phrase of a query, best matches first
+
+    Blocks are ranked by BM25 over the query's distinct tokens. Only the
+    postings of the rarest token are scanned; the others are looked up per
+    candidate block by binary search, so common words cost little.
+    Phrases must occur within a single block.
+
+    Returns:
+        Dictionary with total (number of matching blocks) and hits, each with
+        block (its index in the /extract blocks), page, bbox, width, height and score
+    """
+    terms, phrases = parse_query(query)
+    tokens = set(terms).union(*phrases)
+    if not tokens or any(token not in index["terms"] for token in tokens):
+        return {"total": 0, "hits": []}
+
+    # Candidates come from the token in the fewest blocks
+    ordered = sorted(tokens, key=lambda token: index["df"][token])
+    candidates = sorted(set(index["terms"][ordered[0]][0]))
+    for token in ordered[1:]:
+        blocks = index["terms"][token][0]
+        candidates = [
+            block for block in candidates
+            if (i := bisect.bisect_left(blocks, block)) < len(blocks) and blocks[i] == block
+        ]
+        if not candidates:
+            return {"total": 0, "hits": []}
+    candidates = [block for block in candidates if all(_has_phrase(index, phrase, block) for phrase in phrases)]
+
+    lengths = index["blocks"]["length"]
+    block_count = len(lengths)
+    average_length = index["average_length"]
+    idf = {
+        token: math.log(1 + (block_count - index["df"][token] + 0.5) / (index["df"][token] + 0.5))
+        for token in tokens
+    }
+
+    scored = []
+    for block in candidates:
+        norm = K1 * (1 - B + B * lengths[block] / average_length)
+        score = 0.0
+        for token in tokens:
+            frequency = len(_positions(index, token, block))
+            score += idf[token] * frequency * (K1 + 1) / (frequency + norm)
+        scored.append((score, block))
+    scored.sort(key=lambda item: (-item[0], item[1]))
+
+    pages = index["blocks"]["page"]
+    bboxes = index["blocks"]["bbox"]
+    hits = []
+    for score, block in scored[:limit]:
+        width, height = index["sizes"][str(pages[block])]
+        hits.append({
+            "block": block,
+            "page": pages[block],
+            "bbox": bboxes[block * 4:block * 4 + 4],
+            "width": width,
+            "height": height,
+            "score": round(score, 4)
+        })
+    return {"total": len(scored), "hits": hits}
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The backend modules are imported by name, as main.py does when uvicorn runs from the backend directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import http_client
+import pdfextractor
+from jobs import CANCELLED, FINISHED, Job, JobManager
+
+
+class SlowPDFHandler(BaseHTTPRequestHandler):
+    """
+    Sends a large body a little at a time, recording when the client starts reading and when it hangs up
+    """
+    started = threading.Event()
+    disconnected = threading.Event()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(1000 * 1000))
+        self.end_headers()
+        try:
+            for _ in range(1000):
+                self.wfile.write(b"%" * 1000)
+                self.wfile.flush()
+                self.started.set()
+                time.sleep(0.05)
+        except OSError:
+            self.disconnected.set()
+
+
+def test_cancel_interrupts_a_job_mid_download(monkeypatch, tmp_path):
+    monkeypatch.setattr(pdfextractor, "DOWNLOAD_DIR", str(tmp_path))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowPDFHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    async def scenario() -> tuple:
+        manager = JobManager(workers=1)
+        manager.start()
+        try:
+            job = manager.submit(f"http://127.0.0.1:{server.server_port}/slow.pdf")
+            assert await asyncio.to_thread(SlowPDFHandler.started.wait, 10)
+            assert job.stage == "downloading"
+
+            manager.cancel(job.id)
+            # The full body would take 50 seconds
+            deadline = time.monotonic() + 2
+            while job.status not in FINISHED and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            # Before stop(), which would cancel whatever is still running
+            return job, job.status
+        finally:
+            await manager.stop()
+            await http_client.close_client()
+
+    try:
+        job, status = asyncio.run(scenario())
+        assert status == CANCELLED
+        assert job.pages == []
+        assert SlowPDFHandler.disconnected.wait(5)
+        assert os.listdir(tmp_path) == []
+    finally:
+        server.shutdown()
+
+
+def test_collect_stops_before_the_next_page_once_cancelled():
+    job = Job("http://127.0.0.1/doc.pdf")
+    pulled = []
+
+    def pages():
+        for page_num in range(5):
+            pulled.append(page_num)
+            if page_num == 1:
+                # Cancelled while page 1 is being extracted
+                job.cancelled.set()
+            yield page_num, f"page {page_num}", []
+
+    JobManager._collect(job, pages())
+    assert [page["page"] for page in job.pages] == [0]
+    assert pulled == [0, 1]
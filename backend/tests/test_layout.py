@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+
+import pytest
+
+import layout
+from benchmarks.layout_grouping import golden_pages, reference_blocks, reference_in_points
+
+GOLDEN = golden_pages()
+
+
+def scaled(annotations: list, factor: float) -> list:
+    return [
+        SimpleNamespace(description=annotation.description, bounding_poly=SimpleNamespace(vertices=[
+            SimpleNamespace(x=vertex.x * factor, y=vertex.y * factor) for vertex in annotation.bounding_poly.vertices
+        ]))
+        for annotation in annotations
+    ]
+
+
+@pytest.mark.parametrize("page_num", range(len(GOLDEN)))
+def test_paragraph_blocks_match_the_reference_grouping(page_num):
+    annotations = GOLDEN[page_num]
+    expected = reference_in_points(annotations, page_num, 612.0, 792.0)
+    assert layout.paragraph_blocks(annotations, page_num, 612.0, 792.0, "google") == expected
+
+
+# Scale factors that are exact in binary, so words exactly at a threshold stay there
+@pytest.mark.parametrize("dpi", [75, 150, 600])
+def test_thresholds_and_boxes_scale_with_the_render_dpi(dpi):
+    # The same pages rendered at another DPI, and as an image region whose top-left corner is at (36, 120)
+    origin = (36.0, 120.0)
+    for page_num, annotations in enumerate(GOLDEN):
+        expected = reference_blocks(annotations, page_num, 612.0, 792.0)
+        actual = layout.paragraph_blocks(scaled(annotations, dpi / 300), page_num, 612.0, 792.0, "google",
+                                         dpi, origin)
+        assert [block["text"] for block in actual] == [block["text"] for block in expected]
+        for block, reference in zip(actual, expected):
+            x0, y0, x1, y1 = (coord * 72 / 300 for coord in reference["bbox"])
+            assert block["bbox"] == pytest.approx([x0 + origin[0], y0 + origin[1], x1 + origin[0], y1 + origin[1]])
@@ -0,0 +1,42 @@
+import threading
+import time
+
+from ocr_dispatcher import OCRDispatcher, OCRJob, RateLimiter
+
+RATE = 20
+
+
+def test_rate_limiter_charges_requests_larger_than_the_bucket_in_full():
+    limiter = RateLimiter(rate=RATE, burst=5)
+    start = time.monotonic()
+    # 5 of the 30 units are the initial burst, the other 25 take 1.25 seconds
+    for _ in range(3):
+        limiter.acquire(10)
+    assert time.monotonic() - start >= 25 / RATE * 0.95
+
+
+def test_dispatcher_keeps_images_within_the_rate_budget():
+    sent = []
+    lock = threading.Lock()
+
+    def recognize_batch(jobs):
+        with lock:
+            sent.append((time.monotonic(), len(jobs)))
+        return [{"text": "", "blocks": []} for _ in jobs]
+
+    dispatcher = OCRDispatcher(recognize_batch, batch_size=8, batch_wait=0.01)
+    # Batches larger than the bucket, as with OCR_RATE_LIMIT=2 and the default batch size
+    dispatcher.rate_limiter = RateLimiter(rate=RATE, burst=4)
+    start = time.monotonic()
+    futures = [dispatcher.submit(OCRJob(n, b"image", 100, 100)) for n in range(40)]
+    for future in futures:
+        future.result(timeout=30)
+
+    # After the initial burst every image waits its turn
+    assert sum(count for _, count in sent) == 40
+    total = 0
+    for sent_at, count in sorted(sent):
+        total += count
+        allowed = dispatcher.rate_limiter.capacity + RATE * (sent_at - start)
+        assert total <= allowed + 1, f"{total} images sent after {sent_at - start:.2f}s"
+    assert time.monotonic() - start >= (40 - dispatcher.rate_limiter.capacity) / RATE * 0.95
@@ -0,0 +1,327 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import fitz
+import orjson
+import pytest
+from fastapi import HTTPException
+
+import admission
+import google_ai
+import http_client
+import ocr_backends
+import pdfextractor
+from benchmarks import corpus, fake_vision
+from cache import ExtractionCache
+from pdfextractor import PageSelection, PDFExtractor, PendingPage
+
+
+def test_page_metadata_flags_pages_extraction_will_ocr(tmp_path):
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "Searchable text")
+    # A font that only draws whitespace still shows up in the page resources
+    doc.new_page().insert_text((72, 72), "   ")
+    doc.new_page()
+    path = tmp_path / "doc.pdf"
+    doc.save(path)
+    doc.close()
+
+    metadata = PDFExtractor.page_metadata(str(path))
+    assert [page["needs_ocr"] for page in metadata["pages"]] == [False, True, True]
+    with fitz.open(path) as doc:
+        assert doc[1].get_fonts()
+        for page, described in zip(doc, metadata["pages"]):
+            extracted = PDFExtractor(serial=True)._extract_page(page, page.number)
+            assert isinstance(extracted, PendingPage) == described["needs_ocr"]
+
+
+def test_resolve_rejects_selections_past_the_last_page():
+    assert PageSelection(5, 600).resolve(10) == range(5, 10)
+    assert PageSelection().resolve(0) == range(0, 0)
+    with pytest.raises(HTTPException) as error:
+        PageSelection(500, 601).resolve(90)
+    assert error.value.status_code == 400
+    with pytest.raises(HTTPException):
+        PageSelection(90).resolve(90)
+
+
+def test_parallel_extraction_matches_serial_byte_for_byte(monkeypatch, tmp_path):
+    vision = fake_vision.serve()
+    monkeypatch.setenv("GOOGLE_API_KEY", "fake")
+    monkeypatch.setenv("GOOGLE_VISION_ENDPOINT", f"http://127.0.0.1:{vision.server_port}")
+    monkeypatch.setenv("GOOGLE_VISION_TRANSPORT", "rest")
+    monkeypatch.setattr(google_ai, "_client", None)
+    # No OCR cache, so both runs send their pages to the fake service
+    monkeypatch.setattr(ocr_backends, "_ocr", ocr_backends.CachedOCR(
+        ocr_backends.GoogleOCRBackend(), ExtractionCache(memory_bytes=0, disk_dir=None, disk_bytes=0)
+    ))
+    monkeypatch.setattr(pdfextractor, "_ocr_dispatcher", None)
+    # Text pages, scanned pages and text pages with a figure, long enough for the pool
+    path = str(tmp_path / "mixed.pdf")
+    corpus.make_mixed(path, pdfextractor.PARALLEL_MIN_PAGES + 2)
+
+    def extract(extractor: PDFExtractor) -> bytes:
+        entry = extractor._extract_entry(path)
+        return orjson.dumps(extractor._assemble(entry["pages"]))
+
+    try:
+        parallel = PDFExtractor(workers=2, serial=False)
+        assert parallel._use_parallel(pdfextractor.PARALLEL_MIN_PAGES + 2)
+        serial = extract(PDFExtractor(serial=True))
+        assert extract(parallel) == serial
+        assert b'"method":"google"' in serial
+    finally:
+        pdfextractor._reset_pool()
+        vision.shutdown()
+
+
+class ETagPDFHandler(BaseHTTPRequestHandler):
+    """
+    Serves one PDF with an ETag, answering 304 to a matching If-None-Match, and records what it sent
+    """
+    body = b""
+    sent = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.sent.append(304)
+            self.send_response(304)
+            self.send_header("ETag", '"v1"')
+            self.end_headers()
+            return
+        self.sent.append(200)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.send_header("ETag", '"v1"')
+        self.end_headers()
+        self.wfile.write(self.body)
+
+
+def test_cached_documents_are_revalidated_without_a_transfer(monkeypatch, tmp_path):
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "Cached text")
+    ETagPDFHandler.body = doc.tobytes()
+    doc.close()
+    monkeypatch.setattr(pdfextractor, "extraction_cache", ExtractionCache(
+        memory_bytes=64 * 1024 * 1024, disk_dir=str(tmp_path / "cache"), disk_bytes=64 * 1024 * 1024
+    ))
+    monkeypatch.setattr(pdfextractor, "DOWNLOAD_DIR", str(tmp_path))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ETagPDFHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/doc.pdf"
+
+    async def scenario() -> list:
+        try:
+            extractor = PDFExtractor(serial=True)
+            results = [await extractor.extract(url)]
+            # Cache hits, and a lookup whose value is not cached for the current version yet
+            results.append(await extractor.extract(url))
+            results.append((await extractor.word_index(url)).to_lists())
+            return results
+        finally:
+            await http_client.close_client()
+
+    try:
+        first, second, words = asyncio.run(scenario())
+        assert first == second and first["text"] == "Cached text"
+        assert len(words["start"]) == 2
+        # The word index needed the body, so the 304 was followed by a full request
+        assert ETagPDFHandler.sent == [200, 304, 304, 200]
+        assert pdfextractor.extraction_cache.stats["revalidated"] == 1
+    finally:
+        server.shutdown()
+
+
+def test_unread_page_streams_release_the_download_and_admission(monkeypatch, tmp_path):
+    doc = fitz.open()
+    for n in range(3):
+        doc.new_page().insert_text((72, 72), f"Page {n}")
+    ETagPDFHandler.body = doc.tobytes()
+    ETagPDFHandler.sent = []
+    doc.close()
+    monkeypatch.setattr(pdfextractor, "extraction_cache", ExtractionCache(
+        memory_bytes=64 * 1024 * 1024, disk_dir=None, disk_bytes=0
+    ))
+    spool = tmp_path / "spool"
+    spool.mkdir()
+    monkeypatch.setattr(pdfextractor, "DOWNLOAD_DIR", str(spool))
+    controller = admission.AdmissionController()
+    monkeypatch.setattr(admission, "admission", controller)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ETagPDFHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/doc.pdf"
+
+    async def scenario() -> tuple:
+        try:
+            extractor = PDFExtractor(serial=True)
+            # The client goes away before the response reads the first page
+            _, pages = await extractor.stream_pages(url)
+            held = controller.get_stats()["running"], len(list(spool.iterdir()))
+            await asyncio.to_thread(pages.close)
+            released = controller.get_stats()["running"], len(list(spool.iterdir()))
+            # The next request for the URL does not wait for the abandoned one
+            _, pages = await asyncio.wait_for(extractor.stream_pages(url), 5)
+            with pages:
+                texts = [page_text for _, page_text, _ in pages]
+            return held, released, texts
+        finally:
+            await http_client.close_client()
+
+    try:
+        held, released, texts = asyncio.run(scenario())
+        assert held == (1, 1)
+        assert released == (0, 0)
+        assert texts == [f"Page {n}\n\n" for n in range(3)]
+    finally:
+        server.shutdown()
+
+
+def test_waiters_stop_waiting_for_a_stuck_download(monkeypatch, tmp_path):
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "Stuck")
+    ETagPDFHandler.body = doc.tobytes()
+    doc.close()
+    cache = ExtractionCache(memory_bytes=64 * 1024 * 1024, disk_dir=None, disk_bytes=0)
+    monkeypatch.setattr(pdfextractor, "extraction_cache", cache)
+    monkeypatch.setattr(pdfextractor, "DOWNLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(pdfextractor, "COALESCE_TIMEOUT", 0.2)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ETagPDFHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/doc.pdf"
+    # An owner that never releases its claim on this version of the URL
+    cache.claim_url(url, '"v1"', None)
+
+    async def scenario() -> dict:
+        try:
+            return await asyncio.wait_for(PDFExtractor(serial=True).extract(url), 5)
+        finally:
+            await http_client.close_client()
+
+    try:
+        assert asyncio.run(scenario())["text"] == "Stuck"
+    finally:
+        server.shutdown()
+
+
+def test_repeated_searches_reuse_the_parsed_index(monkeypatch, tmp_path):
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "Searchable words")
+    ETagPDFHandler.body = doc.tobytes()
+    doc.close()
+    cache = ExtractionCache(memory_bytes=64 * 1024 * 1024, disk_dir=None, disk_bytes=0)
+    monkeypatch.setattr(pdfextractor, "extraction_cache", cache)
+    monkeypatch.setattr(pdfextractor, "_search_indexes", pdfextractor.MemoryLRU(2))
+    monkeypatch.setattr(pdfextractor, "DOWNLOAD_DIR", str(tmp_path))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ETagPDFHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/doc.pdf"
+
+    async def scenario() -> list:
+        try:
+            extractor = PDFExtractor(serial=True)
+            results = [await extractor.search(url, "searchable")]
+            reads = cache.stats["memory_hits"]
+            results += [await extractor.search(url, query) for query in ("words", "searchable words")]
+            assert cache.stats["memory_hits"] == reads
+            return results
+        finally:
+            await http_client.close_client()
+
+    try:
+        results = asyncio.run(scenario())
+        assert [result["total"] for result in results] == [1, 1, 1]
+    finally:
+        server.shutdown()
+
+
+class RepublishedPDFHandler(BaseHTTPRequestHandler):
+    """
+    Serves whatever PDF is in body, without validators, so every request gets the current version
+    """
+    body = b""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+
+def _slides(*texts: str) -> bytes:
+    doc = fitz.open()
+    for text in texts:
+        doc.new_page().insert_text((72, 72), text)
+    try:
+        return doc.tobytes()
+    finally:
+        doc.close()
+
+
+def test_republished_documents_reuse_unchanged_pages_of_the_selection(monkeypatch, tmp_path):
+    monkeypatch.setattr(pdfextractor, "extraction_cache", ExtractionCache(
+        memory_bytes=64 * 1024 * 1024, disk_dir=None, disk_bytes=0
+    ))
+    monkeypatch.setattr(pdfextractor, "DOWNLOAD_DIR", str(tmp_path))
+    fingerprinted, reused = [], []
+    page_fingerprints = PDFExtractor.page_fingerprints
+    reusable_pages = PDFExtractor._reusable_pages
+
+    def spy_fingerprints(pdf_path, selection=None):
+        fingerprints = page_fingerprints(pdf_path, selection)
+        fingerprinted.append(len(fingerprints))
+        return fingerprints
+
+    def spy_reusable(self, *args):
+        fingerprints, reuse = reusable_pages(self, *args)
+        reused.append(sorted(reuse))
+        return fingerprints, reuse
+
+    monkeypatch.setattr(PDFExtractor, "page_fingerprints", staticmethod(spy_fingerprints))
+    monkeypatch.setattr(PDFExtractor, "_reusable_pages", spy_reusable)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RepublishedPDFHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/deck.pdf"
+
+    async def scenario() -> list:
+        try:
+            extractor = PDFExtractor(serial=True)
+            RepublishedPDFHandler.body = _slides("Alpha", "Beta", "Gamma")
+            results = [await extractor.extract(url)]
+            # A slide is inserted at the front, and only the last two are asked for
+            RepublishedPDFHandler.body = _slides("Intro", "Alpha", "Beta", "Gamma")
+            results.append(await extractor.extract(url, PageSelection(2, 4)))
+            return results
+        finally:
+            await http_client.close_client()
+
+    try:
+        first, second = asyncio.run(scenario())
+        assert [block["text"] for block in first["blocks"]] == ["Alpha", "Beta", "Gamma"]
+        assert [(block["page"], block["text"]) for block in second["blocks"]] == [(2, "Beta"), (3, "Gamma")]
+        # The first version had nothing to compare against, so it was fingerprinted
+        # after extraction; the second only for its two selected pages
+        assert fingerprinted == [3, 2]
+        assert reused == [[], [2, 3]]
+    finally:
+        server.shutdown()
+
+
+def test_page_metadata_describes_only_the_selection(tmp_path):
+    path = tmp_path / "slides.pdf"
+    path.write_bytes(_slides("One", "Two", "Three", "Four"))
+
+    metadata = PDFExtractor.page_metadata(str(path), PageSelection(1, 3))
+    assert metadata["page_count"] == 4
+    assert [page["page"] for page in metadata["pages"]] == [1, 2]
+    with pytest.raises(HTTPException) as error:
+        PDFExtractor.page_metadata(str(path), PageSelection(5, 6))
+    assert error.value.status_code == 400
@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+import fitz
+import pytest
+
+import layout
+import word_index
+from pdfextractor import PDFExtractor
+from word_index import WordIndex
+
+
+def test_slice_keeps_offsets_into_the_whole_text():
+    index = WordIndex()
+    for n in range(5):
+        index.add(n * 10, n * 10 + 4, n // 2, (n + 0.1, 1.0 / 3, n + 2.0, 5.0))
+
+    part = index.slice(3, 10)
+    assert len(part) == 2
+    assert part.start.tolist() == [30, 40]
+    assert part.page.tolist() == [1, 2]
+    assert part.to_lists()["bbox"] == [3.1, 0.33, 5.0, 5.0, 4.1, 0.33, 6.0, 5.0]
+    assert part.rects(30, 44) == index.rects(30, 44)
+
+
+def annotation(description, x0, y0, x1, y1):
+    vertices = [SimpleNamespace(x=x, y=y) for x, y in ((x0, y0), (x1, y0), (x1, y1), (x0, y1))]
+    return SimpleNamespace(description=description, bounding_poly=SimpleNamespace(vertices=vertices))
+
+
+def test_build_finds_ocr_paragraphs_that_span_several_lines(tmp_path):
+    doc = fitz.open()
+    doc.new_page()
+    path = tmp_path / "scan.pdf"
+    doc.save(path)
+    doc.close()
+
+    # Two lines 4 px apart form one paragraph; Vision's page text breaks the line where the image does
+    lines = [["The", "quick", "brown"], ["fox", "jumps", "over"]]
+    annotations = [
+        annotation(word, 100 + 60 * column, 100 + 34 * row, 150 + 60 * column, 130 + 34 * row)
+        for row, words in enumerate(lines) for column, word in enumerate(words)
+    ]
+    blocks = layout.paragraph_blocks(annotations, 0, 595, 842, "google")
+    assert [block["text"] for block in blocks] == ["The quick brown fox jumps over"]
+    pages = [["The quick brown\nfox jumps over\nThe end", blocks]]
+    text = PDFExtractor._assemble(pages)["text"]
+
+    index = word_index.build(str(path), text, pages, 0)
+    assert len(index) == 1
+    assert text[index.start[0]:index.end[0]] == "The quick brown\nfox jumps over"
+    rects = index.rects(text.index("fox"), text.index("over"))
+    assert rects == [{"page": 0, "bbox": pytest.approx(blocks[0]["bbox"])}]
@@ -0,0 +1,188 @@
+import base64
+import bisect
+import os
+import sys
+from array import array
+from typing import List, Optional
+
+import fitz
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Spans returned by one /words request, about 0.5 MB of JSON; larger indexes are fetched in several requests
+WORDS_PAGE_SIZE = int(os.getenv("WORDS_PAGE_SIZE", "10000"))
+
+# Bump when the spans built for the same text change
+INDEX_VERSION = 2
+
+# How far past the previous word the next one may start in the text; covers
+# the whitespace, block breaks and page separators between words
+MAX_GAP = 32
+
+
+class WordIndex:
+    """
+    Character spans of an extracted text with the page and bbox each one came from
+
+    Spans are stored in parallel typed arrays (start/end offsets and page as
+    unsigned ints, bboxes as four 32-bit floats per span), about 28 bytes per
+    word, and are sorted and non-overlapping so a character range is resolved
+    to its spans with two binary searches. Text-layer pages contribute one span
+    per word; OCR'd text, which only has paragraph boxes, one span per block.
+    """
+    __slots__ = ("start", "end", "page", "bbox")
+
+    def __init__(self, start: Optional[array] = None, end: Optional[array] = None,
+                 page: Optional[array] = None, bbox: Optional[array] = None):
+        self.start = start if start is not None else array("I")
+        self.end = end if end is not None else array("I")
+        self.page = page if page is not None else array("I")
+        self.bbox = bbox if bbox is not None else array("f")
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    def add(self, start: int, end: int, page: int, bbox) -> None:
+        self.start.append(start)
+        self.end.append(end)
+        self.page.append(page)
+        self.bbox.extend(bbox)
+
+    def spans(self, start: int, end: int) -> range:
+        """
+        Indexes of the spans overlapping the characters [start, end)
+        """
+        first = bisect.bisect_right(self.end, start)
+        last = bisect.bisect_left(self.start, end, first)
+        return range(first, last)
+
+    def rects(self, start: int, end: int) -> List[dict]:
+        """
+        Highlight rectangles for the characters [start, end): the boxes of the
+        spans they touch, merged into one rectangle per line
+
+        Returns:
+            List of {"page", "bbox"} in text order
+        """
+        rects = []
+        for i in self.spans(start, end):
+            page = self.page[i]
+            x0, y0, x1, y1 = self.bbox[i * 4:i * 4 + 4]
+            if rects and rects[-1]["page"] == page:
+                last = rects[-1]["bbox"]
+                # Same line when the boxes overlap vertically by more than half the shorter one
+                overlap = min(last[3], y1) - max(last[1], y0)
+                if overlap > 0.5 * min(last[3] - last[1], y1 - y0) and x0 >= last[0]:
+                    last[1], last[2], last[3] = min(last[1], y0), max(last[2], x1), max(last[3], y1)
+                    continue
+            rects.append({"page": page, "bbox": [x0, y0, x1, y1]})
+        return rects
+
+    def slice(self, offset: int, limit: int) -> "WordIndex":
+        """
+        The spans offset to offset + limit, with their offsets into the whole text
+        """
+        stop = offset + limit
+        return WordIndex(self.start[offset:stop], self.end[offset:stop], self.page[offset:stop],
+                         self.bbox[offset * 4:stop * 4])
+
+    def to_lists(self) -> dict:
+        return {
+            "start": self.start.tolist(),
+            "end": self.end.tolist(),
+            "page": self.page.tolist(),
+            # float32 printed in full takes 18 characters; a hundredth of a point is plenty for highlights
+            "bbox": [round(value, 2) for value in self.bbox]
+        }
+
+    def to_bytes(self) -> dict:
+        """
+        The arrays as little-endian bytes, for binary encodings
+        """
+        arrays = {"start": self.start, "end": self.end, "page": self.page, "bbox": self.bbox}
+        if sys.byteorder == "big":
+            arrays = {name: array(values.typecode, values) for name, values in arrays.items()}
+            for values in arrays.values():
+                values.byteswap()
+        return {name: values.tobytes() for name, values in arrays.items()}
+
+    def to_cache(self) -> dict:
+        """
+        JSON-serializable form kept in the extraction cache; base64 keeps it as small as the arrays
+        """
+        return {name: base64.b64encode(data).decode() for name, data in self.to_bytes().items()}
+
+    @classmethod
+    def from_cache(cls, value: dict) -> "WordIndex":
+        arrays = []
+        for name, typecode in (("start", "I"), ("end", "I"), ("page", "I"), ("bbox", "f")):
+            values = array(typecode)
+            values.frombytes(base64.b64decode(value[name]))
+            if sys.byteorder == "big":
+                values.byteswap()
+            arrays.append(values)
+        return cls(*arrays)
+
+
+def build(pdf_path: str, text: str, pages: list, start: int) -> WordIndex:
+    """
+    Map the characters of an assembled extraction text back to the words they came from
+
+    Words of text-layer blocks are read with PyMuPDF and located in the text in
+    reading order, which is the order the blocks were joined in, so cleanup of the
+    assembled text does not throw the offsets off. Blocks from OCR get one span,
+    from their first word to their last: their text is the paragraph's words
+    joined by spaces, while the page text is the OCR service's own, with a line
+    break wherever a line ended, so the words are located one by one. Words that
+    cannot be found near the previous one are left out.
+
+    Args:
+        pdf_path: Path to the PDF the pages were extracted from
+        text: The "text" of PDFExtractor._assemble for these pages
+        pages: [[display_text, blocks], ...] as stored in an extraction cache entry
+        start: Page number of the first entry in pages
+    """
+    index = WordIndex()
+    # Bound methods, this loop runs once per word of the document
+    find = text.find
+    add_start, add_end, add_page, add_bbox = (
+        index.start.append, index.end.append, index.page.append, index.bbox.extend
+    )
+    cursor = 0
+
+    def spans(page_num: int, words) -> None:
+        nonlocal cursor
+        for x0, y0, x1, y1, word in words:
+            position = find(word, cursor, cursor + MAX_GAP + len(word))
+            if position >= 0:
+                cursor = position + len(word)
+                add_start(position)
+                add_end(cursor)
+                add_page(page_num)
+                add_bbox((x0, y0, x1, y1))
+
+    def paragraph_spans(page_num: int, blocks) -> None:
+        nonlocal cursor
+        for block in blocks:
+            first = None
+            for word in block["text"].split():
+                position = find(word, cursor, cursor + MAX_GAP + len(word))
+                if position >= 0:
+                    first = position if first is None else first
+                    cursor = position + len(word)
+            if first is not None:
+                add_start(first)
+                add_end(cursor)
+                add_page(page_num)
+                add_bbox(block["bbox"])
+
+    doc = fitz.open(pdf_path, filetype="pdf")
+    try:
+        for page_num, (_, blocks) in enumerate(pages, start):
+            if any(block["method"] == "pymupdf" for block in blocks):
+                spans(page_num, (word[:5] for word in doc[page_num].get_text("words")))
+            paragraph_spans(page_num, (block for block in blocks if block["method"] != "pymupdf"))
+    finally:
+        doc.close()
+    return index
@@ -2,7 +2,7 @@
 
 import React, { useState } from 'react';
 import dynamic from 'next/dynamic';
-import { extractPdfText } from '@/services/api';
+import { extractPdfTextJob } from '@/services/api';
 
 const PDFViewer = dynamic(
   () => import('@/components/PDFViewer'),
@@ -29,16 +29,15 @@ export default function Home() {
   const handleSubmit = async () => {
     try {
       setIsLoading(true);
-      const data = await extractPdfText(inputUrl);
-      
-      // Sort blocks by page and vertical position
-      const sortedBlocks = [...data.blocks].sort((a, b) => {
-        if (a.page !== b.page) return a.page - b.page;
-        return a.bbox[1] - b.bbox[1];
-      });
-      
-      setTextBlocks(sortedBlocks);
+      setTextBlocks([]);
       setProcessedUrl(inputUrl);
+
+      // Show each page as soon as the backend's extraction job has processed it
+      await extractPdfTextJob(inputUrl, (pageRecord) => {
+        // Sort blocks by vertical position, pages already arrive in order
+        const sortedBlocks = [...pageRecord.blocks].sort((a, b) => a.bbox[1] - b.bbox[1]);
+        setTextBlocks((prev) => [...prev, ...sortedBlocks]);
+      });
     } catch (error) {
       console.error('Error:', error);
     } finally {
@@ -61,7 +60,7 @@ export default function Home() {
     // For Google OCR blocks, check for significant vertical gap
     if (currentBlock.method === 'google') {
       const verticalGap = currentBlock.bbox[1] - previousBlock.bbox[3];
-      return verticalGap > 20; // Adjust this threshold as needed
+      return verticalGap > 5; // In PDF points, roughly 20px of a 300 DPI render
     }
     
     return false;
@@ -1,18 +1,296 @@
-export const extractPdfText = async (url: string) => {
-    try {
-      // URL needs to be encoded since it's part of the path
-      const encodedUrl = encodeURIComponent(url);
-      const response = await fetch(`https://youlearn.azurewebsites.net/extract/${encodedUrl}`, {
-        method: 'GET',
-      });
-      
-      if (!response.ok) {
-        throw new Error('Network response was not ok');
-      }
-      
-      return await response.json();
-    } catch (error) {
-      console.error('Fetch error:', error);
-      throw error;
-    }
-  };
+export interface TextBlock {
+  text: string;
+  page: number;
+  bbox: number[];
+  width: number;
+  height: number;
+  method: string;
+}
+
+// Columnar /extract response (format=compact): page sizes and method names are
+// stored once and referenced by index, bboxes are packed four numbers per block
+export interface CompactResult {
+  version: number;
+  text: string;
+  methods: string[];
+  pages: { page: number[]; width: number[]; height: number[] };
+  blocks: { text: string[]; page: number[]; method: number[]; bbox: number[] };
+}
+
+export const decodeCompact = (compact: CompactResult): { text: string; blocks: TextBlock[] } => {
+  const { pages, blocks, methods } = compact;
+  const decoded: TextBlock[] = new Array(blocks.text.length);
+  for (let i = 0; i < blocks.text.length; i++) {
+    const pageIndex = blocks.page[i];
+    decoded[i] = {
+      text: blocks.text[i],
+      page: pages.page[pageIndex],
+      bbox: blocks.bbox.slice(i * 4, i * 4 + 4),
+      width: pages.width[pageIndex],
+      height: pages.height[pageIndex],
+      method: methods[blocks.method[i]],
+    };
+  }
+  return { text: compact.text, blocks: decoded };
+};
+
+export const extractPdfText = async (url: string, pages?: string) => {
+    try {
+      // URL needs to be encoded since it's part of the path
+      const encodedUrl = encodeURIComponent(url);
+      // Columnar response, much smaller than the block-per-object JSON for long documents
+      const params = new URLSearchParams({ format: 'compact' });
+      // Optional 0-based inclusive page range such as "10-40"
+      if (pages) params.set('pages', pages);
+      const response = await fetch(`https://youlearn.azurewebsites.net/extract/${encodedUrl}?${params}`, {
+        method: 'GET',
+      });
+      
+      if (!response.ok) {
+        throw new Error('Network response was not ok');
+      }
+      
+      return decodeCompact(await response.json());
+    } catch (error) {
+      console.error('Fetch error:', error);
+      throw error;
+    }
+  };
+
+export interface PageRecord {
+  type: 'page';
+  page: number;
+  text: string;
+  blocks: TextBlock[];
+}
+
+export interface SummaryRecord {
+  type: 'summary';
+  page_count: number;
+  block_count: number;
+  separator: string;
+}
+
+export const streamPdfText = async (url: string, onPage: (page: PageRecord) => void) => {
+    // Pages arrive as NDJSON lines as soon as the backend has processed them
+    const encodedUrl = encodeURIComponent(url);
+    const response = await fetch(`https://youlearn.azurewebsites.net/extract-stream/${encodedUrl}`, {
+      method: 'GET',
+    });
+
+    if (!response.ok || !response.body) {
+      throw new Error('Network response was not ok');
+    }
+
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = '';
+    let summary: SummaryRecord | null = null;
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += value;
+
+      let newline;
+      while ((newline = buffer.indexOf('\n')) >= 0) {
+        const line = buffer.slice(0, newline);
+        buffer = buffer.slice(newline + 1);
+        if (!line) continue;
+
+        const record = JSON.parse(line);
+        if (record.type === 'page') {
+          onPage(record);
+        } else if (record.type === 'summary') {
+          summary = record;
+        } else if (record.type === 'error') {
+          throw new Error(record.detail);
+        }
+      }
+    }
+
+    return summary;
+  };
+
+export interface JobStatus {
+  id: string;
+  status: 'queued' | 'running' | 'done' | 'failed' | 'cancelled';
+  stage: string;
+  page_count: number | null;
+  pages_total: number | null;
+  pages_done: number;
+  error: { status_code: number; detail: string } | null;
+}
+
+export const extractPdfTextJob = async (
+  url: string,
+  onPage: (page: PageRecord) => void,
+  onProgress?: (job: JobStatus) => void,
+  pollInterval = 1000,
+) => {
+    // Runs as a background job so long documents are not cut off by request timeouts
+    const response = await fetch('https://youlearn.azurewebsites.net/jobs', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ url }),
+    });
+    if (!response.ok) {
+      throw new Error('Network response was not ok');
+    }
+
+    let job: JobStatus = await response.json();
+    let cursor = 0;
+    while (true) {
+      const pagesResponse = await fetch(`https://youlearn.azurewebsites.net/jobs/${job.id}/pages?cursor=${cursor}`);
+      if (!pagesResponse.ok) {
+        throw new Error('Network response was not ok');
+      }
+      const { status, pages, next_cursor, pages_done } = await pagesResponse.json();
+      pages.forEach((page: Omit<PageRecord, 'type'>) => onPage({ type: 'page', ...page }));
+      cursor = next_cursor;
+
+      // More pages are already waiting, fetch them straight away
+      if (cursor < pages_done) continue;
+      if (status === 'done' || status === 'failed' || status === 'cancelled') break;
+
+      await new Promise((resolve) => setTimeout(resolve, pollInterval));
+      const statusResponse = await fetch(`https://youlearn.azurewebsites.net/jobs/${job.id}`);
+      if (statusResponse.ok) {
+        job = await statusResponse.json();
+        onProgress?.(job);
+      }
+    }
+
+    const finalResponse = await fetch(`https://youlearn.azurewebsites.net/jobs/${job.id}`);
+    job = await finalResponse.json();
+    onProgress?.(job);
+    if (job.status === 'failed') {
+      throw new Error(job.error?.detail ?? 'Extraction failed');
+    }
+    return job;
+  };
+
+export interface SearchHit {
+  block: number;
+  page: number;
+  bbox: number[];
+  width: number;
+  height: number;
+  score: number;
+}
+
+export const searchPdf = async (url: string, query: string, limit = 20): Promise<{ total: number; hits: SearchHit[] }> => {
+    // Ranked matches from the backend's index, instead of searching the whole document client-side
+    const encodedUrl = encodeURIComponent(url);
+    const params = new URLSearchParams({ q: query, limit: String(limit) });
+    const response = await fetch(`https://youlearn.azurewebsites.net/search/${encodedUrl}?${params}`, {
+      method: 'GET',
+    });
+
+    if (!response.ok) {
+      throw new Error('Network response was not ok');
+    }
+
+    return await response.json();
+  };
+
+// Word spans of the /extract text: span i covers text.slice(start[i], end[i]) and
+// sits on page[i] at bbox.slice(i * 4, i * 4 + 4), in PDF points
+export interface WordIndex {
+  start: number[];
+  end: number[];
+  page: number[];
+  bbox: number[];
+}
+
+export const getWordIndex = async (url: string, pages?: string): Promise<WordIndex> => {
+    const encodedUrl = encodeURIComponent(url);
+    const index: WordIndex = { start: [], end: [], page: [], bbox: [] };
+    // The server pages the spans; offsets in every page refer to the whole text
+    let offset: number | null = 0;
+    while (offset !== null) {
+      const params = new URLSearchParams({ offset: String(offset) });
+      // Must match the pages passed to extractPdfText for the offsets to line up
+      if (pages) params.set('pages', pages);
+      const response = await fetch(`https://youlearn.azurewebsites.net/words/${encodedUrl}?${params}`, {
+        method: 'GET',
+      });
+
+      if (!response.ok) {
+        throw new Error('Network response was not ok');
+      }
+
+      const chunk = await response.json();
+      index.start.push(...chunk.start);
+      index.end.push(...chunk.end);
+      index.page.push(...chunk.page);
+      index.bbox.push(...chunk.bbox);
+      offset = chunk.next_offset;
+    }
+    return index;
+  };
+
+// First index in a sorted array whose value is greater than (or, with orEqual, at least) target
+const bisect = (values: number[], target: number, orEqual: boolean) => {
+  let lo = 0;
+  let hi = values.length;
+  while (lo < hi) {
+    const mid = (lo + hi) >> 1;
+    if (orEqual ? values[mid] < target : values[mid] <= target) lo = mid + 1;
+    else hi = mid;
+  }
+  return lo;
+};
+
+// Highlight rectangles for the characters [start, end) of the text, one per line
+export const selectionRects = (index: WordIndex, start: number, end: number) => {
+  const first = bisect(index.end, start, false);
+  const last = bisect(index.start, end, true);
+  const rects: { page: number; bbox: number[] }[] = [];
+  for (let i = first; i < last; i++) {
+    const [x0, y0, x1, y1] = index.bbox.slice(i * 4, i * 4 + 4);
+    const previous = rects[rects.length - 1];
+    if (previous && previous.page === index.page[i]) {
+      const box = previous.bbox;
+      // Same line when the boxes overlap vertically by more than half the shorter one
+      const overlap = Math.min(box[3], y1) - Math.max(box[1], y0);
+      if (overlap > 0.5 * Math.min(box[3] - box[1], y1 - y0) && x0 >= box[0]) {
+        previous.bbox = [box[0], Math.min(box[1], y0), Math.max(box[2], x1), Math.max(box[3], y1)];
+        continue;
+      }
+    }
+    rects.push({ page: index.page[i], bbox: [x0, y0, x1, y1] });
+  }
+  return rects;
+};
+
+export interface PageMetadata {
+  page: number;
+  width: number;
+  height: number;
+  has_text: boolean;
+  needs_ocr: boolean;
+}
+
+export const getPdfMetadata = async (url: string): Promise<{ page_count: number; pages: PageMetadata[] }> => {
+    // Cheap call that returns the page count without extracting anything
+    const encodedUrl = encodeURIComponent(url);
+    const response = await fetch(`https://youlearn.azurewebsites.net/metadata/${encodedUrl}`, {
+      method: 'GET',
+    });
+
+    if (!response.ok) {
+      throw new Error('Network response was not ok');
+    }
+
+    return await response.json();
+  };
+
+// Image of one server-rendered page (0-based); use as an <img> src so the browser's cache revalidates it by ETag
+export const renderPageUrl = (url: string, page: number, options: { scale?: number; thumbnail?: boolean; format?: 'jpeg' | 'png' | 'webp' } = {}) => {
+    const encodedUrl = encodeURIComponent(url);
+    const params = new URLSearchParams({ page: String(page) });
+    if (options.scale !== undefined) params.set('scale', String(options.scale));
+    if (options.thumbnail) params.set('thumbnail', 'true');
+    if (options.format) params.set('format', options.format);
+    return `https://youlearn.azurewebsites.net/render/${encodedUrl}?${params}`;
+  };